@@ -1,36 +1,48 @@
 
-from flask import Flask, request, redirect, render_template, jsonify, url_for, abort, send_file, flash
+from flask import Blueprint, Flask, Response, current_app, make_response, request, redirect, render_template, jsonify, url_for, abort, flash, send_file
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Time, cast, Integer
-from sqlalchemy.orm import joinedload
+from sqlalchemy import Time
+from sqlalchemy.orm import contains_eager, selectinload
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-import qrcode
-import io
 import os
-import pytz
-from dotenv import load_dotenv
-from supabase_upload import upload_qr_to_supabase
+import shutil
+import threading
+from qr_codes import cached_qr_png, render_qr_png, qr_cache_key, iter_qr_pngs
+from qr_storage import qr_storage_from_env
+from qr_bundle import iter_pdf, iter_sheets, iter_zip
 import sqlalchemy as sa
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
 import unicodedata
+import base64
+import gzip
+import hashlib
+import hmac
+import click
+from functools import partial, wraps
+import json
+import queue
+import uuid
 import re
-from werkzeug.utils import secure_filename
-from io import BytesIO
-from PIL import Image, ImageDraw, ImageFont
-from openpyxl.utils import get_column_letter
-import math
-
-# Flask a SQLAlchemy setup
-app = Flask(__name__)
-db_url = os.getenv("SQLALCHEMY_DATABASE_URI")
-if not db_url:
-    raise RuntimeError("Chybí proměnná SQLALCHEMY_DATABASE_URI")
-app.config["SQLALCHEMY_DATABASE_URI"] = db_url
-db = SQLAlchemy(app)
-app.secret_key = os.environ.get("FLASK_SECRET_KEY")
+import itertools
+from collections import Counter
+from scoring import (
+    MISSING_SCAN_PENALTY, penalty_matrix, times_to_seconds, timestamps_to_seconds,
+    score_race, format_seconds
+)
+from live_events import EventHub, format_sse
+from response_cache import ResponseCache, RESPONSE_CACHE_MAX_ITEM
+from results_export import EXPORT_FORMATS, iter_csv, stream_file, write_parquet, write_xlsx
+from scan_writer import ScanWriter
+from recalculation import CoalescingRunner
+from field_sync import CentralServer, LogShipper
+from jobs import JOB_HEARTBEAT, JobRunner
+from crew_import import IMPORT_BATCH_SIZE, detect_format, iter_crews, iter_file_rows, iter_url_rows
+from metrics import instrument, registry
+
+# Aplikace se vytváří až v create_app(), import modulu nesahá na databázi
+db = SQLAlchemy()
+bp = Blueprint("main", __name__, cli_group=None)
 
 def get_czech_time():
     return datetime.now(ZoneInfo("Europe/Prague"))
@@ -41,9 +53,16 @@ class Race(db.Model):
     name = db.Column(db.String(100))
     start_time = db.Column(db.DateTime)
     crew_interval = db.Column(db.Integer)  # v minutách
+    version = db.Column(db.String(32), default=lambda: uuid.uuid4().hex)  # Mění se při každé změně závodu (ETag, cache stránek)
+    roster_version = db.Column(db.String(32), default=lambda: uuid.uuid4().hex)  # Mění se jen se změnou posádek nebo checkpointů (manifest skeneru)
+    crew_count = db.Column(db.Integer, default=0)  # Počitadla pro skenovací stanoviště, udržují se průběžně
+    active_crew_count = db.Column(db.Integer, default=0)
 
-    crews = db.relationship('Crew', backref='race', lazy=True)
-    checkpoints = db.relationship('Checkpoint', backref='race', lazy=True)
+    # Vztahy se nenačítají líně (lazy="raise") – data se načtou explicitně
+    # v dotazu, jinak by každý řádek šablony znamenal další SQL dotaz
+    crews = db.relationship('Crew', backref=db.backref('race', lazy='raise'), lazy='raise')
+    checkpoints = db.relationship('Checkpoint', backref=db.backref('race', lazy='raise'), lazy='raise',
+                                  order_by='Checkpoint.order')
 
 class Crew(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -52,25 +71,64 @@ class Crew(db.Model):
     vehicle = db.Column(db.String(100))
     race_id = db.Column(db.Integer, db.ForeignKey('race.id'), nullable=False)
     is_active = db.Column(db.Boolean, default=True)
-    qr_code_url = db.Column(db.String(500))
+    qr_code_url = db.Column(db.String(500))  # Nepoužívá se, QR kód se generuje na /crew/<id>/qr.png
     category = db.Column(db.String(50), nullable=True)  # Třída závodu
     vehicle_year = db.Column(db.String(50), nullable=True)  # Rok výroby
     penalty_year = db.Column(db.String(50), default=0)  # Trestné body za rok výroby
+    start_number = db.Column(db.Integer, nullable=True)  # Číselná podoba `number` pro řazení, udržuje se automaticky
+
+    __table_args__ = (
+        db.Index("ix_crew_race_start_number", "race_id", "start_number"),
+        db.Index("ix_crew_race_number", "race_id", "number", unique=True),
+    )
+
+def parse_start_number(number):
+    number = str(number or "").strip()
+    return int(number) if number.isdigit() else None
+
+@sa.event.listens_for(Crew.number, "set")
+def sync_start_number(target, value, oldvalue, initiator):
+    target.start_number = parse_start_number(value)
 
 class Checkpoint(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
     order = db.Column(db.Integer)
     race_id = db.Column(db.Integer, db.ForeignKey('race.id'), nullable=False)
+    passed_count = db.Column(db.Integer, default=0)  # Posádky s průchodem tímto checkpointem
+    passed_active_count = db.Column(db.Integer, default=0)  # Z nich aktivní posádky
 
 class ScanRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     crew_id = db.Column(db.Integer, db.ForeignKey('crew.id'), nullable=False)
     checkpoint_id = db.Column(db.Integer, db.ForeignKey('checkpoint.id'), nullable=False)
     timestamp = db.Column(db.DateTime(timezone=True), default=get_czech_time)
+    client_id = db.Column(db.String(36), nullable=True)  # UUID ze skeneru, zajišťuje idempotenci
+
+    crew = db.relationship('Crew', backref=db.backref('scans', lazy='raise', passive_deletes=True), lazy='raise')
+    checkpoint = db.relationship('Checkpoint', backref=db.backref('scans', lazy='raise', passive_deletes=True), lazy='raise')
+
+    __table_args__ = (
+        db.Index("ix_scan_record_client_id", "client_id", unique=True),
+        db.Index("ix_scan_record_time", "timestamp", "id"),  # Historie průchodů od nejnovějších
+        db.Index("ix_scan_record_checkpoint_crew_time", "checkpoint_id", "crew_id", "timestamp"),
+        db.Index("ix_scan_record_crew", "crew_id"),
+    )
+
+class Passage(db.Model):
+    # První průchod posádky checkpointem – jediný řádek na buňku, z něj se
+    # počítají body, počitadla i tabulky. ScanRecord zůstává jako záznam skenů.
+    id = db.Column(db.Integer, primary_key=True)
+    crew_id = db.Column(db.Integer, db.ForeignKey('crew.id'), nullable=False)
+    checkpoint_id = db.Column(db.Integer, db.ForeignKey('checkpoint.id'), nullable=False)
+    timestamp = db.Column(db.DateTime(timezone=True), nullable=False)
+    last_seen = db.Column(db.DateTime(timezone=True), nullable=False)  # Poslední přijatý sken buňky (debounce)
+    corrected = db.Column(db.Boolean, default=False, nullable=False)  # Čas opravený ručně, skeny ho nemění
 
-    crew = db.relationship('Crew', backref='scans')
-    checkpoint = db.relationship('Checkpoint', backref='scans')
+    __table_args__ = (
+        db.Index("ix_passage_crew_checkpoint", "crew_id", "checkpoint_id", unique=True),
+        db.Index("ix_passage_checkpoint", "checkpoint_id"),
+    )
 
 class IdealTime(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -78,11 +136,184 @@ class IdealTime(db.Model):
     checkpoint_id = db.Column(db.Integer, db.ForeignKey('checkpoint.id'), nullable=False)
     ideal_time = db.Column(Time)
 
-    crew = db.relationship('Crew', backref='ideal_times')
-    checkpoint = db.relationship('Checkpoint', backref='ideal_times')
+    crew = db.relationship('Crew', backref=db.backref('ideal_times', lazy='raise', passive_deletes=True), lazy='raise')
+    checkpoint = db.relationship('Checkpoint', backref=db.backref('ideal_times', lazy='raise', passive_deletes=True), lazy='raise')
 
-with app.app_context():
-    db.create_all()
+    __table_args__ = (
+        db.Index("ix_ideal_time_crew_checkpoint", "crew_id", "checkpoint_id", unique=True),
+        db.Index("ix_ideal_time_checkpoint", "checkpoint_id"),
+    )
+
+class Penalty(db.Model):
+    # Předpočítané trestné body jedné buňky posádka × checkpoint; řádek existuje
+    # jen pokud je ideální i skutečný čas, jinak platí MISSING_SCAN_PENALTY
+    id = db.Column(db.Integer, primary_key=True)
+    crew_id = db.Column(db.Integer, db.ForeignKey('crew.id'), nullable=False)
+    checkpoint_id = db.Column(db.Integer, db.ForeignKey('checkpoint.id'), nullable=False)
+    penalty = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_penalty_crew_checkpoint", "crew_id", "checkpoint_id", unique=True),
+    )
+
+class Standing(db.Model):
+    # Předpočítaný součet trestných bodů posádky
+    crew_id = db.Column(db.Integer, db.ForeignKey('crew.id'), primary_key=True)
+    race_id = db.Column(db.Integer, db.ForeignKey('race.id'), nullable=False, index=True)
+    checkpoint_penalty = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+class RaceEvent(db.Model):
+    # Změny závodu pro živé SSE stránky; zapisují se ve stejné transakci jako změna
+    id = db.Column(db.Integer, primary_key=True)
+    race_id = db.Column(db.Integer, nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), default=get_czech_time)
+
+class ScanLog(db.Model):
+    # Append-only log přijatých průchodů terénního uzlu; seq je pořadové číslo
+    # pro odesílání na centrálu. Bez cizích klíčů – záznam se nikdy nemění ani nemaže.
+    seq = db.Column(db.Integer, primary_key=True)
+    client_id = db.Column(db.String(36), nullable=False)
+    crew_id = db.Column(db.Integer, nullable=False)
+    checkpoint_id = db.Column(db.Integer, nullable=False)
+    timestamp = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_scan_log_client_id", "client_id", unique=True),
+        {"sqlite_autoincrement": True},  # seq se nikdy znovu nepoužije
+    )
+
+class SyncCursor(db.Model):
+    # Do jakého seq je log terénního uzlu sloučený na centrále (na centrále
+    # i v uzlu samotném, kde slouží jen pro přehled)
+    node_id = db.Column(db.String(64), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), default=get_czech_time, onupdate=get_czech_time)
+
+class Job(db.Model):
+    # Úloha na pozadí (import, export, QR kódy); soubory úlohy jsou v job_dir(id)
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    race_id = db.Column(db.Integer, nullable=True, index=True)
+    params = db.Column(db.String(1000), nullable=False, default="{}")  # JSON, podle něj se shodné úlohy slučují
+    status = db.Column(db.String(10), nullable=False, default="queued")  # queued, running, done, failed
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)  # None = počet předem neznámý (import)
+    message = db.Column(db.Text, nullable=True)
+    result_name = db.Column(db.String(200), nullable=True)  # Název souboru s výsledkem ke stažení
+    result_type = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), default=get_czech_time)
+    updated_at = db.Column(db.DateTime(timezone=True), default=get_czech_time)
+
+    __table_args__ = (
+        db.Index("ix_job_kind_params", "kind", "params"),
+    )
+
+# Sloupce přidané po prvním nasazení – db.create_all() je do existujících tabulek nepřidá
+SCHEMA_UPGRADES = [
+    ("crew", "qr_code_url", "VARCHAR(500)"),
+    ("crew", "category", "VARCHAR(50)"),
+    ("crew", "vehicle_year", "VARCHAR(50)"),
+    ("crew", "penalty_year", "VARCHAR(50) DEFAULT '0'"),
+    ("scan_record", "client_id", "VARCHAR(36)"),
+    ("crew", "start_number", "INTEGER"),
+    ("race", "version", "VARCHAR(32)"),
+    ("race", "roster_version", "VARCHAR(32)"),
+    ("race", "crew_count", "INTEGER DEFAULT 0"),
+    ("race", "active_crew_count", "INTEGER DEFAULT 0"),
+    ("checkpoint", "passed_count", "INTEGER DEFAULT 0"),
+    ("checkpoint", "passed_active_count", "INTEGER DEFAULT 0"),
+]
+
+# Sloupce, po jejichž přidání se počitadla musí spočítat z existujících dat
+COUNTER_COLUMNS = {("race", "crew_count"), ("checkpoint", "passed_count")}
+
+def upgrade_schema():
+    inspector = sa.inspect(db.engine)
+    added = set()
+    for table, column, ddl in SCHEMA_UPGRADES:
+        existing = {c["name"] for c in inspector.get_columns(table)}
+        if column not in existing:
+            with db.engine.begin() as conn:
+                conn.execute(sa.text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            added.add((table, column))
+
+    # Doplnění číselného startovního čísla u starých posádek
+    missing = db.session.query(Crew.id, Crew.number).filter(Crew.start_number.is_(None)).all()
+    updates = [
+        {"id": crew_id, "start_number": parse_start_number(number)}
+        for crew_id, number in missing if parse_start_number(number) is not None
+    ]
+    if updates:
+        db.session.execute(sa.update(Crew), updates)
+
+    for race in Race.query.filter(Race.version.is_(None)):
+        race.version = uuid.uuid4().hex
+    for race in Race.query.filter(Race.roster_version.is_(None)):
+        race.roster_version = uuid.uuid4().hex
+
+    renumber_duplicate_crews()
+
+    # Před vytvořením unikátního indexu odstraníme duplicitní ideální časy
+    keep = sa.select(sa.func.min(IdealTime.id)).group_by(IdealTime.crew_id, IdealTime.checkpoint_id)
+    db.session.execute(
+        sa.delete(IdealTime).where(IdealTime.id.not_in(keep)),
+        execution_options={"synchronize_session": False}
+    )
+    db.session.commit()
+
+    # Indexy definované v modelech, které v existující databázi ještě nejsou
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+    # První průchody pro skeny z doby před tabulkou Passage
+    if db.session.query(Passage.id).first() is None and db.session.query(ScanRecord.id).first() is not None:
+        fill_missing_passages()
+        db.session.commit()
+
+    # Předpočítané trestné body pro závody z doby před jejich zavedením
+    race_ids = {
+        race_id for (race_id,) in db.session.query(Crew.race_id)
+        .outerjoin(Standing, Standing.crew_id == Crew.id)
+        .filter(Standing.crew_id.is_(None)).distinct()
+    }
+    for race_id in race_ids:
+        rebuild_race_penalties(race_id)
+    db.session.commit()
+
+    if added & COUNTER_COLUMNS:
+        for (race_id,) in db.session.query(Race.id):
+            recount_race_counters(race_id)
+        db.session.commit()
+
+def renumber_duplicate_crews():
+    """Před vytvořením unikátního indexu přečísluje posádky se stejným číslem v závodě.
+
+    Posádky mohou mít průchody, proto se nemažou ani neslučují: první
+    (nejnižší id) si číslo ponechá, ostatní dostanou číslo s příponou
+    a vypíšou se, aby je pořadatel opravil. Necommituje.
+    """
+    duplicates = db.session.query(Crew.race_id, Crew.number).group_by(Crew.race_id, Crew.number)\
+        .having(sa.func.count(Crew.id) > 1).all()
+    for race_id, number in duplicates:
+        taken = {n for (n,) in db.session.query(Crew.number).filter(Crew.race_id == race_id)}
+        crews = Crew.query.filter_by(race_id=race_id, number=number).order_by(Crew.id).all()
+        suffix = 1
+        for crew in crews[1:]:
+            while f"{number}-{suffix}" in taken:
+                suffix += 1
+            new_number = f"{number}-{suffix}"
+            if len(new_number) > Crew.number.type.length:
+                new_number = f"#{crew.id}"
+            taken.add(new_number)
+            crew.number = new_number
+            print(f"Závod {race_id}: posádka {crew.id} ({crew.name}) měla opakované číslo {number}, "
+                  f"přečíslována na {new_number}")
+    if duplicates:
+        db.session.flush()
 
 def safe_int(val):
     try:
@@ -92,120 +323,528 @@ def safe_int(val):
     except (ValueError, TypeError):
         return 0
 
-def generate_qr_with_center_text(data: str, center_text: str) -> io.BytesIO:
-
-    # Vytvoření QR kódu
-    qr = qrcode.QRCode(
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
+def refresh_penalties(pairs):
+    """Přepočítá předpočítané trestné body jen pro dané buňky (crew_id, checkpoint_id)
+    a součty dotčených posádek. Necommituje, běží v transakci volajícího."""
+    pairs = set(pairs)
+    if not pairs:
+        return
+    crew_ids = {crew_id for crew_id, _ in pairs}
+    checkpoint_ids = {checkpoint_id for _, checkpoint_id in pairs}
+
+    ideal = {
+        (crew_id, checkpoint_id): ideal_time
+        for crew_id, checkpoint_id, ideal_time in db.session.query(
+            IdealTime.crew_id, IdealTime.checkpoint_id, IdealTime.ideal_time
+        ).filter(IdealTime.crew_id.in_(crew_ids), IdealTime.checkpoint_id.in_(checkpoint_ids))
+    }
+    first_scan = {
+        (crew_id, checkpoint_id): timestamp
+        for crew_id, checkpoint_id, timestamp in db.session.query(
+            Passage.crew_id, Passage.checkpoint_id, Passage.timestamp
+        ).filter(Passage.crew_id.in_(crew_ids), Passage.checkpoint_id.in_(checkpoint_ids))
+    }
+    existing = {
+        (p.crew_id, p.checkpoint_id): p
+        for p in Penalty.query.filter(Penalty.crew_id.in_(crew_ids), Penalty.checkpoint_id.in_(checkpoint_ids))
+    }
+
+    # Body se počítají stejným výpočtem jako celý závod, jen nad dotčenými buňkami
+    scored = [pair for pair in pairs if pair in ideal and pair in first_scan]
+    penalties = dict(zip(scored, penalty_matrix(
+        times_to_seconds([ideal[pair] for pair in scored]),
+        timestamps_to_seconds([first_scan[pair] for pair in scored])
+    ).tolist()))
+
+    new_cells = []
+    for pair in pairs:
+        cell = existing.get(pair)
+        if pair in penalties:
+            penalty = penalties[pair]
+            if cell is None:
+                new_cells.append({"crew_id": pair[0], "checkpoint_id": pair[1], "penalty": penalty})
+            elif cell.penalty != penalty:
+                cell.penalty = penalty
+        elif cell is not None:
+            db.session.delete(cell)
+
+    db.session.flush()
+    if new_cells:
+        # Nové buňky jedním hromadným INSERTem (velké dávky z terénních uzlů)
+        db.session.execute(sa.insert(Penalty), new_cells)
+    refresh_standings(crew_ids)
+
+def refresh_standings(crew_ids):
+    # Součet = body z buněk + MISSING_SCAN_PENALTY za každý checkpoint bez buňky + body za rok výroby
+    crew_ids = set(crew_ids)
+    if not crew_ids:
+        return
+    crews = Crew.query.filter(Crew.id.in_(crew_ids)).all()
+    checkpoint_counts = dict(
+        db.session.query(Checkpoint.race_id, sa.func.count(Checkpoint.id))
+        .filter(Checkpoint.race_id.in_({c.race_id for c in crews}))
+        .group_by(Checkpoint.race_id).all()
     )
-    qr.add_data(data)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-
-    draw = ImageDraw.Draw(qr_img)
-    width, height = qr_img.size
-
-    # Bílý čtverec ve středu – cca 20 % velikosti QR obrázku
-    box_size = int(width * 0.25)
-    top_left = ((width - box_size) // 2, (height - box_size) // 2)
-    bottom_right = ((width + box_size) // 2, (height + box_size) // 2)
-    draw.rectangle([top_left, bottom_right], fill="white")
-
-    # Dynamické přizpůsobení velikosti písma
-    box_width = bottom_right[0] - top_left[0]
-    box_height = bottom_right[1] - top_left[1]
-    max_font_size = box_height  # Začneme největší možnou velikostí
-    font = None
-
-    for size in range(max_font_size, 0, -1):
-        try:
-            candidate_font = ImageFont.truetype("DejaVuSans.ttf", size=size)
-        except IOError:
-            candidate_font = ImageFont.load_default()
-        
-        text_bbox = draw.textbbox((0, 0), center_text, font=candidate_font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
+    sums = {
+        crew_id: (total or 0, count)
+        for crew_id, total, count in db.session.query(
+            Penalty.crew_id, sa.func.sum(Penalty.penalty), sa.func.count(Penalty.id)
+        ).filter(Penalty.crew_id.in_(crew_ids)).group_by(Penalty.crew_id)
+    }
+    standings = {s.crew_id: s for s in Standing.query.filter(Standing.crew_id.in_(crew_ids))}
 
-        if text_width <= box_width and text_height <= box_height:
-            font = candidate_font
-            break
+    for crew in crews:
+        scored, count = sums.get(crew.id, (0, 0))
+        missing = checkpoint_counts.get(crew.race_id, 0) - count
+        checkpoint_penalty = scored + missing * MISSING_SCAN_PENALTY
+        standing = standings.get(crew.id)
+        if standing is None:
+            standing = Standing(crew_id=crew.id, race_id=crew.race_id)
+            db.session.add(standing)
+        standing.checkpoint_penalty = checkpoint_penalty
+        standing.total = checkpoint_penalty + safe_int(crew.penalty_year)
+
+def load_race_scores(crews, checkpoints):
+    """Načte ideální časy a první průchody závodu do matic a spočítá body."""
+    crew_ids = [c.id for c in crews]
+    checkpoint_ids = [ck.id for ck in checkpoints]
+
+    ideal_rows = db.session.query(
+        IdealTime.crew_id, IdealTime.checkpoint_id, IdealTime.ideal_time
+    ).filter(IdealTime.crew_id.in_(crew_ids), IdealTime.checkpoint_id.in_(checkpoint_ids)).all()
+    scan_rows = db.session.query(
+        Passage.crew_id, Passage.checkpoint_id, Passage.timestamp
+    ).filter(Passage.crew_id.in_(crew_ids), Passage.checkpoint_id.in_(checkpoint_ids)).all()
+
+    def columns(rows, to_seconds):
+        crew_col, checkpoint_col, values = zip(*rows) if rows else ((), (), ())
+        return list(crew_col), list(checkpoint_col), to_seconds(list(values))
+
+    return score_race(
+        crew_ids,
+        checkpoint_ids,
+        columns(ideal_rows, times_to_seconds),
+        columns(scan_rows, timestamps_to_seconds),
+        [safe_int(c.penalty_year) for c in crews]
+    )
 
-    if font is None:
-        font = ImageFont.load_default()
-        print("⚠️ Nepodařilo se najít vhodnou velikost písma, použit fallback font.")
+def rebuild_race_penalties(race_id):
+    crew_ids = [crew_id for (crew_id,) in db.session.query(Crew.id).filter_by(race_id=race_id)]
+    checkpoint_ids = [ck_id for (ck_id,) in db.session.query(Checkpoint.id).filter_by(race_id=race_id)]
+    if checkpoint_ids:
+        refresh_penalties((crew_id, ck_id) for crew_id in crew_ids for ck_id in checkpoint_ids)
     else:
-        print(font)
-    # Zarovnání textu doprostřed bílého rámečku
-    text_bbox = draw.textbbox((0, 0), center_text, font=font)
-    text_width = text_bbox[2] - text_bbox[0]
-    text_height = text_bbox[3] - text_bbox[1]
-    text_x = top_left[0] + (box_width - text_width) // 2
-    text_y = top_left[1] + (box_height - text_height) // 2
-    draw.text((text_x, text_y), center_text, font=font, fill="black")
+        refresh_standings(crew_ids)
+
+def fill_missing_passages(race_id=None):
+    """Založí první průchody buňkám, které mají skeny, ale ještě nemají Passage.
+
+    Pro migraci a syntetická data; běžné skeny je zakládají při ukládání.
+    Necommituje.
+    """
+    query = sa.select(
+        ScanRecord.crew_id, ScanRecord.checkpoint_id,
+        sa.func.min(ScanRecord.timestamp), sa.func.max(ScanRecord.timestamp), sa.false()
+    ).outerjoin(Passage, sa.and_(
+        Passage.crew_id == ScanRecord.crew_id, Passage.checkpoint_id == ScanRecord.checkpoint_id
+    )).where(Passage.id.is_(None))
+    if race_id is not None:
+        query = query.join(Checkpoint, Checkpoint.id == ScanRecord.checkpoint_id).where(Checkpoint.race_id == race_id)
+    db.session.execute(sa.insert(Passage).from_select(
+        ["crew_id", "checkpoint_id", "timestamp", "last_seen", "corrected"],
+        query.group_by(ScanRecord.crew_id, ScanRecord.checkpoint_id)
+    ))
+
+# Počitadla průchodů pro skenovací stanoviště. Mění se atomickým UPDATE
+# (sloupec = sloupec + n), takže souběžné skeny se navzájem nepřepisují.
+def count_first_passages(cells, delta=1):
+    """Započítá nové (delta=-1 smazané) první průchody buněk (crew_id, checkpoint_id). Necommituje."""
+    cells = set(cells)
+    if not cells:
+        return
+    active = {
+        crew_id for (crew_id,) in db.session.query(Crew.id)
+        .filter(Crew.id.in_({crew_id for crew_id, _ in cells}), Crew.is_active.is_(True))
+    }
+    passed, passed_active = Counter(), Counter()
+    for crew_id, checkpoint_id in cells:
+        passed[checkpoint_id] += delta
+        passed_active[checkpoint_id] += delta if crew_id in active else 0
+    for checkpoint_id, count in passed.items():
+        db.session.execute(
+            sa.update(Checkpoint).where(Checkpoint.id == checkpoint_id).values(
+                passed_count=Checkpoint.passed_count + count,
+                passed_active_count=Checkpoint.passed_active_count + passed_active[checkpoint_id]
+            ),
+            execution_options={"synchronize_session": False}
+        )
+
+def count_crews(race_id, total, active):
+    # Posun počtu posádek závodu (nová, smazaná nebo (de)aktivovaná posádka)
+    db.session.execute(
+        sa.update(Race).where(Race.id == race_id).values(
+            crew_count=Race.crew_count + total,
+            active_crew_count=Race.active_crew_count + active
+        ),
+        execution_options={"synchronize_session": False}
+    )
 
-    # Výstup jako PNG do paměti
-    buffer = io.BytesIO()
-    qr_img.save(buffer, format="PNG")
-    buffer.seek(0)
-    return buffer
+def count_crew_passages(crew_ids, passed, passed_active):
+    # Posun počitadel checkpointů, kterými posádky už prošly, o passed
+    # (passed_active) za každý jejich průchod – jeden UPDATE pro celou skupinu
+    crew_ids = set(crew_ids)
+    if not crew_ids:
+        return
+    of_crews = Passage.crew_id.in_(crew_ids)
+    passages = sa.select(sa.func.count(Passage.id))\
+        .where(of_crews, Passage.checkpoint_id == Checkpoint.id).scalar_subquery()
+    db.session.execute(
+        sa.update(Checkpoint).where(Checkpoint.id.in_(sa.select(Passage.checkpoint_id).where(of_crews))).values(
+            passed_count=Checkpoint.passed_count + passages * passed,
+            passed_active_count=Checkpoint.passed_active_count + passages * passed_active
+        ),
+        execution_options={"synchronize_session": False}
+    )
+
+def count_crew_activation(crew):
+    # Volá se po změně crew.is_active
+    delta = 1 if crew.is_active else -1
+    count_crews(crew.race_id, 0, delta)
+    count_crew_passages([crew.id], 0, delta)
+
+def recount_race_counters(race_id):
+    """Spočítá počitadla závodu znovu z posádek a průchodů (migrace, opravy)."""
+    is_active = Crew.is_active.is_(True)
+    crew_count, active_count = db.session.query(
+        sa.func.count(Crew.id), sa.func.count(Crew.id).filter(is_active)
+    ).filter(Crew.race_id == race_id).one()
+    db.session.execute(
+        sa.update(Race).where(Race.id == race_id).values(crew_count=crew_count, active_crew_count=active_count),
+        execution_options={"synchronize_session": False}
+    )
+
+    passed = {
+        checkpoint_id: (count, active)
+        for checkpoint_id, count, active in db.session.query(
+            Passage.checkpoint_id,
+            sa.func.count(Passage.id),
+            sa.func.count(Passage.id).filter(is_active)
+        ).join(Crew, Crew.id == Passage.crew_id)
+        .filter(Crew.race_id == race_id).group_by(Passage.checkpoint_id)
+    }
+    updates = [
+        {"id": checkpoint_id, "passed_count": passed.get(checkpoint_id, (0, 0))[0],
+         "passed_active_count": passed.get(checkpoint_id, (0, 0))[1]}
+        for (checkpoint_id,) in db.session.query(Checkpoint.id).filter_by(race_id=race_id)
+    ]
+    if updates:
+        db.session.execute(sa.update(Checkpoint), updates)
+
+def checkpoint_counters(checkpoint_id):
+    # Jediný dotaz přes primární klíč, tabulku průchodů nečte
+    row = db.session.query(
+        Checkpoint.passed_count, Checkpoint.passed_active_count, Race.crew_count, Race.active_crew_count
+    ).join(Race, Race.id == Checkpoint.race_id).filter(Checkpoint.id == checkpoint_id).first()
+    if row is None:
+        return None
+    passed, passed_active, total, active = (value or 0 for value in row)
+    return {
+        "total_crews": total,
+        "active_crews": active,
+        "passed_count": passed,
+        "remaining": active - passed_active,
+    }
+
+# Živé události závodu
+RACE_EVENTS_CHANNEL = "race_events"
+RACE_EVENTS_MAX_AGE = timedelta(days=1)
+# Události, po kterých se mění manifest skeneru
+ROSTER_EVENTS = ("crew", "checkpoints")
+
+def publish_event(race_id, kind, data):
+    # Necommituje – událost se uloží (a pošle NOTIFY) spolu se změnou volajícího.
+    # Každá událost zároveň mění verzi závodu, a tím zneplatní cache jeho stránek.
+    publish_events(race_id, kind, [data])
+
+def publish_events(race_id, kind, items):
+    # Dávka událostí jednoho druhu jedním INSERTem. Verze závodu se změní
+    # až těsně před commitem a jen jednou za transakci (bump_race_versions)
+    db.session.execute(sa.insert(RaceEvent), [
+        {"race_id": race_id, "kind": kind, "payload": json.dumps(data, ensure_ascii=False)}
+        for data in items
+    ])
+    pending = db.session.info.setdefault("race_versions", {})
+    pending[race_id] = pending.get(race_id, False) or kind in ROSTER_EVENTS
+    if db.engine.dialect.name == "postgresql":
+        db.session.execute(sa.text(f"NOTIFY {RACE_EVENTS_CHANNEL}"))
+
+@sa.event.listens_for(sa.orm.Session, "before_commit")
+def bump_race_versions(session):
+    """Změní verze závodů s novými událostmi v commitované transakci.
+
+    Řádek závodu je společný všem skenům závodu; zámek jeho UPDATE se tak
+    drží jen po dobu commitu, ne po celý přepočet bodů a počitadel.
+    """
+    pending = session.info.pop("race_versions", None)
+    for race_id, roster in sorted((pending or {}).items()):
+        versions = {"version": uuid.uuid4().hex}
+        if roster:
+            versions["roster_version"] = uuid.uuid4().hex
+        session.execute(sa.update(Race).where(Race.id == race_id).values(**versions),
+                        execution_options={"synchronize_session": False})
+
+@sa.event.listens_for(sa.orm.Session, "after_transaction_end")
+def forget_race_versions(session, transaction):
+    # Po rollbacku se verze nemění, události se neuložily
+    if transaction.parent is None:
+        session.info.pop("race_versions", None)
+
+def standing_totals(crew_ids):
+    return {
+        crew_id: total for crew_id, total in
+        db.session.query(Standing.crew_id, Standing.total).filter(Standing.crew_id.in_(set(crew_ids)))
+    }
+
+def publish_scans(race_id, scans):
+    # scans: (crew_id, checkpoint_id, timestamp, první průchod buňkou?, posunul dřívější čas buňky?)
+    totals = standing_totals(crew_id for crew_id, *_ in scans)
+    publish_events(race_id, "scan", [{
+        "crew_id": crew_id,
+        "checkpoint_id": checkpoint_id,
+        "time": timestamp.astimezone(ZoneInfo("Europe/Prague")).isoformat(),
+        "first": first,
+        "moved": moved,
+        "total": totals.get(crew_id)
+    } for crew_id, checkpoint_id, timestamp, first, moved in scans])
+
+def fetch_events(query, limit=1000):
+    rows = query.order_by(RaceEvent.id).limit(limit).all()
+    return [(e.id, e.race_id, e.kind, json.loads(e.payload)) for e in rows]
+
+def fetch_events_since(app, last_id):
+    with app.app_context():
+        return fetch_events(RaceEvent.query.filter(RaceEvent.id > last_id))
+
+def latest_event_id(app):
+    with app.app_context():
+        return db.session.query(sa.func.max(RaceEvent.id)).scalar() or 0
+
+def prune_events(app):
+    with app.app_context():
+        RaceEvent.query.filter(RaceEvent.created_at < get_czech_time() - RACE_EVENTS_MAX_AGE).delete()
+        db.session.commit()
+
+def listen_for_events(app):
+    # Vlastní spojení ovladače (psycopg2) mimo pool, které čeká na NOTIFY
+    # z ostatních workerů; s autocommit a LISTEN nesmí dostat žádný požadavek
+    with app.app_context():
+        if db.engine.dialect.name != "postgresql":
+            return None
+        cargs, cparams = db.engine.dialect.create_connect_args(db.engine.url)
+        connection = db.engine.dialect.connect(*cargs, **cparams)
+    connection.autocommit = True
+    connection.cursor().execute(f"LISTEN {RACE_EVENTS_CHANNEL}")
+    return connection
+
+# Podmíněné GET a cache vykreslených stránek závodu
+response_cache = ResponseCache()
+
+def race_version(race_id):
+    return db.session.query(Race.version).filter(Race.id == race_id).scalar()
+
+def checkpoint_race_version(checkpoint_id):
+    return db.session.query(Race.version).join(Checkpoint, Checkpoint.race_id == Race.id)\
+        .filter(Checkpoint.id == checkpoint_id).scalar()
+
+def cache_stream(key, chunks, content_type, headers):
+    # Streamovanou odpověď posíláme dál a zároveň skládáme pro cache
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        size += len(chunk)
+        if parts is not None and size > RESPONSE_CACHE_MAX_ITEM:
+            parts = None
+        elif parts is not None:
+            parts.append(chunk)
+        yield chunk
+    if parts is not None:
+        response_cache.put(key, b"".join(parts), content_type, headers)
+
+def versioned_page(version_of):
+    """Stránka závodu s ETagem podle verze závodu.
+
+    Shodný If-None-Match dostane 304, jinak se tělo vezme z cache podle
+    (URL, verze) a vykresluje se jen po změně závodu. Cena opakovaného
+    zobrazení je jediný dotaz na verzi.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            version = version_of(**kwargs)
+            if version is None:
+                return view(**kwargs)
+            key = (request.full_path, version)
+            etag = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+            if etag in request.if_none_match:
+                response = Response(status=304)
+            else:
+                cached = response_cache.get(key)
+                if cached is not None:
+                    body, content_type, headers = cached
+                    response = Response(body, content_type=content_type, headers=headers)
+                else:
+                    response = make_response(view(**kwargs))
+                    if response.status_code != 200:
+                        return response
+                    headers = {k: v for k, v in response.headers if k == "Content-Disposition"}
+                    if response.is_streamed:
+                        response.response = cache_stream(key, response.response, response.content_type, headers)
+                    else:
+                        response_cache.put(key, response.get_data(), response.content_type, headers)
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        return wrapper
+    return decorator
+
+def active_crews_in_order(crews):
+    # Aktivní posádky s číselným startovním číslem, seřazené podle čísla
+    return sorted(
+        [c for c in crews if c.is_active and c.start_number is not None],
+        key=lambda x: x.start_number
+    )
 
+def compute_ideal_schedule(race, active_crews, base_times):
+    """Spočítá ideální časy v paměti.
 
+    base_times je {checkpoint_id: datetime} pro první aktivní posádku,
+    každá další posádka startuje o race.crew_interval minut později.
+    Vrací {(crew_id, checkpoint_id): time}.
+    """
+    interval = timedelta(minutes=race.crew_interval or 0)
+    schedule = {}
+    for idx, crew in enumerate(active_crews):  # idx = pozice v aktivních posádkách
+        for checkpoint_id, base_dt in base_times.items():
+            schedule[(crew.id, checkpoint_id)] = (base_dt + idx * interval).time()
+    return schedule
+
+def apply_ideal_schedule(race_id, schedule):
+    """Porovná spočítaný rozpis s uloženými řádky a zapíše jen rozdíly.
+
+    Smazání, úpravy i nové řádky jdou hromadnými příkazy v jedné transakci,
+    takže tabulka není mezi commity nikdy prázdná.
+    Vrací (vloženo, upraveno, smazáno).
+    """
+    existing = db.session.query(
+        IdealTime.id, IdealTime.crew_id, IdealTime.checkpoint_id, IdealTime.ideal_time
+    ).join(Crew, IdealTime.crew_id == Crew.id).filter(Crew.race_id == race_id).all()
+
+    to_delete = []
+    to_update = []
+    seen = set()
+    changed = set()
+    for row in existing:
+        key = (row.crew_id, row.checkpoint_id)
+        # Řádky mimo rozpis (neaktivní posádky) a duplicity mažeme
+        if key not in schedule or key in seen:
+            to_delete.append(row.id)
+            changed.add(key)
+            continue
+        seen.add(key)
+        if row.ideal_time != schedule[key]:
+            to_update.append({"id": row.id, "ideal_time": schedule[key]})
+            changed.add(key)
+
+    to_insert = [
+        {"crew_id": crew_id, "checkpoint_id": checkpoint_id, "ideal_time": ideal_time}
+        for (crew_id, checkpoint_id), ideal_time in schedule.items()
+        if (crew_id, checkpoint_id) not in seen
+    ]
+
+    if to_delete:
+        db.session.execute(
+            sa.delete(IdealTime).where(IdealTime.id.in_(to_delete)),
+            execution_options={"synchronize_session": False}
+        )
+    if to_update:
+        db.session.execute(sa.update(IdealTime), to_update)
+    if to_insert:
+        db.session.execute(sa.insert(IdealTime), to_insert)
+    changed.update((row["crew_id"], row["checkpoint_id"]) for row in to_insert)
+
+    # Trestné body jen pro buňky, kterým se změnil ideální čas
+    refresh_penalties(changed)
+    if changed:
+        publish_event(race_id, "ideal", {
+            "cells": [
+                [crew_id, checkpoint_id, schedule[(crew_id, checkpoint_id)].strftime('%H:%M')
+                 if (crew_id, checkpoint_id) in schedule else None]
+                for crew_id, checkpoint_id in changed
+            ],
+            "totals": standing_totals(crew_id for crew_id, _ in changed)
+        })
+    db.session.commit()
 
+    return len(to_insert), len(to_update), len(to_delete)
 
+def lock_race(race_id):
+    # Přepočty téhož závodu z různých workerů se na Postgresu řadí za sebe
+    # (zámek drží transakce do commitu); SQLite zapisuje vždy jen jeden
+    if db.engine.dialect.name == "postgresql":
+        db.session.execute(sa.text("SELECT pg_advisory_xact_lock(:race_id)"), {"race_id": race_id})
 
 def recalculate_all_ideal_times(race_id):
+    lock_race(race_id)
     race = Race.query.get(race_id)
     if not race:
         return
 
-    checkpoints = Checkpoint.query.filter_by(race_id=race.id).order_by(Checkpoint.order).all()
-
-    # Vezmeme všechny posádky závodu
-    all_crews = Crew.query.filter_by(race_id=race.id).all()
+    checkpoint_ids = [ck.id for ck in Checkpoint.query.filter_by(race_id=race.id).all()]
 
     # Seřadíme aktivní posádky podle čísla
-    active_crews = sorted(
-        [c for c in all_crews if c.is_active and c.number.isdigit()],
-        key=lambda x: int(x.number)
-    )
-
-    # Najdeme první aktivní posádku jako referenci
-    reference_crew = active_crews[0] if active_crews else None
-    if not reference_crew:
+    active_crews = active_crews_in_order(Crew.query.filter_by(race_id=race.id).all())
+    if not active_crews:
         return  # není žádná aktivní posádka, neděláme nic
 
-    # Načteme ideální časy referenční posádky
-    base_times = IdealTime.query.filter(
-        IdealTime.crew_id == reference_crew.id,
-        IdealTime.checkpoint_id.in_([ck.id for ck in checkpoints])
-    ).order_by(IdealTime.checkpoint_id).all()
-
-    if not base_times:
+    stored = {}
+    for it in IdealTime.query.filter(
+        IdealTime.crew_id.in_([c.id for c in active_crews]),
+        IdealTime.checkpoint_id.in_(checkpoint_ids)
+    ).all():
+        stored.setdefault(it.crew_id, {})[it.checkpoint_id] = it.ideal_time
+
+    # Referencí je první aktivní posádka, která má uložené časy; její časy
+    # posuneme zpět o její pozici, takže znovu aktivovaná posádka bez časů
+    # rozpis nerozbije
+    reference = next(
+        ((idx, crew) for idx, crew in enumerate(active_crews) if crew.id in stored),
+        None
+    )
+    if not reference:
         return  # není co přepočítávat
+    ref_idx, ref_crew = reference
 
-    # Vymažeme všechny ideální časy tohoto závodu
-    crew_ids = [c.id for c in all_crews]
-    IdealTime.query.filter(IdealTime.crew_id.in_(crew_ids)).delete()
-    db.session.commit()
-
-    # Výpočet nových časů
     base_date = race.start_time.date() if race.start_time else datetime.today().date()
-    for idx, crew in enumerate(active_crews):  # idx = pozice v aktivních posádkách
-        for bt in base_times:
-            orig_dt = datetime.combine(base_date, bt.ideal_time)
-            new_dt = orig_dt + timedelta(minutes=idx * race.crew_interval)
+    offset = timedelta(minutes=ref_idx * (race.crew_interval or 0))
+    base_times = {
+        checkpoint_id: datetime.combine(base_date, ideal_time) - offset
+        for checkpoint_id, ideal_time in stored[ref_crew.id].items()
+    }
 
-            new_ideal = IdealTime(
-                crew_id=crew.id,
-                checkpoint_id=bt.checkpoint_id,
-                ideal_time=new_dt.time()
-            )
-            db.session.add(new_ideal)
+    schedule = compute_ideal_schedule(race, active_crews, base_times)
+    apply_ideal_schedule(race.id, schedule)
 
-    db.session.commit()
+def recalculate_in_background(app, race_id):
+    with app.app_context():
+        recalculate_all_ideal_times(race_id)
+        db.session.commit()
+
+def schedule_recalculation(race_id):
+    # Přepočet ideálních časů na pozadí; rychle za sebou jdoucí změny
+    # posádek závodu se sloučí do jednoho běhu
+    current_app.extensions["recalculator"].trigger(race_id)
 
 def sanitize_filename(name):
     name = unicodedata.normalize("NFKD", name)
@@ -213,84 +852,250 @@ def sanitize_filename(name):
     name = re.sub(r"[^\w\-]+", "_", name)
     return name.strip("_")
 
-@app.route("/race/<int:race_id>/import_crews", methods=["POST"])
-def import_crews(race_id):
-    race = Race.query.get_or_404(race_id)
-    source_url = request.form.get("source_url")
-    start_row = int(request.form.get("start_row",1))
-    if not source_url:
-        return "Chybí source_url", 400
+# Sloupce posádky, které import přepisuje; číslo je klíčem upsertu
+CREW_IMPORT_FIELDS = ("name", "vehicle", "category", "vehicle_year", "penalty_year")
+
+def upsert_crews(race_id, crews, on_batch=None):
+    """Vloží nové a upraví změněné posádky závodu podle klíče (race_id, number).
+
+    Posádky se berou z iterátoru po dávkách a zapisují hromadným INSERT
+    a UPDATE podle primárního klíče. Čísla hlídá unikátní index: posádku,
+    kterou mezitím založil souběžný import nebo formulář, INSERT přeskočí
+    a porovná se jako existující. Necommituje; on_batch(report, řádků)
+    se volá po každé dávce a může ji commitnout. Vrací slovník s ID
+    nových a změněných posádek a počtem nezměněných.
+    """
+    columns = [Crew.id, Crew.number] + [getattr(Crew, field) for field in CREW_IMPORT_FIELDS]
+
+    def load(numbers=None):
+        query = db.session.query(*columns).filter(Crew.race_id == race_id)
+        if numbers is not None:
+            query = query.filter(Crew.number.in_(numbers))
+        return {row.number: dict(row._mapping) for row in query}
+
+    report = {"inserted": [], "updated": [], "unchanged": 0}
+
+    def compare(crew, current, updates):
+        # Prázdná buňka a NULL v databázi jsou totéž, posádka se nemění
+        if any((current[field] or "") != (crew[field] or "") for field in CREW_IMPORT_FIELDS):
+            updates.append({"id": current["id"], **{field: crew[field] for field in CREW_IMPORT_FIELDS}})
+            current.update(crew)
+        else:
+            report["unchanged"] += 1
+
+    existing = load()
+    crews = iter(crews)
+    seen = 0
+    while True:
+        # V rámci dávky vyhrává poslední řádek se stejným číslem
+        batch = {crew["number"]: crew for crew in itertools.islice(crews, IMPORT_BATCH_SIZE)}
+        if not batch:
+            return report
+
+        inserts, updates = [], []
+        for number, crew in batch.items():
+            current = existing.get(number)
+            if current is None:
+                inserts.append({**crew, "race_id": race_id, "start_number": parse_start_number(number)})
+            else:
+                compare(crew, current, updates)
+
+        if inserts:
+            for crew_id, number in insert_ignoring_conflicts(
+                Crew, ["race_id", "number"], inserts, returning=(Crew.id, Crew.number)
+            ):
+                existing[number] = {"id": crew_id, **batch[number]}
+                report["inserted"].append(crew_id)
+            raced = [row["number"] for row in inserts if row["number"] not in existing]
+            if raced:
+                existing.update(load(raced))
+                for number in raced:
+                    compare(batch[number], existing[number], updates)
+        if updates:
+            db.session.execute(sa.update(Crew), updates)
+            report["updated"].extend(update["id"] for update in updates)
+        seen += len(batch)
+        if on_batch:
+            on_batch(report, seen)
+
+def apply_imported_crews(race_id, inserted, updated):
+    # Body a počitadla jen pro nové a změněné posádky. Necommituje.
+    if inserted or updated:
+        refresh_standings(inserted + updated)
+    if inserted:
+        active = Crew.query.filter(Crew.id.in_(inserted), Crew.is_active.is_(True)).count()
+        count_crews(race_id, len(inserted), active)
+
+def run_import_job(job_id, race_id, params, directory):
+    """Import posádek jako úloha; každá dávka se commituje zvlášť.
+
+    Dlouhý import tak nedrží zámek databáze (skeny na SQLite) a opakovaný
+    import po chybě jen doplní zbytek – upsert podle čísla nic nezdvojí.
+    """
+    source = None
+    if params.get("url"):
+        rows = iter_url_rows(params["url"])
+    else:
+        source = open(os.path.join(directory, "source"), "rb")
+        rows = iter_file_rows(source, params["format"])
+
+    done = {"inserted": [], "updated": []}
+    def finish_batch(report, seen):
+        inserted = report["inserted"][len(done["inserted"]):]
+        updated = report["updated"][len(done["updated"]):]
+        apply_imported_crews(race_id, inserted, updated)
+        db.session.commit()
+        done["inserted"] += inserted
+        done["updated"] += updated
+        update_job(job_id, progress=seen)
 
     try:
-        tables = pd.read_html(source_url)
+        report = upsert_crews(race_id, iter_crews(rows, params["start_row"]), on_batch=finish_batch)
     except Exception as e:
-        return f"Nepodařilo se načíst tabulku ze stránky: {e}", 500
-
-    if not tables:
-        return "Nebyly nalezeny žádné tabulky", 400
-
-    # Vybereme první tabulku (nebo podle obsahu i jinou)
-    df = tables[0]
-    df = df.iloc[start_row:]
-    # Debug: zobraz strukturu tabulky
-    print(df.head())
-
-    # Předpokládejme, že sloupce jsou např.: "Číslo", "Jméno", "Vozidlo"
-    required_columns = [0, 1, 2, 5, 6, 7]
-    if not all(col in df.columns for col in required_columns):
-        return f"Chybí očekávané sloupce. Nalezeno: {df.columns}", 400
-
-    new_crews = []
-    for _, row in df.iterrows():
-        number = str(row[0]).strip()
-        name = str(row[1]).strip()
-        vehicle = str(row[2]).strip()
-        penalty_year = str(row[5]).strip()
-        vehicle_year = str(row[6]).strip()
-        category = str(row[7]).strip()
-
-        crew = Crew(
-            number=number,
-            name=name,
-            vehicle=vehicle,
-            category=category,
-            vehicle_year=vehicle_year,
-            penalty_year=penalty_year,
-            race_id=race.id
-        )
-        db.session.add(crew)
-        new_crews.append(crew)
-
-    db.session.commit()
-
-    # QR kódy + Supabase upload
-    for crew in new_crews:
-        qr_buffer = generate_qr_with_center_text(str(crew.id), crew.number)
-        filename = secure_filename(f"{crew.name}_{crew.id}.png")
-        tmp_path = f"/tmp/{filename}"
-        with open(tmp_path, "wb") as f:
-            f.write(qr_buffer.getvalue())
-
-        public_url = upload_qr_to_supabase(tmp_path, filename)
-        crew.qr_code_url = public_url
-
-    db.session.commit()
-
-    recalculate_all_ideal_times(race.id)
-
-    return f"Importováno {len(new_crews)} posádek z tabulky.", 200
+        db.session.rollback()
+        raise RuntimeError(f"Nepodařilo se načíst tabulku: {e}") from e
+    finally:
+        if source is not None:
+            source.close()
+        inserted, updated = done["inserted"], done["updated"]
+        if inserted or updated:
+            publish_event(race_id, "crew", {"action": "imported", "inserted": len(inserted), "updated": len(updated)})
+            db.session.commit()
+        # Nové posádky mění pořadí startu, změna jména nebo vozidla ideální časy neovlivní
+        if inserted:
+            schedule_recalculation(race_id)
+
+    if not inserted and not updated and not report["unchanged"]:
+        raise RuntimeError("V tabulce nebyly nalezeny žádné posádky")
+    message = (f"Importováno: {len(inserted)} nových, {len(updated)} změněných, "
+               f"{report['unchanged']} beze změny.")
+    with open(os.path.join(directory, "result"), "w", encoding="utf-8") as f:
+        json.dump({"message": message, "inserted": inserted, "updated": updated,
+                   "unchanged": report["unchanged"]}, f, ensure_ascii=False)
+    return {"message": message, "result_name": f"import_posadek_{race_id}.json", "result_type": "application/json"}
+
+@bp.route("/race/<int:race_id>/import_crews", methods=["POST"])
+def import_crews(race_id):
+    """Import posádek z URL (source_url) nebo nahraného souboru HTML/XLSX/CSV (source_file).
 
+    Běží jako úloha na pozadí, odpověď je 202 s odkazem na její průběh.
+    Tabulka se čte průběžně po řádcích. Opakovaný import posádky nezdvojí:
+    existující čísla se jen aktualizují a body ani ideální časy se
+    nepřepočítávají u posádek, které se nezměnily.
+    """
+    race = Race.query.get_or_404(race_id)
+    source_url = request.form.get("source_url")
+    source_file = request.files.get("source_file")
+    start_row = request.form.get("start_row", type=int)
+    if start_row is None:
+        start_row = 1
+    if source_file and source_file.filename:
+        # Nahraný soubor se uloží k úloze, tělo požadavku po odpovědi zaniká
+        params = {"format": detect_format(source_file.filename, source_file.mimetype), "start_row": start_row}
+        prepare = lambda directory: source_file.save(os.path.join(directory, "source"))
+    elif source_url:
+        params = {"url": source_url, "start_row": start_row}
+        prepare = None
+    else:
+        return "Chybí source_url nebo soubor", 400
+
+    return job_accepted(start_job("import", race.id, params, prepare=prepare))
+
+def iter_race_qr_codes(race_id):
+    # QR kódy posádek závodu v pořadí startovních čísel, vykreslené paralelně
+    crews = db.session.query(Crew.id, Crew.number, Crew.name).filter(Crew.race_id == race_id)\
+        .order_by(Crew.start_number, Crew.number).all()
+    return iter_qr_pngs(((crew, str(crew.id), crew.number) for crew in crews))
+
+QR_BUNDLE_TYPES = {"zip": "application/zip", "pdf": "application/pdf"}
+
+def run_qr_job(job_id, race_id, params, directory):
+    # Všechny QR kódy závodu jako ZIP obrázků nebo PDF s archy A4 k tisku
+    race = db.session.get(Race, race_id)
+    total = db.session.query(sa.func.count(Crew.id)).filter(Crew.race_id == race_id).scalar()
+    update_job(job_id, total=total)
+    codes = job_progress(job_id, iter_race_qr_codes(race_id), every=20)
+    if params["format"] == "zip":
+        chunks = iter_zip((f"{crew.number}_{sanitize_filename(crew.name or '')}.png", png) for crew, png in codes)
+    else:
+        # Archy A4 se štítky k vytištění a rozstříhání
+        chunks = iter_pdf(iter_sheets((f"{crew.number} – {crew.name or ''}", png) for crew, png in codes))
+    write_job_result(directory, chunks)
+    return {
+        "message": f"QR kódy {total} posádek",
+        "result_name": f"qr_kody_{sanitize_filename(race.name or '') or race.id}.{params['format']}",
+        "result_type": QR_BUNDLE_TYPES[params["format"]],
+    }
+
+def start_qr_job(race_id, bundle_format):
+    # Shodný soubor pro nezměněnou soupisku se nevytváří znovu
+    race = Race.query.get_or_404(race_id)
+    return job_accepted(start_job(
+        "qr", race.id, {"format": bundle_format, "version": race.roster_version}, dedupe=True
+    ))
+
+@bp.route("/race/<int:race_id>/qrcodes.zip")
+def download_qr_zip(race_id):
+    return start_qr_job(race_id, "zip")
+
+@bp.route("/race/<int:race_id>/qrcodes.pdf")
+def download_qr_pdf(race_id):
+    return start_qr_job(race_id, "pdf")
+
+# Vygenerované QR kódy se ukládají do úložiště (QR_STORAGE=local|supabase),
+# obrázek se vykreslí až při prvním požadavku
+QR_MAX_AGE = 365 * 24 * 3600
+
+# Kolik znaků klíče QR kódu nese parametr v v adrese obrázku
+QR_VERSION_LENGTH = 16
+
+def crew_qr_key(crew):
+    # QR kód obsahuje jen ID a číslo posádky – změna jména nebo vozidla ho nemění
+    return qr_cache_key(str(crew.id), crew.number)
+
+@bp.app_template_global()
+def crew_qr_url(crew, **params):
+    # Parametr v mění s obsahem QR kódu, prohlížeč si obrázek smí držet napořád
+    return url_for("main.crew_qr", crew_id=crew.id, v=crew_qr_key(crew)[:QR_VERSION_LENGTH], **params)
+
+@bp.route("/crew/<int:crew_id>/qr.png")
+def crew_qr(crew_id):
+    crew = db.session.query(Crew.id, Crew.number, Crew.name).filter(Crew.id == crew_id).first()
+    if crew is None:
+        abort(404)
+    key = crew_qr_key(crew)
+
+    if key in request.if_none_match:
+        response = Response(status=304)
+    else:
+        qr_storage = current_app.extensions["qr_storage"]
+        png = cached_qr_png(str(crew.id), crew.number) or qr_storage.get(key)
+        if png is None:
+            png = render_qr_png(str(crew.id), crew.number)
+            qr_storage.put(key, png)
+        response = Response(png, mimetype="image/png")
+        if "download" in request.args:
+            filename = f"{crew.number}_{sanitize_filename(crew.name or '')}.png"
+            response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+
+    response.set_etag(key)
+    # Adresa bez aktuálního v (staré odkazy) se cachuje jen krátce
+    if request.args.get("v") == key[:QR_VERSION_LENGTH]:
+        response.headers["Cache-Control"] = f"public, max-age={QR_MAX_AGE}, immutable"
+    else:
+        response.headers["Cache-Control"] = "public, max-age=300"
+    return response
 
 
-@app.route("/")
+@bp.route("/")
 def index():
-    races = Race.query.order_by(Race.start_time.desc()).all()
+    races = Race.query.options(selectinload(Race.checkpoints)).order_by(Race.start_time.desc()).all()
     return render_template("index.html", races=races)
 
 #smazaní databáze
 from flask import render_template, request, redirect, url_for, flash
 
-@app.route('/delete-database', methods=['GET', 'POST'])
+@bp.route('/delete-database', methods=['GET', 'POST'])
 def delete_database():
     if request.method == 'POST':
         try:
@@ -298,17 +1103,18 @@ def delete_database():
             db.drop_all()
             db.create_all()
             db.session.commit()
+            response_cache.clear()
             flash('Databáze byla úspěšně smazána a znovu vytvořena', 'success')
         except Exception as e:
             db.session.rollback()
             flash(f'Chyba při mazání databáze: {str(e)}', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     # GET požadavek zobrazí potvrzovací stránku
     return render_template('confirm_delete.html')
 
     
-@app.route("/create_race", methods=["GET", "POST"])
+@bp.route("/create_race", methods=["GET", "POST"])
 def create_race():
     if request.method == "POST":
         name = request.form["name"]
@@ -329,10 +1135,11 @@ def create_race():
         return redirect(f"/race/{race.id}")
     return render_template("create_race.html")
 
-@app.route("/race/<int:race_id>")
+@bp.route("/race/<int:race_id>")
+@versioned_page(race_version)
 def race_detail(race_id):
     race = Race.query.get_or_404(race_id)
-    crews = Crew.query.filter_by(race_id=race.id).order_by(cast(Crew.number, Integer)).all()
+    crews = Crew.query.filter_by(race_id=race.id).order_by(Crew.start_number).all()
     checkpoints = Checkpoint.query.filter_by(race_id=race.id).order_by(Checkpoint.order).all()
     
     # Získání ideálních časů první posádky
@@ -349,11 +1156,15 @@ def race_detail(race_id):
     for time in all_ideal_times:
         crew_times.setdefault(time.crew_id, {})[time.checkpoint_id] = time.ideal_time.strftime('%H:%M')
         
-    # REÁLNÉ ČASY
-    all_scans = ScanRecord.query.join(Crew).filter(Crew.race_id == race.id).all()
+    # REÁLNÉ ČASY – první průchod každé buňky (stejně jako v bodování)
     scan_times = {}
-    for scan in all_scans:
-        scan_times.setdefault(scan.crew_id, {})[scan.checkpoint_id] = scan.timestamp.strftime('%H:%M')
+    for crew_id, checkpoint_id, timestamp in db.session.query(
+        Passage.crew_id, Passage.checkpoint_id, Passage.timestamp
+    ).join(Crew, Crew.id == Passage.crew_id).filter(Crew.race_id == race.id):
+        scan_times.setdefault(crew_id, {})[checkpoint_id] = to_prague(timestamp).strftime('%H:%M')
+
+    # Předpočítané celkové trestné body
+    totals = {s.crew_id: s.total for s in Standing.query.filter_by(race_id=race.id)}
         
     return render_template(
         "race_detail.html", 
@@ -362,16 +1173,17 @@ def race_detail(race_id):
         checkpoints=checkpoints,
         checkpoint_times=checkpoint_times,
         crew_times=crew_times,
-        scan_times=scan_times
+        scan_times=scan_times,
+        totals=totals
     )
 
-@app.route("/race/<int:race_id>/crews", methods=["GET"])
+@bp.route("/race/<int:race_id>/crews", methods=["GET"])
 def manage_crews(race_id):
     race = Race.query.get_or_404(race_id)
-    crews = Crew.query.filter_by(race_id=race.id).order_by(cast(Crew.number, Integer)).all()
+    crews = Crew.query.filter_by(race_id=race.id).order_by(Crew.start_number).all()
     return render_template("manage_crews.html", race=race, crews=crews)
 
-@app.route("/race/<int:race_id>/crews/create", methods=["GET", "POST"])
+@bp.route("/race/<int:race_id>/crews/create", methods=["GET", "POST"])
 def create_crew(race_id):
     race = Race.query.get_or_404(race_id)
     checkpoints = Checkpoint.query.filter_by(race_id=race_id).order_by(Checkpoint.order).all()
@@ -383,42 +1195,52 @@ def create_crew(race_id):
 
         crew = Crew(name=name, vehicle=vehicle, number=number, race_id=race.id)
         db.session.add(crew)
-        db.session.commit()
-
-        # Vygenerování QR kódu
-        qr_buffer = generate_qr_with_center_text(str(crew.id), crew.number)
-        file_path = f"qrcodes/{crew.name}_{crew.id}.png"
-        with open(file_path, "wb") as f:
-            f.write(qr_buffer.getvalue())
+        try:
+            db.session.commit()
+        except sa.exc.IntegrityError:
+            # Číslo mezitím obsadil jiný požadavek nebo import (unikátní index)
+            db.session.rollback()
+            flash(f"Posádka s číslem {number} už v závodě je", "danger")
+            return redirect(url_for("main.manage_crews", race_id=race.id))
 
-        public_url = upload_qr_to_supabase(file_path, f"{crew.name}_{crew.id}.png")
-        crew.qr_code_url = public_url
+        refresh_standings([crew.id])
+        count_crews(race.id, 1, 1 if crew.is_active else 0)
+        publish_event(race.id, "crew", {"action": "created", "crew_id": crew.id})
         db.session.commit()
 
-        recalculate_all_ideal_times(race.id)
+        schedule_recalculation(race.id)
         
         return redirect(f"/race/{race.id}/crews")
     
     return render_template("create_crew.html", race=race)
 
-@app.route("/crew/<int:crew_id>/toggle_active", methods=["POST"])
+@bp.route("/crew/<int:crew_id>/toggle_active", methods=["POST"])
 def toggle_crew_active(crew_id):
     crew = Crew.query.get_or_404(crew_id)
     crew.is_active = not crew.is_active
+    count_crew_activation(crew)
+    publish_event(crew.race_id, "crew", {"action": "updated", "crew_id": crew.id})
     db.session.commit()
-    recalculate_all_ideal_times(crew.race_id)
+    schedule_recalculation(crew.race_id)
     return redirect(f"/race/{crew.race_id}/crews")
 
-@app.route("/crew/<int:crew_id>/delete", methods=["POST"])
+@bp.route("/crew/<int:crew_id>/delete", methods=["POST"])
 def delete_crew(crew_id):
     crew = Crew.query.get_or_404(crew_id)
     race_id = crew.race_id
+    active = 1 if crew.is_active else 0
+    count_crews(race_id, -1, -active)
+    count_crew_passages([crew.id], -1, -active)
+    # Závislé řádky mažeme explicitně, jinak by ORM nastavilo crew_id na NULL
+    for model in (Penalty, Standing, IdealTime, Passage, ScanRecord):
+        model.query.filter_by(crew_id=crew.id).delete()
     db.session.delete(crew)
+    publish_event(race_id, "crew", {"action": "deleted", "crew_id": crew_id})
     db.session.commit()
-    recalculate_all_ideal_times(crew.race_id)
+    schedule_recalculation(race_id)
     return redirect(f"/race/{race_id}/crews")
 
-@app.route("/crew/<int:crew_id>/edit", methods=["GET", "POST"])
+@bp.route("/crew/<int:crew_id>/edit", methods=["GET", "POST"])
 def edit_crew(crew_id):
     crew = Crew.query.get_or_404(crew_id)
     error = None
@@ -433,153 +1255,862 @@ def edit_crew(crew_id):
             error = "Jméno a číslo posádky jsou povinné!"
         else:
             old_name = crew.name
+            was_active = crew.is_active
+            # Pořadí startu (a tím ideální časy) mění jen číslo a aktivita
+            reorders = was_active != is_active or crew.number != number
             crew.name = name
             crew.number = number
             crew.vehicle = vehicle
             crew.is_active = is_active
+            try:
+                # Číslo hlídá unikátní index, kolize se projeví už při flush
+                db.session.flush()
+            except sa.exc.IntegrityError:
+                db.session.rollback()
+                return render_template("edit_crew.html", crew=crew,
+                                       error=f"Posádka s číslem {number} už v závodě je")
+            if was_active != is_active:
+                count_crew_activation(crew)
+            publish_event(crew.race_id, "crew", {"action": "updated", "crew_id": crew.id})
             db.session.commit()
 
-            # Vygeneruj QR kód do paměti (in-memory)
-            qr_buffer = generate_qr_with_center_text(str(crew.id), crew.number)
-            filename = f"{crew.name}_{crew.id}.png"
-            file_path = f"/tmp/{filename}"
+            if reorders:
+                schedule_recalculation(crew.race_id)
+            return redirect(f"/race/{crew.race_id}/crews")
 
-            with open(file_path, "wb") as f:
-                f.write(qr_buffer.getvalue())
+    return render_template("edit_crew.html", crew=crew, error=error)
 
+BULK_CREW_ACTIONS = ("activate", "deactivate", "delete", "renumber")
 
-            public_url = upload_qr_to_supabase(file_path, filename)
-            print("QR kód nahrán:", public_url)
+def bulk_crew_request():
+    # (akce, [crew_id], {crew_id: nové číslo}) z JSONu nebo z formuláře se zaškrtnutými posádkami
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        crew_ids = data.get("crew_ids") or []
+        numbers = data.get("numbers") or {}
+    else:
+        data = request.form
+        crew_ids = request.form.getlist("crew_ids")
+        numbers = {crew_id: request.form.get(f"number_{crew_id}") for crew_id in crew_ids}
+    crew_ids = {safe_int(crew_id) for crew_id in crew_ids} - {0}
+    numbers = {safe_int(crew_id): str(number or "").strip() for crew_id, number in numbers.items()}
+    return data.get("action"), crew_ids, numbers
+
+def renumber_crews(race_id, crews, numbers):
+    # Vrací chybovou hlášku, nebo None; čísla musí zůstat v závodě unikátní
+    if any(not numbers.get(crew.id) for crew in crews):
+        return "Každá vybraná posádka musí mít nové číslo"
+    changed = {crew.id for crew in crews}
+    taken = Counter(
+        number for crew_id, number in db.session.query(Crew.id, Crew.number).filter(Crew.race_id == race_id)
+        if crew_id not in changed
+    )
+    taken.update(numbers[crew.id] for crew in crews)
+    duplicates = sorted(number for number, count in taken.items() if count > 1)
+    if duplicates:
+        return f"Čísla posádek se opakují: {', '.join(duplicates)}"
+    # Výměna čísel (1 <-> 2) by porušila unikátní index, proto přes dočasná čísla
+    for crew in crews:
+        crew.number = f"#{crew.id}"
+    db.session.flush()
+    for crew in crews:
+        crew.number = numbers[crew.id]
+    return None
 
-            crew.qr_code_url = public_url
+@bp.route("/race/<int:race_id>/crews/bulk", methods=["POST"])
+def bulk_crews(race_id):
+    """Aktivace, deaktivace, smazání nebo přečíslování vybraných posádek v jedné transakci.
 
-            recalculate_all_ideal_times(crew.race_id)
-            return redirect(f"/race/{crew.race_id}/crews")
+    Přijímá JSON {"action", "crew_ids", "numbers": {id: číslo}} nebo formulář
+    se zaškrtnutými crew_ids (a poli number_<id>). Ideální časy se přepočítají
+    jednou na pozadí.
+    """
+    race = Race.query.get_or_404(race_id)
+    action, crew_ids, numbers = bulk_crew_request()
+    error = None
+    if action not in BULK_CREW_ACTIONS:
+        error = "Neznámá akce"
+    elif not crew_ids:
+        error = "Nejsou vybrané žádné posádky"
+    crews = Crew.query.filter(Crew.race_id == race.id, Crew.id.in_(crew_ids)).all() if not error else []
+
+    if not error and action in ("activate", "deactivate"):
+        is_active = action == "activate"
+        crews = [crew for crew in crews if crew.is_active != is_active]
+        delta = 1 if is_active else -1
+        for crew in crews:
+            crew.is_active = is_active
+        count_crews(race.id, 0, delta * len(crews))
+        count_crew_passages([crew.id for crew in crews], 0, delta)
+    elif not error and action == "delete":
+        ids = [crew.id for crew in crews]
+        active_ids = [crew.id for crew in crews if crew.is_active]
+        count_crews(race.id, -len(ids), -len(active_ids))
+        count_crew_passages(ids, -1, 0)
+        count_crew_passages(active_ids, 0, -1)
+        # Závislé řádky mažeme explicitně, jinak by ORM nastavilo crew_id na NULL
+        for model in (Penalty, Standing, IdealTime, Passage, ScanRecord):
+            model.query.filter(model.crew_id.in_(ids)).delete(synchronize_session=False)
+        for crew in crews:
+            db.session.delete(crew)
+    elif not error and action == "renumber":
+        error = renumber_crews(race.id, crews, numbers)
+
+    if error:
+        db.session.rollback()
+        if request.is_json:
+            return jsonify({"status": "error", "message": error}), 400
+        flash(error, "danger")
+        return redirect(url_for("main.manage_crews", race_id=race.id))
+
+    if crews:
+        publish_event(race.id, "crew", {"action": action, "crew_ids": sorted(crew.id for crew in crews)})
+    db.session.commit()
+    if crews:
+        schedule_recalculation(race.id)
 
-    return render_template("edit_crew.html", crew=crew, error=error)
+    message = f"Upraveno posádek: {len(crews)}"
+    if request.is_json:
+        return jsonify({"status": "ok", "action": action, "crews": len(crews), "message": message})
+    flash(message, "success")
+    return redirect(url_for("main.manage_crews", race_id=race.id))
 
-@app.route("/scan/<int:crew_id>/<int:checkpoint_id>", methods=["POST"])
+@bp.route("/scan/<int:crew_id>/<int:checkpoint_id>", methods=["POST"])
 def scan_qr(crew_id, checkpoint_id):
     crew = Crew.query.get_or_404(crew_id)
     checkpoint = Checkpoint.query.get_or_404(checkpoint_id)
 
     now = datetime.now(ZoneInfo("Europe/Prague"))
+    if scans_write_behind():
+        # Potvrzeno po zápisu do žurnálu, do databáze se uloží s další dávkou
+        current_app.extensions["scan_writer"].submit([journal_row({
+            "crew_id": crew.id,
+            "checkpoint_id": checkpoint.id,
+            "timestamp": now,
+            "client_id": str(uuid.uuid4())
+        })])
+    else:
+        skipped = store_scans([{
+            "crew_id": crew.id,
+            "checkpoint_id": checkpoint.id,
+            "timestamp": now,
+            "client_id": str(uuid.uuid4())
+        }])
+        db.session.commit()
+        if skipped:
+            return jsonify({
+                "status": "duplicate",
+                "message": f"Průchod posádky {crew.name} na {checkpoint.name} už je zaznamenán, opakovaný sken se neukládá"
+            })
+
+    return jsonify({
+        "status": "ok",
+        "message": f"Zaznamenán průchod posádky {crew.name} na {checkpoint.name} v {now.strftime('%Y-%m-%d %H:%M:%S')}"
+    })
+
+
+def parse_client_timestamp(value):
+    # ISO 8601 z telefonu; čas bez zóny bereme jako pražský
+    timestamp = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=ZoneInfo("Europe/Prague"))
+    return timestamp.astimezone(ZoneInfo("Europe/Prague"))
+
+def insert_ignoring_conflicts(model, index_elements, rows, returning=()):
+    # Hromadný insert, řádky porušující unikátní index se přeskočí;
+    # s returning vrací vybrané sloupce opravdu vložených řádků
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(model).on_conflict_do_nothing(index_elements=index_elements)
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(model).on_conflict_do_nothing(index_elements=index_elements)
+    else:
+        stmt = sa.insert(model)
+    if returning:
+        return db.session.execute(stmt.returning(*returning), rows).all()
+    db.session.execute(stmt, rows)
+
+# Opakovaný sken buňky do tolika sekund od jejího prvního nebo posledního
+# přijatého skenu se neukládá (skener čte 10 snímků za sekundu a pořadatelé
+# posádku často naskenují dvakrát)
+SCAN_DEBOUNCE = timedelta(seconds=float(os.getenv("SCAN_DEBOUNCE_SECONDS", "30")))
+
+def local_time(timestamp):
+    # Pražský čas bez zóny – porovnatelný pro Postgres (se zónou) i SQLite (bez ní)
+    return to_prague(timestamp).replace(tzinfo=None)
+
+def store_scans(rows):
+    """Uloží průchody (slovníky s client_id) a přepočítá body, počitadla a události.
+
+    První sken buňky založí její Passage; pozdější sken ji jen posune na
+    dřívější čas (offline fronta), pokud čas nebyl opraven ručně. Sken do
+    SCAN_DEBOUNCE od předchozího se zahodí. Vrací {client_id: "duplicate"
+    (uložený dřív) nebo "debounced" (opakovaný sken)} neuložených průchodů.
+    Necommituje.
+    """
+    if current_app.config.get("FIELD_NODE_ID"):
+        append_scan_log(rows)
+    skipped = {
+        cid: "duplicate" for (cid,) in db.session.query(ScanRecord.client_id)
+        .filter(ScanRecord.client_id.in_([row["client_id"] for row in rows])).all()
+    }
+    new_rows = [row for row in rows if row["client_id"] not in skipped]
+    if not new_rows:
+        return skipped
+
+    pairs = {(row["crew_id"], row["checkpoint_id"]) for row in new_rows}
+    race_of_checkpoint = dict(
+        db.session.query(Checkpoint.id, Checkpoint.race_id)
+        .filter(Checkpoint.id.in_({ck_id for _, ck_id in pairs}))
+    )
+    passages = {
+        (p.crew_id, p.checkpoint_id): p for p in Passage.query.filter(
+            Passage.crew_id.in_({crew_id for crew_id, _ in pairs}),
+            Passage.checkpoint_id.in_(set(race_of_checkpoint))
+        )
+    }
+
+    kept, fresh, moved, first_ids, moved_ids = [], {}, set(), set(), set()
+    for row in sorted(new_rows, key=lambda r: r["timestamp"]):
+        key = (row["crew_id"], row["checkpoint_id"])
+        timestamp = local_time(row["timestamp"])
+        passage, cell = passages.get(key), fresh.get(key)
+        if passage is None and cell is None:
+            fresh[key] = {**row, "seen": timestamp}
+            first_ids.add(row["client_id"])
+        else:
+            seen = [cell["seen"]] if cell else [local_time(passage.timestamp), local_time(passage.last_seen)]
+            if any(abs(timestamp - t) < SCAN_DEBOUNCE for t in seen):
+                skipped[row["client_id"]] = "debounced"
+                continue
+            if cell:
+                cell["last_seen"], cell["seen"] = row["timestamp"], timestamp
+            else:
+                if timestamp > local_time(passage.last_seen):
+                    passage.last_seen = row["timestamp"]
+                if timestamp < local_time(passage.timestamp) and not passage.corrected:
+                    passage.timestamp = row["timestamp"]
+                    moved.add(key)
+                    moved_ids.add(row["client_id"])
+        kept.append(row)
+    if not kept:
+        return skipped
+
+    inserted = set()
+    if fresh:
+        inserted = set(insert_ignoring_conflicts(Passage, ["crew_id", "checkpoint_id"], [
+            {"crew_id": cell["crew_id"], "checkpoint_id": cell["checkpoint_id"], "timestamp": cell["timestamp"],
+             "last_seen": cell.get("last_seen", cell["timestamp"]), "corrected": False}
+            for cell in fresh.values()
+        ], returning=(Passage.crew_id, Passage.checkpoint_id)))
+    # Buňky, které mezitím založil souběžný požadavek: platí dřívější z obou časů
+    # a sken buňku jen posouvá, první průchod ohlásil souběžný požadavek
+    for crew_id, checkpoint_id in set(fresh) - inserted:
+        first_ids.discard(fresh[(crew_id, checkpoint_id)]["client_id"])
+        moved_ids.add(fresh[(crew_id, checkpoint_id)]["client_id"])
+        db.session.execute(
+            sa.update(Passage).where(
+                Passage.crew_id == crew_id, Passage.checkpoint_id == checkpoint_id,
+                Passage.corrected.is_(False), Passage.timestamp > fresh[(crew_id, checkpoint_id)]["timestamp"]
+            ).values(timestamp=fresh[(crew_id, checkpoint_id)]["timestamp"]),
+            execution_options={"synchronize_session": False}
+        )
+        moved.add((crew_id, checkpoint_id))
+
+    insert_ignoring_conflicts(ScanRecord, ["client_id"], kept)
+    refresh_penalties(inserted | moved)
+    count_first_passages(inserted)
+
+    by_race = {}
+    for row in kept:
+        by_race.setdefault(race_of_checkpoint[row["checkpoint_id"]], []).append(
+            (row["crew_id"], row["checkpoint_id"], row["timestamp"],
+             row["client_id"] in first_ids, row["client_id"] in moved_ids)
+        )
+    for race_id, race_scans in by_race.items():
+        publish_scans(race_id, race_scans)
+    return skipped
+
+# Volitelný režim write-behind: průchody se potvrzují po zápisu do lokálního
+# žurnálu a do databáze se ukládají po dávkách vláknem zapisovače
+SCAN_WRITE_BEHIND = os.getenv("SCAN_WRITE_BEHIND", "0") == "1"
+
+def scans_write_behind():
+    # Terénní uzel zapisuje průchody vždy jediným vláknem zapisovače
+    return SCAN_WRITE_BEHIND or bool(current_app.config.get("FIELD_NODE_ID"))
+
+def journal_row(row):
+    return {**row, "timestamp": row["timestamp"].isoformat()}
 
-    scan = ScanRecord(
-        crew_id=crew.id,
-        checkpoint_id=checkpoint.id,
-        timestamp=now  
+def store_journaled_scans(app, rows):
+    # Volá vlákno zapisovače; posádky a checkpointy smazané mezi potvrzením
+    # a uložením se přeskočí, jinak by dávka nešla nikdy uložit
+    with app.app_context():
+        crew_ids = {
+            crew_id for (crew_id,) in db.session.query(Crew.id)
+            .filter(Crew.id.in_({row["crew_id"] for row in rows}))
+        }
+        checkpoint_ids = {
+            ck_id for (ck_id,) in db.session.query(Checkpoint.id)
+            .filter(Checkpoint.id.in_({row["checkpoint_id"] for row in rows}))
+        }
+        rows = {
+            row["client_id"]: {**row, "timestamp": datetime.fromisoformat(row["timestamp"])}
+            for row in rows if row["crew_id"] in crew_ids and row["checkpoint_id"] in checkpoint_ids
+        }
+        if rows:
+            store_scans(list(rows.values()))
+            db.session.commit()
+    if "field_sync" in app.extensions:
+        app.extensions["field_sync"].wake()
+
+@bp.route("/scan/batch", methods=["POST"])
+def scan_batch():
+    """Uloží dávku průchodů ze skeneru (i offline fronty) v jedné transakci.
+
+    Každý průchod nese vlastní UUID (id) a čas ze zařízení (timestamp).
+    Opakované odeslání stejného UUID se jen potvrdí, nový řádek nevznikne.
+    """
+    payload = request.get_json(silent=True) or {}
+    scans = payload.get("scans")
+    if not isinstance(scans, list):
+        return jsonify({"status": "error", "message": "Chybí seznam scans"}), 400
+
+    results, rows = parse_scan_items(scans)
+    if rows:
+        if scans_write_behind():
+            skipped = {
+                cid: "duplicate" for (cid,) in db.session.query(ScanRecord.client_id)
+                .filter(ScanRecord.client_id.in_(list(rows))).all()
+            }
+            current_app.extensions["scan_writer"].submit([journal_row(row) for cid, row in rows.items() if cid not in skipped])
+        else:
+            skipped = store_scans(list(rows.values()))
+            db.session.commit()
+        for result in results:
+            if result["id"] in skipped:
+                result["status"] = "duplicate"
+                if skipped[result["id"]] == "debounced":
+                    result["message"] = "Opakovaný sken – průchod už je zaznamenán"
+
+    return jsonify({"status": "ok", "results": results})
+
+def parse_scan_items(scans):
+    """Ověří průchody ze skeneru nebo z logu terénního uzlu.
+
+    Vrací (výsledky pro odpověď, {client_id: řádek pro store_scans}).
+    """
+    crew_ids = {s.get("crew_id") for s in scans if isinstance(s, dict)}
+    checkpoint_ids = {s.get("checkpoint_id") for s in scans if isinstance(s, dict)}
+    crews = {c.id: c for c in Crew.query.filter(Crew.id.in_(crew_ids)).all()}
+    checkpoints = {ck.id: ck for ck in Checkpoint.query.filter(Checkpoint.id.in_(checkpoint_ids)).all()}
+
+    results = []
+    rows = {}
+    for item in scans:
+        if not isinstance(item, dict):
+            results.append({"id": None, "status": "error", "message": "Neplatný záznam"})
+            continue
+        client_id = str(item.get("id") or "")
+        crew = crews.get(item.get("crew_id"))
+        checkpoint = checkpoints.get(item.get("checkpoint_id"))
+        result = {"id": client_id}
+        try:
+            uuid.UUID(client_id)
+            timestamp = parse_client_timestamp(item.get("timestamp"))
+        except ValueError:
+            result.update(status="error", message="Neplatné id nebo čas průchodu")
+        else:
+            if not crew or not checkpoint:
+                result.update(status="error", message="Neznámá posádka nebo kontrolní bod")
+            elif crew.race_id != checkpoint.race_id:
+                result.update(status="error", message="Posádka nepatří do závodu tohoto kontrolního bodu")
+            else:
+                rows[client_id] = {
+                    "crew_id": crew.id,
+                    "checkpoint_id": checkpoint.id,
+                    "timestamp": timestamp,
+                    "client_id": client_id
+                }
+                result.update(
+                    status="ok",
+                    message=f"Zaznamenán průchod posádky {crew.name} na {checkpoint.name} v {timestamp.astimezone(ZoneInfo('Europe/Prague')).strftime('%Y-%m-%d %H:%M:%S')}"
+                )
+        results.append(result)
+    return results, rows
+
+
+# Terénní uzel (FIELD_NODE_ID): lokální SQLite, průchody jdou do append-only
+# logu a LogShipper je odesílá na centrálu (FIELD_CENTRAL_URL)
+def append_scan_log(rows):
+    # Necommituje – záznam logu vzniká ve stejné transakci jako průchod
+    insert_ignoring_conflicts(ScanLog, ["client_id"], [
+        {"client_id": row["client_id"], "crew_id": row["crew_id"],
+         "checkpoint_id": row["checkpoint_id"], "timestamp": row["timestamp"]}
+        for row in rows
+    ])
+
+def read_scan_log(app, after, limit):
+    with app.app_context():
+        entries = ScanLog.query.filter(ScanLog.seq > after).order_by(ScanLog.seq).limit(limit).all()
+        return [
+            {"seq": e.seq, "id": e.client_id, "crew_id": e.crew_id,
+             "checkpoint_id": e.checkpoint_id, "timestamp": e.timestamp.isoformat()}
+            for e in entries
+        ]
+
+def advance_sync_cursor(node_id, position):
+    # Kurzor se jen posouvá dopředu, i když dávky dorazí dvakrát nebo mimo pořadí
+    insert_ignoring_conflicts(SyncCursor, ["node_id"], [{"node_id": node_id, "position": 0}])
+    db.session.execute(
+        sa.update(SyncCursor).where(SyncCursor.node_id == node_id, SyncCursor.position < position)
+        .values(position=position, updated_at=get_czech_time()),
+        execution_options={"synchronize_session": False}
     )
-    db.session.add(scan)
+
+def save_node_cursor(app, position):
+    with app.app_context():
+        advance_sync_cursor(app.config["FIELD_NODE_ID"], position)
+        db.session.commit()
+
+def check_sync_token():
+    token = current_app.config.get("FIELD_SYNC_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        abort(403)
+
+def sync_position(node_id):
+    return db.session.query(SyncCursor.position).filter(SyncCursor.node_id == node_id).scalar() or 0
+
+@bp.route("/sync/<node_id>/cursor")
+def sync_cursor(node_id):
+    """Do jakého pořadového čísla má centrála log terénního uzlu sloučený."""
+    check_sync_token()
+    return jsonify({"node": node_id, "position": sync_position(node_id)})
+
+@bp.route("/sync/<node_id>/scans", methods=["POST"])
+def sync_scans(node_id):
+    """Sloučí dávku logu terénního uzlu ({"entries": [{seq, id, crew_id, checkpoint_id, timestamp}]}).
+
+    Průchody i posun kurzoru jsou v jedné transakci. Sloučení je idempotentní
+    podle client_id; neplatné záznamy se přeskočí, aby nezablokovaly log.
+    """
+    check_sync_token()
+    entries = (request.get_json(silent=True) or {}).get("entries")
+    if not isinstance(entries, list):
+        return jsonify({"status": "error", "message": "Chybí seznam entries"}), 400
+
+    results, rows = parse_scan_items(entries)
+    skipped = store_scans(list(rows.values())) if rows else {}
+    position = max([safe_int(e.get("seq")) for e in entries if isinstance(e, dict)], default=0)
+    advance_sync_cursor(node_id, position)
+    db.session.commit()
+    return jsonify({
+        "status": "ok",
+        "node": node_id,
+        "position": sync_position(node_id),
+        "stored": len(rows) - len(skipped),
+        "duplicate": len(skipped),
+        "rejected": sum(1 for r in results if r.get("status") == "error"),
+    })
+
+def apply_manifest(manifest):
+    """Převezme soupisku závodu z centrály se stejnými id (terénní uzel)."""
+    race_id = manifest["race_id"]
+    start_time = manifest.get("start_time")
+    db.session.merge(Race(id=race_id, name=manifest.get("name"), crew_interval=manifest.get("crew_interval"),
+                          start_time=datetime.fromisoformat(start_time) if start_time else None))
+    for ck in manifest["checkpoints"]:
+        db.session.merge(Checkpoint(id=ck["id"], name=ck["name"], order=ck["order"], race_id=race_id))
+    for crew in manifest["crews"]:
+        db.session.merge(Crew(id=crew["id"], number=crew["number"], name=crew["name"],
+                              is_active=crew["active"], race_id=race_id))
+    db.session.flush()
+    refresh_standings(crew["id"] for crew in manifest["crews"])
+    recount_race_counters(race_id)
+    publish_event(race_id, "crew", {"action": "synced"})
     db.session.commit()
+    return len(manifest["crews"])
 
+
+def passage_cell(crew_id, checkpoint_id):
+    crew = Crew.query.get_or_404(crew_id)
+    checkpoint = Checkpoint.query.get_or_404(checkpoint_id)
+    if crew.race_id != checkpoint.race_id:
+        abort(400, "Posádka nepatří do závodu tohoto kontrolního bodu")
+    return crew, checkpoint
+
+@bp.route("/passage/<int:crew_id>/<int:checkpoint_id>", methods=["POST"])
+def correct_passage(crew_id, checkpoint_id):
+    """Ruční oprava času prvního průchodu (timestamp v ISO 8601, bez zóny pražský).
+
+    Chybějící průchod se založí. Opravený čas už žádný další sken nezmění.
+    """
+    crew, checkpoint = passage_cell(crew_id, checkpoint_id)
+    payload = request.get_json(silent=True) or request.form
+    try:
+        timestamp = parse_client_timestamp(payload.get("timestamp"))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Neplatný čas průchodu"}), 400
+
+    passage = Passage.query.filter_by(crew_id=crew.id, checkpoint_id=checkpoint.id).first()
+    if passage is None:
+        passage = Passage(crew_id=crew.id, checkpoint_id=checkpoint.id, timestamp=timestamp, last_seen=timestamp)
+        db.session.add(passage)
+        count_first_passages([(crew.id, checkpoint.id)])
+    passage.timestamp = timestamp
+    passage.corrected = True
+    db.session.flush()
+    refresh_penalties([(crew.id, checkpoint.id)])
+    publish_event(crew.race_id, "passage", {
+        "action": "corrected", "crew_id": crew.id, "checkpoint_id": checkpoint.id, "time": timestamp.isoformat()
+    })
+    db.session.commit()
     return jsonify({
         "status": "ok",
-        "message": f"Zaznamenán průchod posádky {crew.name} na {checkpoint.name} v {scan.timestamp.astimezone(ZoneInfo('Europe/Prague')).strftime('%Y-%m-%d %H:%M:%S')}"
+        "message": f"Průchod posádky {crew.name} na {checkpoint.name} opraven na {timestamp.strftime('%H:%M:%S')}"
     })
 
+@bp.route("/passage/<int:crew_id>/<int:checkpoint_id>/delete", methods=["POST"])
+def delete_passage(crew_id, checkpoint_id):
+    """Smaže chybný průchod (např. naskenovaná jiná posádka).
+
+    Smažou se i skeny buňky, jinak by ho doplnění průchodů ze skenů obnovilo.
+    """
+    crew, checkpoint = passage_cell(crew_id, checkpoint_id)
+    passage = Passage.query.filter_by(crew_id=crew.id, checkpoint_id=checkpoint.id).first_or_404()
+    count_first_passages([(crew.id, checkpoint.id)], delta=-1)
+    db.session.delete(passage)
+    ScanRecord.query.filter_by(crew_id=crew.id, checkpoint_id=checkpoint.id).delete()
+    db.session.flush()
+    refresh_penalties([(crew.id, checkpoint.id)])
+    publish_event(crew.race_id, "passage", {"action": "deleted", "crew_id": crew.id, "checkpoint_id": checkpoint.id})
+    db.session.commit()
+    return jsonify({"status": "ok", "message": f"Průchod posádky {crew.name} na {checkpoint.name} smazán"})
+
+@bp.route("/race/<int:race_id>/events")
+def race_events(race_id):
+    """SSE proud změn závodu (průchody, ideální časy, posádky).
+
+    Po výpadku spojení prohlížeč pošle Last-Event-ID a zmeškané události
+    se nejdřív doplní z databáze.
+    """
+    Race.query.get_or_404(race_id)
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    missed = []
+    if last_event_id is not None:
+        missed = fetch_events(RaceEvent.query.filter(RaceEvent.race_id == race_id, RaceEvent.id > last_event_id))
+    event_hub = current_app.extensions["event_hub"]
+    subscriber = event_hub.subscribe(race_id)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            sent = 0
+            for event_id, _, kind, data in missed:
+                sent = event_id
+                yield format_sse(event_id, kind, data)
+            while True:
+                try:
+                    event_id, kind, data = subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event_id > sent:
+                    yield format_sse(event_id, kind, data)
+        finally:
+            event_hub.unsubscribe(race_id, subscriber)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
-@app.route("/scan")
+
+@bp.route("/scan")
 def scan_page():
     checkpoints = Checkpoint.query.order_by(Checkpoint.order).all()
     return render_template("scan_qr.html", checkpoints=checkpoints)
 
 
-@app.route("/scan/<int:checkpoint_id>")
+@bp.route("/scan/<int:checkpoint_id>")
 def scan_checkpoint(checkpoint_id):
     checkpoint = Checkpoint.query.get_or_404(checkpoint_id)
-    checkpoints = Checkpoint.query.order_by(Checkpoint.order).all()
-
-    total_crews = Crew.query.count()
-
-    passed_crew_ids = db.session.query(ScanRecord.crew_id)\
-        .filter_by(checkpoint_id=checkpoint_id)\
-        .distinct().all()
-    passed_count = len(passed_crew_ids)
-    remaining = total_crews - passed_count
+    checkpoints = Checkpoint.query.filter_by(race_id=checkpoint.race_id).order_by(Checkpoint.order).all()
 
     return render_template(
         "scan_qr.html",
         checkpoint=checkpoint,
         checkpoints=checkpoints,
-        total_crews=total_crews,
-        passed_count=passed_count,
-        remaining=remaining
+        **checkpoint_counters(checkpoint.id)
     )
 
+@bp.route("/api/checkpoint/<int:checkpoint_id>/counters")
+def checkpoint_counters_api(checkpoint_id):
+    """Počitadla stanoviště pro pravidelné dotazování z telefonů.
+
+    Čte jen předpočítané sloupce; nezměněná počitadla vrátí 304.
+    """
+    counters = checkpoint_counters(checkpoint_id)
+    if counters is None:
+        abort(404)
+    response = jsonify({"checkpoint_id": checkpoint_id, **counters})
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.headers["Cache-Control"] = "max-age=2"
+    return response.make_conditional(request)
+
+
+def build_scan_manifest(race_id, version):
+    checkpoints = db.session.query(Checkpoint.id, Checkpoint.name, Checkpoint.order)\
+        .filter_by(race_id=race_id).order_by(Checkpoint.order)
+    crews = db.session.query(Crew.id, Crew.number, Crew.name, Crew.is_active)\
+        .filter_by(race_id=race_id).order_by(Crew.start_number, Crew.id)
+    name, start_time, crew_interval = db.session.query(Race.name, Race.start_time, Race.crew_interval)\
+        .filter(Race.id == race_id).one()
+    return json.dumps({
+        "race_id": race_id,
+        "name": name,
+        "start_time": start_time.isoformat() if start_time else None,
+        "crew_interval": crew_interval,
+        "version": version,
+        "checkpoints": [{"id": ck_id, "name": name, "order": order} for ck_id, name, order in checkpoints],
+        "crews": [
+            {"id": crew_id, "number": number, "name": name, "active": bool(is_active)}
+            for crew_id, number, name, is_active in crews
+        ],
+    }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+@bp.route("/race/<int:race_id>/scan_manifest.json")
+def scan_manifest(race_id):
+    """Posádky a checkpointy závodu pro ověření QR kódu přímo v telefonu.
+
+    ETag je verze soupisky závodu, takže skeny manifest nezneplatní.
+    Tělo se jednou zkomprimuje gzipem a drží v cache odpovědí.
+    """
+    version = db.session.query(Race.roster_version).filter(Race.id == race_id).scalar()
+    if version is None:
+        abort(404)
+    if version in request.if_none_match:
+        response = Response(status=304)
+    else:
+        key = ("scan_manifest", race_id, version)
+        cached = response_cache.get(key)
+        if cached is None:
+            cached = (gzip.compress(build_scan_manifest(race_id, version), 6), "application/json", {})
+            response_cache.put(key, *cached)
+        body = cached[0]
+        response = Response(content_type="application/json")
+        if "gzip" in request.accept_encodings:
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            body = gzip.decompress(body)
+        response.set_data(body)
+    response.set_etag(version)
+    response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+# Historie průchodů se stránkuje podle (timestamp, id) od nejnovějších
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 500
+HISTORY_FILTERS = ("race_id", "checkpoint_id", "crew_id")
+
+def encode_history_cursor(scan):
+    raw = f"{scan.timestamp.isoformat()}|{scan.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_history_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    timestamp, scan_id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(timestamp), int(scan_id)
+
+def parse_history_time(value):
+    # Čas z formuláře (datetime-local) bez zóny se bere jako pražský
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=ZoneInfo("Europe/Prague"))
+    return timestamp
+
+def history_filters(args):
+    """Filtry historie z parametrů požadavku; ValueError při chybné hodnotě."""
+    filters = {name: int(args[name]) for name in HISTORY_FILTERS if args.get(name)}
+    for name in ("since", "until"):
+        if args.get(name):
+            filters[name] = parse_history_time(args[name])
+    return filters
+
+def history_page(filters, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """Jedna stránka průchodů i s posádkou a checkpointem v jediném dotazu.
+
+    Vrací (průchody, kurzor další stránky nebo None). Kurzor je poslední
+    (timestamp, id), takže hloubka stránkování nemění cenu dotazu.
+    """
+    query = ScanRecord.query\
+        .join(ScanRecord.crew).join(ScanRecord.checkpoint)\
+        .options(contains_eager(ScanRecord.crew), contains_eager(ScanRecord.checkpoint))
+    if "race_id" in filters:
+        query = query.filter(Checkpoint.race_id == filters["race_id"])
+    if "checkpoint_id" in filters:
+        query = query.filter(ScanRecord.checkpoint_id == filters["checkpoint_id"])
+    if "crew_id" in filters:
+        query = query.filter(ScanRecord.crew_id == filters["crew_id"])
+    if "since" in filters:
+        query = query.filter(ScanRecord.timestamp >= filters["since"])
+    if "until" in filters:
+        query = query.filter(ScanRecord.timestamp < filters["until"])
+    if cursor:
+        timestamp, scan_id = decode_history_cursor(cursor)
+        query = query.filter(sa.or_(
+            ScanRecord.timestamp < timestamp,
+            sa.and_(ScanRecord.timestamp == timestamp, ScanRecord.id < scan_id)
+        ))
+    scans = query.order_by(ScanRecord.timestamp.desc(), ScanRecord.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_history_cursor(scans[limit - 1]) if len(scans) > limit else None
+    return scans[:limit], next_cursor
+
+def history_request():
+    # Filtry, kurzor a velikost stránky z query stringu; None při chybném parametru
+    try:
+        filters = history_filters(request.args)
+        limit = min(max(request.args.get("limit", HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+        return filters, history_page(filters, request.args.get("after"), limit)
+    except ValueError:
+        return None
 
-@app.route("/history")
+@bp.route("/history")
 def history():
-    scans = ScanRecord.query.order_by(ScanRecord.timestamp.desc()).limit(100).all()
-    checkpoints = Checkpoint.query.order_by(Checkpoint.order).all()
-    return render_template("history.html", scans=scans, checkpoints=checkpoints)
+    result = history_request()
+    if result is None:
+        return "Neplatný filtr nebo kurzor historie", 400
+    filters, (scans, next_cursor) = result
 
-@app.route("/history/checkpoint/<int:checkpoint_id>")
-def history_checkpoint(checkpoint_id):
-    checkpoint = Checkpoint.query.options(
-        joinedload(Checkpoint.ideal_times).joinedload(IdealTime.crew)
-    ).get_or_404(checkpoint_id)
+    races = Race.query.order_by(Race.start_time.desc()).all()
+    checkpoints = Checkpoint.query.order_by(Checkpoint.race_id, Checkpoint.order)
+    crews = []
+    if "race_id" in filters:
+        checkpoints = checkpoints.filter(Checkpoint.race_id == filters["race_id"])
+        crews = Crew.query.filter_by(race_id=filters["race_id"]).order_by(Crew.start_number, Crew.number).all()
+    next_url = None
+    if next_cursor:
+        next_url = url_for("main.history", **{**request.args.to_dict(), "after": next_cursor})
+    return render_template("history.html", scans=scans, races=races, checkpoints=checkpoints.all(),
+                           crews=crews, filters=request.args, next_url=next_url, to_prague=to_prague)
+
+@bp.route("/api/history")
+def history_api():
+    """Průchody od nejnovějších, filtry race_id, checkpoint_id, crew_id, since, until.
+
+    Další stránka se načte s parametrem after=<next> z předchozí odpovědi.
+    """
+    result = history_request()
+    if result is None:
+        return jsonify({"status": "error", "message": "Neplatný filtr nebo kurzor"}), 400
+    _, (scans, next_cursor) = result
+    return jsonify({
+        "scans": [{
+            "id": scan.id,
+            "timestamp": to_prague(scan.timestamp).isoformat(),
+            "race_id": scan.checkpoint.race_id,
+            "crew_id": scan.crew_id,
+            "crew_number": scan.crew.number,
+            "crew_name": scan.crew.name,
+            "checkpoint_id": scan.checkpoint_id,
+            "checkpoint_name": scan.checkpoint.name,
+        } for scan in scans],
+        "next": next_cursor,
+    })
 
-    # Všechny posádky v závodě (aktivní i neaktivní), seřazené podle čísla
+def to_prague(timestamp):
+    # Postgres vrací čas s časovou zónou, SQLite bez ní (uložený už v pražském čase)
+    if timestamp is not None and timestamp.tzinfo is not None:
+        return timestamp.astimezone(ZoneInfo("Europe/Prague"))
+    return timestamp
+
+def boundary_crew_ideal(checkpoint_id, last=False):
+    # Ideální čas první/poslední aktivní posádky přímo z databáze
+    order = Crew.start_number.desc() if last else Crew.start_number
+    return db.session.query(IdealTime.ideal_time).join(Crew, IdealTime.crew_id == Crew.id)\
+        .filter(IdealTime.checkpoint_id == checkpoint_id,
+                Crew.is_active.is_(True),
+                Crew.start_number.isnot(None))\
+        .order_by(order).limit(1).scalar()
+
+def checkpoint_progress(checkpoint):
+    """Průchody checkpointem pro všechny posádky závodu.
+
+    Každá tabulka se čte jediným dotazem a páruje se přes slovníky podle
+    crew_id, takže cena roste lineárně s počtem posádek.
+    """
     all_crews = Crew.query.filter_by(race_id=checkpoint.race_id)\
-        .order_by(cast(Crew.number, Integer)).all()
-    total_crews = len(all_crews)
-
-    # Posádky, které už prošly checkpointem
-    passed_crews = db.session.query(Crew).join(ScanRecord)\
-        .filter(ScanRecord.checkpoint_id == checkpoint_id)\
-        .order_by(cast(Crew.number, Integer)).all()
-    passed_count = len(passed_crews)
-
-    # Načteme všechny ideální časy pro tento checkpoint najednou
-    ideal_times = {it.crew_id: it for it in checkpoint.ideal_times}
-
-    # Propojení dat
-    crew_data = []
-    for crew in all_crews:
-        scan = next((s for s in passed_crews if s.id == crew.id), None)
-        ideal_time = ideal_times.get(crew.id)
-
-        crew_data.append({
-            'crew': crew,
-            'scan': scan,
-            'ideal_time': ideal_time.ideal_time if ideal_time else None
-        })
+        .order_by(Crew.start_number).all()
 
-    # Najdeme ideální čas pro aktivní posádku č. 1
-    first_crew_ideal = next((
-    it for it in sorted(checkpoint.ideal_times, key=lambda x: int(x.crew.number))
-    if it.crew.is_active
-    ), None)
-
-    # Najdeme ideální čas pro poslední aktivní posádku
-    active_crews = [c for c in all_crews if c.is_active and c.number.isdigit()]
-    if active_crews:
-        sorted_active_crews = sorted(active_crews, key=lambda c: int(c.number))
-        last_number = sorted_active_crews[-1].number
-        last_crew_ideal = next(
-            (it for it in checkpoint.ideal_times if it.crew.number == last_number),
-            None
-        )
-    else:
-        last_crew_ideal = None
+    # První průchod každé posádky tímto checkpointem
+    first_passage = dict(
+        db.session.query(Passage.crew_id, Passage.timestamp)
+        .filter(Passage.checkpoint_id == checkpoint.id)
+    )
+    ideal_times = dict(
+        db.session.query(IdealTime.crew_id, IdealTime.ideal_time)
+        .filter(IdealTime.checkpoint_id == checkpoint.id)
+    )
 
+    crew_data = [{
+        'crew': crew,
+        'passed_at': to_prague(first_passage.get(crew.id)),
+        'ideal_time': ideal_times.get(crew.id)
+    } for crew in all_crews]
+    passed_count = sum(1 for data in crew_data if data['passed_at'] is not None)
+
+    return {
+        'crew_data': crew_data,
+        'total_crews': len(all_crews),
+        'passed_count': passed_count,
+        'remaining': len(all_crews) - passed_count,
+        'first_crew_ideal': boundary_crew_ideal(checkpoint.id),
+        'last_crew_ideal': boundary_crew_ideal(checkpoint.id, last=True),
+    }
+
+@bp.route("/history/checkpoint/<int:checkpoint_id>")
+@versioned_page(checkpoint_race_version)
+def history_checkpoint(checkpoint_id):
+    checkpoint = Checkpoint.query.get_or_404(checkpoint_id)
     return render_template("history_checkpoint.html",
         checkpoint=checkpoint,
-        crew_data=crew_data,
-        total_crews=total_crews,
-        passed_count=passed_count,
-        remaining=total_crews - passed_count,
-        first_crew_ideal=first_crew_ideal,
-        last_crew_ideal=last_crew_ideal
+        **checkpoint_progress(checkpoint)
     )
 
+@bp.route("/api/checkpoint/<int:checkpoint_id>/progress")
+@versioned_page(checkpoint_race_version)
+def checkpoint_progress_api(checkpoint_id):
+    checkpoint = Checkpoint.query.get_or_404(checkpoint_id)
+    progress = checkpoint_progress(checkpoint)
+
+    def clock(value):
+        return value.strftime('%H:%M') if value else None
 
-@app.route('/race/<int:race_id>/setup_ideal_times', methods=['GET', 'POST'])
+    return jsonify({
+        "checkpoint": {"id": checkpoint.id, "name": checkpoint.name, "race_id": checkpoint.race_id},
+        "total_crews": progress['total_crews'],
+        "passed_count": progress['passed_count'],
+        "remaining": progress['remaining'],
+        "first_crew_ideal": clock(progress['first_crew_ideal']),
+        "last_crew_ideal": clock(progress['last_crew_ideal']),
+        "crews": [{
+            "id": data['crew'].id,
+            "number": data['crew'].number,
+            "name": data['crew'].name,
+            "is_active": data['crew'].is_active,
+            "ideal_time": clock(data['ideal_time']),
+            "passed_at": data['passed_at'].isoformat() if data['passed_at'] else None,
+        } for data in progress['crew_data']]
+    })
+
+
+@bp.route('/race/<int:race_id>/setup_ideal_times', methods=['GET', 'POST'])
 def setup_ideal_times(race_id):
     race = Race.query.get_or_404(race_id)
     checkpoints = Checkpoint.query.filter_by(race_id=race_id).order_by(Checkpoint.order).all()
-    crews = Crew.query.filter_by(race_id=race_id).order_by(Crew.number).all()
+    crews = Crew.query.filter_by(race_id=race_id).order_by(Crew.start_number).all()
 
     if request.method == 'POST':
         try:
@@ -607,48 +2138,28 @@ def setup_ideal_times(race_id):
                 except (ValueError, AttributeError):
                     return f"Neplatný formát intervalu mezi {checkpoints[i-1].name} a {checkpoints[i].name}. Použijte MM:SS", 400
 
-            # NEBEGINUJEME novou transakci, Flask-SQLAlchemy už ji spravuje
-            
-            # Smazání starých časů pro tento závod
-            IdealTime.query.filter(
-                IdealTime.crew_id.in_([c.id for c in crews]),
-                IdealTime.checkpoint_id.in_([ck.id for ck in checkpoints])
-            ).delete(synchronize_session=False)
-
             # Výpočet základního data
             base_date = race.start_time.date() if race.start_time else datetime.now().date()
             current_time = datetime.combine(base_date, start_time)
 
-            # Výpočet časů pro posádku č. 1
+            # Výpočet časů pro první aktivní posádku
             checkpoint_times = [current_time]
             for i in range(1, len(checkpoints)):
                 checkpoint_times.append(checkpoint_times[i-1] + intervals[i-1])
+            base_times = {ck.id: t for ck, t in zip(checkpoints, checkpoint_times)}
 
-            # Seřadíme posádky podle čísla
-            sorted_crews = sorted(crews, key=lambda c: int(c.number))
-            
-            # Uložení časů pro všechny posádky
-            for index, crew in enumerate(sorted_crews):  # index 0 = první posádka
-                for checkpoint, ideal_time in zip(checkpoints, checkpoint_times):
-                    # Rozestup 1 minuta mezi každou posádkou
-                    crew_ideal_time = ideal_time + timedelta(minutes=index)
-                    
-                    ideal_record = IdealTime(
-                        crew_id=crew.id,
-                        checkpoint_id=checkpoint.id,
-                        ideal_time=crew_ideal_time.time()
-                    )
-                    db.session.add(ideal_record)
-                    
             # Aktualizace názvů checkpointů podle formuláře
-
             for ck in checkpoints:
                 new_name = request.form.get(f"name_{ck.id}")
                 if new_name:
                     ck.name = new_name
+            publish_event(race.id, "checkpoints", {"action": "updated"})
 
-            db.session.commit()
-            return redirect(url_for('checkpoint_overview', race_id=race_id, success=True))
+            # Stejný výpočet jako při přepočtu – posádky v rozestupu race.crew_interval,
+            # zapíšou se jen změněné řádky (a názvy CK) v jedné transakci
+            schedule = compute_ideal_schedule(race, active_crews_in_order(crews), base_times)
+            apply_ideal_schedule(race.id, schedule)
+            return redirect(url_for('main.checkpoint_overview', race_id=race_id, success=True))
 
         except Exception as e:
             db.session.rollback()
@@ -659,7 +2170,8 @@ def setup_ideal_times(race_id):
                          checkpoints=checkpoints,
                          crews=crews)
 
-@app.route("/race/<int:race_id>/checkpoints")
+@bp.route("/race/<int:race_id>/checkpoints")
+@versioned_page(race_version)
 def checkpoint_overview(race_id):
     race = Race.query.get_or_404(race_id)
     checkpoints = Checkpoint.query.filter_by(race_id=race_id).order_by(Checkpoint.order).all()
@@ -672,120 +2184,336 @@ def checkpoint_overview(race_id):
 
     return render_template("checkpoints.html", race=race, checkpoints=checkpoints, ideal_times=times)
 
-@app.route('/race/<int:race_id>/export_results')
-def export_results(race_id):
-    race = Race.query.get_or_404(race_id)
-    crews = Crew.query.filter_by(race_id=race_id).all()
-    checkpoints = Checkpoint.query.filter_by(race_id=race_id).order_by(Checkpoint.order).all()
-
-    ideal_times = IdealTime.query.filter(
-        IdealTime.crew_id.in_([c.id for c in crews]),
-        IdealTime.checkpoint_id.in_([ck.id for ck in checkpoints])
-    ).all()
-
-    scan_records = ScanRecord.query.filter(
-        ScanRecord.crew_id.in_([c.id for c in crews]),
-        ScanRecord.checkpoint_id.in_([ck.id for ck in checkpoints])
-    ).order_by(ScanRecord.timestamp).all()
-
-    ideal_dict = {(i.crew_id, i.checkpoint_id): i.ideal_time for i in ideal_times}
-    scan_dict = {}
-    for s in scan_records:
-        key = (s.crew_id, s.checkpoint_id)
-        if key not in scan_dict:
-            scan_dict[key] = s.timestamp.astimezone(ZoneInfo("Europe/Prague"))
-
-    rows = []
-
+def result_columns(checkpoints):
+    # (název, typ) sloupců exportu výsledků
+    columns = [
+        ("Číslo", "text"),
+        ("Jméno", "text"),
+        ("Vozidlo", "text"),
+        ("Třída", "text"),
+        ("Rok výroby", "int"),
+        ("Trestne body za rv auta", "int"),
+    ]
+    for ck in checkpoints:
+        columns += [
+            (f"{ck.name} - Ideál", "text"),
+            (f"{ck.name} - Skutečnost", "text"),
+            (f"{ck.name} - Body", "int"),
+        ]
+    columns.append(("Celkem body", "int"))
+    return columns
+
+def iter_result_rows(crews, checkpoints, scores):
+    # Řádky se skládají postupně, celá tabulka výsledků nikdy není v paměti
+    for i, crew in enumerate(crews):
+        row = [
+            crew.number,
+            crew.name or "",
+            crew.vehicle or "",
+            crew.category or "",
+            safe_int(crew.vehicle_year),
+            safe_int(crew.penalty_year),
+        ]
+        for j in range(len(checkpoints)):
+            row += [
+                format_seconds(scores.ideal[i, j]),
+                format_seconds(scores.real[i, j]),
+                int(scores.penalties[i, j]),
+            ]
+        row.append(int(scores.totals[i]))
+        yield row
+
+def result_column_widths(columns, crews):
+    # Časy (HH:MM) a body mají pevnou šířku, proměnlivé jsou jen textové
+    # údaje posádky – šířky tak stačí spočítat z posádek před zápisem řádků
+    widths = [len(name) for name, _ in columns]
     for crew in crews:
-        vehicle_year = safe_int(crew.vehicle_year)
-        penalty_year = safe_int(crew.penalty_year)
-    
-        row = {
-            "Číslo": crew.number,
-            "Jméno": crew.name,
-            "Vozidlo": crew.vehicle,
-            "Třída": crew.category,
-            "Rok výroby": vehicle_year,
-            "Trestne body za rv auta": penalty_year
-        }
-    
-        total_penalty = 0
-    
-        for ck in checkpoints:
-            ideal = ideal_dict.get((crew.id, ck.id))
-            real = scan_dict.get((crew.id, ck.id))
-        
-            # Převod časových zón
-            if ideal:
-                ideal = ideal.astimezone(ZoneInfo("Europe/Prague"))
-                ideal_time = ideal.time()
-                row[f"{ck.name} - Ideál"] = ideal.strftime("%H:%M")
-            else:
-                ideal_time = None
-                row[f"{ck.name} - Ideál"] = "-"
-        
-            if real:
-                real = real.astimezone(ZoneInfo("Europe/Prague"))
-                real_time = real.time()
-                row[f"{ck.name} - Skutečnost"] = real.strftime("%H:%M")
-            else:
-                real_time = None
-                row[f"{ck.name} - Skutečnost"] = "-"
-        
-            # Výpočet penalizace
-            if ideal_time and real_time:
-                diff = abs(
-                    (datetime.combine(datetime.today(), real_time) -
-                     datetime.combine(datetime.today(), ideal_time)).total_seconds()
-                ) / 60
-                penalty = min(int(diff) * 10, 100)
-            else:
-                penalty = 100
-        
-            row[f"{ck.name} - Body"] = penalty
-            total_penalty += penalty
-    
-            row[f"{ck.name} - Body"] = penalty
-            total_penalty += penalty
-    
-        total_penalty += penalty_year
-        row["Celkem body"] = total_penalty
-        rows.append(row)
-
+        values = (crew.number, crew.name, crew.vehicle, crew.category,
+                  safe_int(crew.vehicle_year), safe_int(crew.penalty_year))
+        for i, value in enumerate(values):
+            widths[i] = max(widths[i], len(str(value or "")))
+    return [max(width, 5) + 2 for width in widths]
+
+def run_export_job(job_id, race_id, params, directory):
+    export_format = params["format"]
+    crews = Crew.query.filter_by(race_id=race_id).order_by(Crew.start_number).all()
+    checkpoints = Checkpoint.query.filter_by(race_id=race_id).order_by(Checkpoint.order).all()
+    update_job(job_id, total=len(crews))
 
+    scores = load_race_scores(crews, checkpoints)
+    columns = result_columns(checkpoints)
+    rows = job_progress(job_id, iter_result_rows(crews, checkpoints, scores))
 
-    df = pd.DataFrame(rows)
+    if export_format == "csv":
+        chunks = iter_csv(columns, rows)
+    elif export_format == "parquet":
+        chunks = stream_file(write_parquet(columns, rows))
+    else:
+        chunks = stream_file(write_xlsx(columns, rows, result_column_widths(columns, crews)))
+    write_job_result(directory, chunks)
+    return {
+        "message": f"Výsledky {len(crews)} posádek",
+        "result_name": f"vysledky_zavodu_{race_id}.{export_format}",
+        "result_type": EXPORT_FORMATS[export_format],
+    }
+
+@bp.route('/race/<int:race_id>/export_results')
+def export_results(race_id):
+    """Export výsledků (format=xlsx|csv|parquet) jako úloha na pozadí.
 
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Výsledky')
-        worksheet = writer.sheets['Výsledky']
+    Dokud se závod nezmění, vrací se stejná (už hotová) úloha.
+    """
+    race = Race.query.get_or_404(race_id)
+    export_format = request.args.get("format", "xlsx")
+    if export_format not in EXPORT_FORMATS:
+        return f"Neznámý formát exportu: {export_format}", 400
+    return job_accepted(start_job(
+        "export", race.id, {"format": export_format, "version": race.version}, dedupe=True
+    ))
+
+# Úlohy na pozadí: stav v tabulce job, soubory (nahraný zdroj, výsledek)
+# v JOB_DIR/<id>/, spouští je JobRunner (jobs.py) s limity JOB_LIMITS
+JOB_DIR = os.getenv("JOB_DIR")
+# Úloha bez heartbeatu (JOB_HEARTBEAT) tak dlouho běžela ve workeru, který skončil
+JOB_STALE = timedelta(seconds=float(os.getenv("JOB_STALE_SECONDS", 4 * JOB_HEARTBEAT)))
+JOB_MAX_AGE = timedelta(days=1)
+JOB_PROGRESS_EVERY = 100
+JOB_TITLES = {"import": "Import posádek", "export": "Export výsledků", "qr": "QR kódy posádek"}
+JOB_HANDLERS = {"import": run_import_job, "export": run_export_job, "qr": run_qr_job}
+job_start_lock = threading.Lock()
+
+def job_dir(job_id):
+    return os.path.join(JOB_DIR or os.path.join(current_app.instance_path, "jobs"), job_id)
+
+def update_job(job_id, **values):
+    # Vlastní transakce – průběh je hned vidět ze všech workerů a nečeká
+    # na commit úlohy (export čte v jedné transakci až do konce)
+    with db.engine.begin() as conn:
+        conn.execute(sa.update(Job).where(Job.id == job_id).values(updated_at=get_czech_time(), **values))
+
+def touch_jobs(app, job_ids):
+    # Heartbeat JobRunneru: úlohy tohoto workeru žijí, i když stojí ve frontě
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(sa.update(Job).where(Job.id.in_(job_ids), Job.status.in_(("queued", "running")))
+                     .values(updated_at=get_czech_time()))
+
+def job_progress(job_id, items, every=JOB_PROGRESS_EVERY):
+    # Propouští položky a každých `every` z nich zapíše průběh úlohy
+    done = 0
+    for done, item in enumerate(items, 1):
+        if done % every == 0:
+            update_job(job_id, progress=done)
+        yield item
+    update_job(job_id, progress=done)
+
+def write_job_result(directory, chunks):
+    # Výsledek se zapisuje přes dočasný soubor, nikdy není ke stažení napůl
+    path = os.path.join(directory, "result")
+    with open(path + ".tmp", "wb") as f:
+        for chunk in chunks:
+            f.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+    os.replace(path + ".tmp", path)
+
+def job_is_stale(job):
+    return job.status in ("queued", "running") and \
+        local_time(job.updated_at) < local_time(get_czech_time()) - JOB_STALE
+
+def prune_jobs():
+    # Hotové úlohy starší než JOB_MAX_AGE i s jejich soubory
+    old = Job.query.filter(Job.created_at < get_czech_time() - JOB_MAX_AGE, Job.status.in_(("done", "failed"))).all()
+    for job in old:
+        shutil.rmtree(job_dir(job.id), ignore_errors=True)
+        db.session.delete(job)
+
+def start_job(kind, race_id, params, dedupe=False, prepare=None):
+    """Založí úlohu a předá ji runneru.
+
+    S dedupe vrátí rozpracovanou nebo hotovou úlohu se stejnými parametry.
+    prepare(adresář) uloží soubory, které úloha potřebuje (nahraný import).
+    """
+    params = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    # Souběžné požadavky na stejný export v jednom workeru založí jedinou úlohu
+    with job_start_lock:
+        if dedupe:
+            job = Job.query.filter(Job.kind == kind, Job.params == params, Job.status != "failed")\
+                .order_by(Job.created_at.desc()).first()
+            if job is not None and not job_is_stale(job):
+                return job
+        prune_jobs()
+        job = Job(id=uuid.uuid4().hex, kind=kind, race_id=race_id, params=params, status="queued", progress=0)
+        os.makedirs(job_dir(job.id))
+        if prepare:
+            prepare(job_dir(job.id))
+        db.session.add(job)
+        db.session.commit()
+    current_app.extensions["job_runner"].submit(job.id, kind)
+    return job
 
-        # Automatická šířka sloupců
-        for i, col in enumerate(df.columns, 1):
-            max_length = max(
-                df[col].astype(str).map(len).max(),
-                len(str(col))
-            )
-            worksheet.column_dimensions[get_column_letter(i)].width = max_length + 2
+def run_job(app, job_id):
+    # Volá vlákno JobRunneru
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        if job is None or job.status != "queued":
+            return
+        kind, race_id, params = job.kind, job.race_id, json.loads(job.params)
+        db.session.commit()
+        update_job(job_id, status="running")
+        try:
+            result = JOB_HANDLERS[kind](job_id, race_id, params, job_dir(job_id))
+        except Exception as e:
+            db.session.rollback()
+            print(f"Úloha {kind} {job_id} selhala: {e}")
+            update_job(job_id, status="failed", message=str(e))
+        else:
+            update_job(job_id, status="done", **result)
+
+def wants_json():
+    return request.is_json or \
+        request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json"
+
+def job_json(job):
+    data = {
+        "id": job.id,
+        "kind": job.kind,
+        "race_id": job.race_id,
+        "status": job.status,
+        "progress": job.progress,
+        "total": job.total,
+        "message": job.message,
+        "url": url_for("main.job_status", job_id=job.id),
+    }
+    if job.status == "done":
+        data["result_url"] = url_for("main.job_result", job_id=job.id)
+    return data
+
+def render_job(job, status=200):
+    # Prohlížeč dostane stránku s průběhem, API klient JSON
+    if wants_json():
+        response = jsonify(job_json(job))
+    else:
+        response = make_response(render_template("job.html", job=job, job_data=job_json(job),
+                                                 title=JOB_TITLES.get(job.kind, job.kind)))
+    response.status_code = status
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+def job_accepted(job):
+    response = render_job(job, 202)
+    response.headers["Location"] = url_for("main.job_status", job_id=job.id)
+    return response
+
+@bp.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = Job.query.get_or_404(job_id)
+    if job_is_stale(job):
+        update_job(job.id, status="failed", message="Úloha byla přerušena (restart workeru), spusťte ji znovu")
+        db.session.refresh(job)
+    return render_job(job)
+
+@bp.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = Job.query.get_or_404(job_id)
+    if job.status != "done":
+        return jsonify({"status": job.status, "message": "Výsledek úlohy ještě není k dispozici"}), 409
+    return send_file(os.path.join(job_dir(job.id), "result"), mimetype=job.result_type,
+                     as_attachment=True, download_name=job.result_name)
+
+@bp.route("/metrics")
+def metrics():
+    # Metriky tohoto workeru ve formátu Prometheus
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+@bp.route("/test-time")
+def test_time():
+    now = get_czech_time()
+    return f"Aktuální čas v Praze: {now.strftime('%Y-%m-%d %H:%M:%S %Z')}"
 
-    output.seek(0)
+@bp.cli.command("init-db")
+def init_db_command():
+    """Vytvoří tabulky a doplní chybějící sloupce a indexy."""
+    db.create_all()
+    upgrade_schema()
+    print("Databáze je připravená.")
+
+@bp.cli.command("field-pull")
+@click.argument("race_id", type=int)
+def field_pull_command(race_id):
+    """Stáhne z centrály posádky a checkpointy závodu do terénního uzlu."""
+    if "field_central" not in current_app.extensions:
+        raise click.ClickException("Chybí FIELD_NODE_ID nebo FIELD_CENTRAL_URL")
+    count = apply_manifest(current_app.extensions["field_central"].manifest(race_id))
+    print(f"Převzato posádek: {count}")
+
+@bp.cli.command("field-sync")
+def field_sync_command():
+    """Hned odešle neodeslané průchody terénního uzlu na centrálu."""
+    if "field_sync" not in current_app.extensions:
+        raise click.ClickException("Chybí FIELD_NODE_ID nebo FIELD_CENTRAL_URL")
+    print(f"Odesláno průchodů: {current_app.extensions['field_sync'].ship()}")
+
+# SQLite (lokální a terénní instance): WAL, aby čtení stránek neblokovalo
+# zápis průchodů, a busy_timeout, aby souběžný zápis počkal místo chyby
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+def configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+def create_app(config=None):
+    """Vytvoří aplikaci.
+
+    Databáze se bere z SQLALCHEMY_DATABASE_URI (nebo z config). Schéma se
+    nevytváří při startu workeru, ale příkazem `flask --app app init-db`.
+    Gunicorn: `gunicorn "app:create_app()"`.
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("SQLALCHEMY_DATABASE_URI")
+    app.config.update(config or {})
+    if not app.config["SQLALCHEMY_DATABASE_URI"]:
+        raise RuntimeError("Chybí proměnná SQLALCHEMY_DATABASE_URI")
+    app.config.setdefault("FIELD_NODE_ID", os.getenv("FIELD_NODE_ID"))
+    app.config.setdefault("FIELD_CENTRAL_URL", os.getenv("FIELD_CENTRAL_URL"))
+    app.config.setdefault("FIELD_SYNC_TOKEN", os.getenv("FIELD_SYNC_TOKEN"))
+    app.secret_key = os.environ.get("FLASK_SECRET_KEY")
+
+    db.init_app(app)
+    app.register_blueprint(bp)
+    with app.app_context():
+        instrument(app, db.engine)
+        if db.engine.dialect.name == "sqlite":
+            sa.event.listen(db.engine, "connect", configure_sqlite)
 
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=f"vysledky_zavodu_{race.id}.xlsx",
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    app.extensions["event_hub"] = EventHub(
+        partial(fetch_events_since, app), partial(latest_event_id, app),
+        prune=partial(prune_events, app), listen_connection=partial(listen_for_events, app)
+    )
+    app.extensions["scan_writer"] = ScanWriter(
+        os.getenv("SCAN_JOURNAL_DIR", os.path.join(app.instance_path, "scan_journal")),
+        partial(store_journaled_scans, app), logger=app.logger
     )
+    app.extensions["qr_storage"] = qr_storage_from_env(os.path.join(app.instance_path, "qrcodes"))
+    app.extensions["recalculator"] = CoalescingRunner(partial(recalculate_in_background, app))
+    app.extensions["job_runner"] = JobRunner(partial(run_job, app), heartbeat=partial(touch_jobs, app))
+    if app.config["FIELD_NODE_ID"] and app.config["FIELD_CENTRAL_URL"]:
+        central = CentralServer(app.config["FIELD_CENTRAL_URL"], app.config["FIELD_NODE_ID"],
+                                app.config["FIELD_SYNC_TOKEN"])
+        app.extensions["field_central"] = central
+        app.extensions["field_sync"] = LogShipper(
+            central, partial(read_scan_log, app), partial(save_node_cursor, app)
+        )
+    return app
 
-@app.route("/test-time")
-def test_time():
-    now = get_czech_time()
-    return f"Aktuální čas v Praze: {now.strftime('%Y-%m-%d %H:%M:%S %Z')}"
+@bp.before_app_request
+def start_field_sync():
+    # Odesílání logu terénního uzlu běží od prvního požadavku workeru
+    if "field_sync" in current_app.extensions:
+        current_app.extensions["field_sync"].start()
 
-    
 if __name__ == "__main__":
+    app = create_app()
     with app.app_context():
         db.create_all()
+        upgrade_schema()
     app.run(debug=True)
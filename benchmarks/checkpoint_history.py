@@ -0,0 +1,42 @@
+"""Škálování historie checkpointu s počtem posádek.
+
+Pro každou velikost založí závod ve stejné SQLite databázi a měří
+vykreslení /history/checkpoint/<id> a /api/checkpoint/<id>/progress
+bez cache odpovědí. Čas na posádku má zůstat přibližně konstantní;
+původní párování průchodů přes seznam rostlo kvadraticky.
+
+    python benchmarks/checkpoint_history.py [velikost ...]
+"""
+import statistics
+import sys
+import time
+
+from synthetic import load_app, build_race
+
+SIZES = [int(arg) for arg in sys.argv[1:]] or [250, 500, 1000, 2000, 4000]
+CHECKPOINTS = 10
+REPEAT = 5
+
+
+def measure(client, url):
+    timings = []
+    for _ in range(REPEAT):
+        app_module.response_cache.clear()
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(timings)
+
+
+app_module, app = load_app()
+client = app.test_client()
+
+print(f"{'posádek':>8} {'stránka ms':>11} {'µs/posádku':>11} {'API ms':>8} {'µs/posádku':>11}")
+for size in SIZES:
+    with app.app_context():
+        race_id = build_race(app_module, size, CHECKPOINTS, scan_ratio=0.8, duplicate_ratio=0.2)
+        checkpoint_id = app_module.Checkpoint.query.filter_by(race_id=race_id, order=CHECKPOINTS // 2).one().id
+    page = measure(client, f"/history/checkpoint/{checkpoint_id}")
+    api = measure(client, f"/api/checkpoint/{checkpoint_id}/progress")
+    print(f"{size:>8} {page * 1000:>11.1f} {page / size * 1e6:>11.1f} {api * 1000:>8.1f} {api / size * 1e6:>11.1f}")
@@ -0,0 +1,241 @@
+"""Benchmark hlavních endpointů nad syntetickým závodem.
+
+Založí závod (posádky × checkpointy × průchody) v dočasné SQLite nebo
+v zadané databázi (--database, např. Postgres) a přes Flask test client
+ze souběžných vláken volá skenování, detail závodu, historii checkpointu,
+export výsledků, import posádek z nahrané HTML tabulky, QR kód posádky
+a přepočet ideálních časů. Pro každý endpoint vypíše p50/p95/p99 latenci,
+propustnost a počet SQL dotazů na požadavek.
+
+QR kódy se ukládají do dočasného adresáře, benchmark nepotřebuje síť.
+GET požadavky nesou unikátní parametr, aby se měřilo vykreslení, ne cache
+odpovědí. Import a export běží jako úlohy na pozadí; měří se až do jejich
+dokončení a stažení výsledku (export nezměněného závodu vrací hotovou úlohu).
+
+    python benchmarks/endpoints.py --crews 500 --checkpoints 12 --threads 8
+    python benchmarks/endpoints.py --save-baseline baseline.json
+    python benchmarks/endpoints.py --baseline baseline.json --tolerance 0.25
+
+S --baseline skončí s kódem 1, pokud p95 nebo počet dotazů vzroste, nebo
+propustnost klesne o víc než toleranci.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from synthetic import load_app, build_race
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", help="SQLALCHEMY_DATABASE_URI (výchozí je dočasná SQLite)")
+    parser.add_argument("--crews", type=int, default=300)
+    parser.add_argument("--checkpoints", type=int, default=10)
+    parser.add_argument("--scan-ratio", type=float, default=0.8, help="podíl buněk s průchodem")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="počet skenů; ostatní endpointy poměrně méně")
+    parser.add_argument("--import-crews", type=int, default=100, help="řádků v HTML tabulce pro import")
+    parser.add_argument("--only", nargs="*", help="jen vybrané endpointy")
+    parser.add_argument("--baseline", help="JSON s uloženými výsledky k porovnání")
+    parser.add_argument("--save-baseline", help="uloží výsledky jako nový baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def write_import_fixture(rows):
+    # Stejné rozložení sloupců jako tabulka přihlášek: číslo, jméno, vozidlo, …,
+    # body za rok výroby (5), rok výroby (6), třída (7); první řádek je hlavička v <td>
+    # jako na webu přihlášek (start_row=1 ho přeskočí)
+    cells = ["<tr><td>Č.</td><td>Jméno</td><td>Vozidlo</td><td>Klub</td><td>Obec</td>"
+             "<td>Body</td><td>Rok</td><td>Třída</td></tr>"]
+    for n in range(1, rows + 1):
+        cells.append(
+            f"<tr><td>{n}</td><td>Posádka {n}</td><td>Vůz {n}</td><td>Klub</td><td>Obec</td>"
+            f"<td>{n % 4 * 5}</td><td>{1950 + n % 40}</td><td>{'AB'[n % 2]}</td></tr>"
+        )
+    path = os.path.join(tempfile.mkdtemp(), "crews.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<html><head><meta charset=\"utf-8\"></head><body><table>" + "".join(cells) + "</table></body></html>")
+    return path
+
+
+class QueryCounter:
+    """Počítá SQL dotazy zvlášť pro každé vlákno."""
+
+    def __init__(self, engine):
+        self.local = threading.local()
+        sa.event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.local.count = getattr(self.local, "count", 0) + 1
+
+    def value(self):
+        return getattr(self.local, "count", 0)
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+
+def run_endpoint(calls, threads):
+    """Provede volání ze sdíleného seznamu v daném počtu vláken.
+
+    Každé volání vrací HTTP status; měří se latence a počet dotazů.
+    """
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+    work = iter(calls)
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                call = next(work, None)
+            if call is None:
+                return
+            before = counter.value()
+            started = time.perf_counter()
+            status = call(client)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                queries.append(counter.value() - before)
+                if status >= 400:
+                    errors.append(status)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "throughput": round(len(latencies) / wall, 2),
+        "queries": round(sum(queries) / len(queries), 1),
+        "errors": len(errors),
+    }
+
+
+def finish_job(client, response):
+    # 202 s adresou úlohy: čeká se na dokončení a výsledek se stáhne
+    if response.status_code != 202:
+        return response.status_code
+    while True:
+        job = client.get(response.headers["Location"], headers={"Accept": "application/json"}).get_json()
+        if job["status"] == "done":
+            return client.get(job["result_url"]).status_code
+        if job["status"] == "failed":
+            return 500
+        time.sleep(0.05)
+
+
+def build_scenarios(args, race_id, crew_ids, checkpoint_ids, fixture):
+    rnd = random.Random(args.seed)
+    unique = iter(range(10 ** 9))
+
+    def get(url):
+        return lambda client: client.get(f"{url}{'&' if '?' in url else '?'}bench={next(unique)}").status_code
+
+    def job(url):
+        return lambda client: finish_job(client, client.get(url, headers={"Accept": "application/json"}))
+
+    def scan(client):
+        crew_id, checkpoint_id = rnd.choice(crew_ids), rnd.choice(checkpoint_ids)
+        return client.post(f"/scan/{crew_id}/{checkpoint_id}").status_code
+
+    def import_into_new_race(client):
+        with app.app_context():
+            race = app_module.Race(name="Import", start_time=datetime(2025, 7, 5, 8, 0), crew_interval=1)
+            app_module.db.session.add(race)
+            app_module.db.session.commit()
+            new_race_id = race.id
+        with open(fixture, "rb") as file:
+            return finish_job(client, client.post(f"/race/{new_race_id}/import_crews",
+                                                  data={"source_file": (file, "crews.html"), "start_row": 1},
+                                                  headers={"Accept": "application/json"}))
+
+    def recalculate(client):
+        with app.app_context():
+            app_module.recalculate_all_ideal_times(race_id)
+        return 200
+
+    count = args.requests
+    return {
+        "scan_qr": [scan] * count,
+        "race_detail": [get(f"/race/{race_id}")] * max(1, count // 4),
+        "history_checkpoint": [get(f"/history/checkpoint/{rnd.choice(checkpoint_ids)}") for _ in range(max(1, count // 2))],
+        "export_results": [job(f"/race/{race_id}/export_results?format=xlsx")] * max(1, count // 10),
+        "crew_qr": [get(f"/crew/{rnd.choice(crew_ids)}/qr.png") for _ in range(max(1, count // 4))],
+        "import_crews": [import_into_new_race] * max(1, count // 40),
+        "recalculate_all_ideal_times": [recalculate] * max(1, count // 20),
+    }
+
+
+def compare(results, baseline, tolerance):
+    failures = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            failures.append(f"{name}: p95 {result['p95_ms']} ms > {base['p95_ms']} ms")
+        if result["throughput"] < base["throughput"] * (1 - tolerance):
+            failures.append(f"{name}: propustnost {result['throughput']}/s < {base['throughput']}/s")
+        if result["queries"] > base["queries"] * (1 + tolerance):
+            failures.append(f"{name}: dotazů {result['queries']} > {base['queries']}")
+        if result["errors"] > base.get("errors", 0):
+            failures.append(f"{name}: chyb {result['errors']}")
+    return failures
+
+
+args = parse_args()
+os.environ.setdefault("QR_STORAGE_DIR", tempfile.mkdtemp())
+os.environ.setdefault("JOB_DIR", tempfile.mkdtemp())
+os.environ.setdefault("QR_RENDER_PROCESSES", "1")
+app_module, app = load_app(args.database)
+app.logger.disabled = True
+
+with app.app_context():
+    counter = QueryCounter(app_module.db.engine)
+    race_id = build_race(app_module, args.crews, args.checkpoints, scan_ratio=args.scan_ratio, seed=args.seed)
+    crew_ids = [crew_id for (crew_id,) in app_module.db.session.query(app_module.Crew.id).filter_by(race_id=race_id)]
+    checkpoint_ids = [ck_id for (ck_id,) in app_module.db.session.query(app_module.Checkpoint.id).filter_by(race_id=race_id)]
+
+scenarios = build_scenarios(args, race_id, crew_ids, checkpoint_ids, write_import_fixture(args.import_crews))
+print(f"Závod {args.crews} posádek × {args.checkpoints} checkpointů, {args.threads} vláken\n")
+print(f"{'endpoint':<28} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'dotazů':>7} {'chyb':>5}")
+results = {}
+for name, calls in scenarios.items():
+    if args.only and name not in args.only:
+        continue
+    result = results[name] = run_endpoint(calls, args.threads)
+    print(f"{name:<28} {result['requests']:>5} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+          f"{result['p99_ms']:>8.1f} {result['throughput']:>8.1f} {result['queries']:>7.1f} {result['errors']:>5}")
+
+if args.save_baseline:
+    with open(args.save_baseline, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+if args.baseline:
+    with open(args.baseline, encoding="utf-8") as f:
+        failures = compare(results, json.load(f), args.tolerance)
+    for failure in failures:
+        print(f"REGRESE {failure}")
+    sys.exit(1 if failures else 0)
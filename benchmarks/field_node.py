@@ -0,0 +1,124 @@
+"""Terénní uzel a centrála – dvě lokální SQLite databáze na jednom stroji.
+
+Centrála dostane syntetický závod a terénní uzel si od ní převezme
+soupisku (jako `flask field-pull`). Uzel během výpadku spojení přijme
+průchody ze skenerů, část z nich odeslaných dvakrát, a po obnovení spojení
+je pošle na centrálu. Skript ověří, že centrála má každý průchod právě
+jednou. Ověří také, že opakované odeslání nic nezdvojí a že po ztrátě
+kurzoru na centrále (obnova ze zálohy) se log pošle znovu bez duplicit.
+Ověří i to, že se na uzlu otevře přehled závodů a stránka závodu.
+Vypíše propustnost odesílání.
+
+    python benchmarks/field_node.py [průchodů] [velikost dávky]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import partial
+
+SCANS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+BATCH = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+# Každý sken se uloží (debounce by zahodil náhodně blízké skeny téže buňky)
+os.environ.setdefault("SCAN_DEBOUNCE_SECONDS", "0")
+os.environ.setdefault("SCAN_JOURNAL_DIR", tempfile.mkdtemp())
+
+from synthetic import load_app, build_race
+
+app_module, central = load_app()
+# Uzel bez FIELD_CENTRAL_URL – odesílání řídí skript přes test client centrály
+_, node = load_app(config={"FIELD_NODE_ID": "ck-les"})
+db = app_module.db
+
+
+class TestClientCentral(app_module.CentralServer):
+    """Centrála přes Flask test client; online=False simuluje výpadek spojení."""
+
+    online = True
+
+    def _request(self, method, path, payload=None):
+        if not self.online:
+            raise ConnectionError("centrála je nedostupná")
+        response = central.test_client().open(path, method=method, json=payload)
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return response.get_json()
+
+
+def count(app, model):
+    with app.app_context():
+        return db.session.query(model).count()
+
+
+def wait_for_writer():
+    writer = node.extensions["scan_writer"]
+    while writer.pending():
+        time.sleep(0.01)
+
+
+def main():
+    with central.app_context():
+        race_id = build_race(app_module, 100, 8, scan_ratio=0)
+    connection = TestClientCentral("http://centrala", "ck-les")
+    shipper = app_module.LogShipper(connection, partial(app_module.read_scan_log, node),
+                                    partial(app_module.save_node_cursor, node), batch_size=BATCH)
+    with node.app_context():
+        print(f"Soupiska: {app_module.apply_manifest(connection.manifest(race_id))} posádek")
+        crew_ids = [c.id for c in app_module.Crew.query.filter_by(race_id=race_id)]
+        checkpoint_ids = [c.id for c in app_module.Checkpoint.query.filter_by(race_id=race_id)]
+    # Stránky závodu na uzlu potřebují i start a interval z manifestu
+    pages = {path: node.test_client().get(path).status_code for path in ("/", f"/race/{race_id}")}
+    print("Stránky uzlu: " + ", ".join(f"{path} {status}" for path, status in pages.items()))
+
+    # Výpadek: skenery posílají na uzel, část dávek dvakrát (ztracená odpověď)
+    connection.online = False
+    rnd = random.Random(1)
+    start = datetime(2025, 7, 5, 9, 0)
+    scans = [{
+        "id": str(uuid.uuid4()), "crew_id": rnd.choice(crew_ids), "checkpoint_id": rnd.choice(checkpoint_ids),
+        "timestamp": (start + timedelta(seconds=n)).isoformat()
+    } for n in range(SCANS)]
+    client = node.test_client()
+    for offset in range(0, SCANS, 50):
+        batch = scans[offset:offset + 50]
+        client.post("/scan/batch", json={"scans": batch})
+        if rnd.random() < 0.3:
+            client.post("/scan/batch", json={"scans": batch})
+    wait_for_writer()
+    try:
+        shipper.ship()
+    except ConnectionError as e:
+        print(f"Bez spojení: {e}")
+    print(f"Log uzlu: {count(node, app_module.ScanLog)} záznamů, centrála: {count(central, app_module.ScanRecord)} průchodů")
+
+    connection.online = True
+    started = time.perf_counter()
+    sent = shipper.ship()
+    elapsed = time.perf_counter() - started
+    print(f"Odesláno {sent} záznamů za {elapsed * 1000:.0f} ms ({sent / elapsed:.0f}/s, dávka {BATCH})")
+    print(f"Znovu odesláno: {shipper.ship()}")
+
+    # Centrála obnovená ze zálohy bez kurzoru: log jde znovu, nic se nezdvojí
+    with central.app_context():
+        app_module.SyncCursor.query.delete()
+        db.session.commit()
+    print(f"Po ztrátě kurzoru odesláno znovu: {shipper.ship()}")
+
+    stored = count(central, app_module.ScanRecord)
+    with central.app_context():
+        position = app_module.sync_position("ck-les")
+    with node.app_context():
+        node_position = app_module.sync_position("ck-les")
+    ok = (stored == SCANS == count(node, app_module.ScanLog) and position == node_position
+          and all(status == 200 for status in pages.values()))
+    print(f"Centrála: {stored} průchodů z {SCANS}, kurzor centrály {position}, uzlu {node_position}"
+          f" – {'OK' if ok else 'NESOUHLASÍ'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
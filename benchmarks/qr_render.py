@@ -0,0 +1,75 @@
+"""Mikro-benchmark vykreslení QR kódu.
+
+Porovná původní lineární hledání velikosti písma (nové načtení fontu
+v každém kroku) s binárním vyhledáváním nad cache fontů a s cache
+vykreslených obrázků.
+
+    python benchmarks/qr_render.py [počet]
+"""
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import qrcode
+from PIL import ImageDraw, ImageFont
+
+import qr_codes
+
+
+def render_linear(data, center_text):
+    # Původní algoritmus před zavedením cache, pro srovnání
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_H, box_size=10, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+    qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
+    draw = ImageDraw.Draw(qr_img)
+    width, height = qr_img.size
+    box_size = int(width * 0.25)
+    top_left = ((width - box_size) // 2, (height - box_size) // 2)
+    bottom_right = ((width + box_size) // 2, (height + box_size) // 2)
+    draw.rectangle([top_left, bottom_right], fill="white")
+    box_width = bottom_right[0] - top_left[0]
+    box_height = bottom_right[1] - top_left[1]
+    font = None
+    for size in range(box_height, 0, -1):
+        try:
+            candidate_font = ImageFont.truetype("DejaVuSans.ttf", size=size)
+        except IOError:
+            candidate_font = ImageFont.load_default()
+        text_bbox = draw.textbbox((0, 0), center_text, font=candidate_font)
+        if text_bbox[2] - text_bbox[0] <= box_width and text_bbox[3] - text_bbox[1] <= box_height:
+            font = candidate_font
+            break
+    font = font or ImageFont.load_default()
+    draw.text(top_left, center_text, font=font, fill="black")
+    buffer = io.BytesIO()
+    qr_img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def measure(label, func, count):
+    start = time.perf_counter()
+    for i in range(count):
+        func(str(i), str(i % 300 + 1))
+    per_qr = (time.perf_counter() - start) / count * 1000
+    print(f"{label:<36} {per_qr:8.2f} ms / QR")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    measure("původní (lineární hledání)", render_linear, count)
+
+    qr_codes.load_font.cache_clear()
+    measure("binární hledání + cache fontů", lambda d, t: qr_codes._render_qr(d, t, qr_codes.QR_STYLE), count)
+
+    qr_codes._render_cache.clear()
+    for i in range(count):
+        qr_codes.render_qr_png(str(i), str(i % 300 + 1))
+    measure("cache vykreslených QR (zásah)", qr_codes.render_qr_png, count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Plány dotazů pro nejčastější stránky nad syntetickým závodem.
+
+Vytvoří dočasnou SQLite databázi se závodem o 500 posádkách, vypíše
+EXPLAIN QUERY PLAN klíčových dotazů a jejich čas. V plánech nemá být
+SCAN celé tabulky ani "USE TEMP B-TREE FOR ORDER BY".
+
+    python benchmarks/query_plans.py [posádek] [checkpointů]
+"""
+import sys
+import time
+
+from synthetic import load_app, build_race
+
+CREWS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+CHECKPOINTS = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+
+import sqlalchemy as sa
+
+app_module, app = load_app()
+db = app_module.db
+Crew, Checkpoint, Passage, IdealTime = (
+    app_module.Crew, app_module.Checkpoint, app_module.Passage, app_module.IdealTime
+)
+
+
+def hot_queries():
+    race_id = 1
+    checkpoint_id = Checkpoint.query.filter_by(race_id=race_id).first().id
+    return {
+        "posádky závodu podle čísla": Crew.query.filter_by(race_id=race_id).order_by(Crew.start_number),
+        "ideální časy posádky": IdealTime.query.filter_by(crew_id=1, checkpoint_id=checkpoint_id),
+        "ideální časy checkpointu": IdealTime.query.filter_by(checkpoint_id=checkpoint_id),
+        "průchody checkpointem": db.session.query(Passage.crew_id).filter_by(checkpoint_id=checkpoint_id),
+        "průchod posádky checkpointem": Passage.query.filter_by(checkpoint_id=checkpoint_id, crew_id=1),
+        "ideální časy závodu": IdealTime.query.join(Crew).filter(Crew.race_id == race_id),
+        "průchody závodu": Passage.query.join(Crew).filter(Crew.race_id == race_id),
+    }
+
+
+def main():
+    with app.app_context():
+        # Druhý závod, aby dotazy musely filtrovat podle race_id
+        build_race(app_module, CREWS, CHECKPOINTS)
+        build_race(app_module, CREWS, CHECKPOINTS)
+        db.session.execute(sa.text("ANALYZE"))
+        for label, query in hot_queries().items():
+            sql = str(query.statement.compile(db.engine, compile_kwargs={"literal_binds": True}))
+            plan = db.session.execute(sa.text(f"EXPLAIN QUERY PLAN {sql}")).all()
+            start = time.perf_counter()
+            rows = len(query.all())
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"\n{label} ({rows} řádků, {elapsed:.1f} ms)")
+            for row in plan:
+                print(f"    {row[-1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Propustnost ukládání průchodů: přímý commit vs. write-behind.
+
+Souběžná vlákna posílají POST /scan/<posádka>/<checkpoint> jako telefony
+při hromadném dojezdu do cíle. V režimu write-behind se měří i doba, než
+zapisovač uloží celou frontu do databáze.
+
+    python benchmarks/scan_ingest.py [průchodů] [vláken]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from synthetic import load_app, build_race
+
+SCANS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+THREADS = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+
+os.environ.setdefault("SCAN_JOURNAL_DIR", tempfile.mkdtemp())
+# Každá posádka se skenuje několikrát za sebou; měří se ukládání, ne debounce
+os.environ.setdefault("SCAN_DEBOUNCE_SECONDS", "0")
+app_module, app = load_app()
+# Chyby 500 (zamčená SQLite při souběžných commitech) se jen počítají
+app.logger.disabled = True
+
+
+def run(write_behind, crew_ids, checkpoint_id):
+    app_module.SCAN_WRITE_BEHIND = write_behind
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(part):
+        client = app.test_client()
+        for crew_id in part:
+            started = time.perf_counter()
+            response = client.post(f"/scan/{crew_id}/{checkpoint_id}")
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+    targets = [crew_ids[i % len(crew_ids)] for i in range(SCANS)]
+    threads = [threading.Thread(target=worker, args=(targets[i::THREADS],)) for i in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    acknowledged = time.perf_counter() - started
+    while app.extensions["scan_writer"].pending():
+        time.sleep(0.001)
+    stored = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)]
+    label = "write-behind" if write_behind else "přímý commit"
+    print(f"{label:>13}: {SCANS / acknowledged:7.0f} potvrzení/s, uloženo za {stored:.2f} s, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, chyb {len(errors)}")
+
+
+with app.app_context():
+    race_id = build_race(app_module, 500, 2, scan_ratio=0)
+    crew_ids = [crew_id for (crew_id,) in app_module.db.session.query(app_module.Crew.id).filter_by(race_id=race_id)]
+    checkpoint_ids = [ck_id for (ck_id,) in app_module.db.session.query(app_module.Checkpoint.id)
+                      .filter_by(race_id=race_id).order_by(app_module.Checkpoint.order)]
+
+run(False, crew_ids, checkpoint_ids[0])
+run(True, crew_ids, checkpoint_ids[1])
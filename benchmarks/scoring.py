@@ -0,0 +1,99 @@
+"""Benchmark výpočtu trestných bodů.
+
+Porovná původní smyčku v Pythonu (slovníky a datetime.combine pro každou
+buňku) s maticovým výpočtem ve scoring.py. Oba výpočty se před měřením
+jednou zahřejí.
+
+    python benchmarks/scoring.py [posádek] [checkpointů]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from scoring import score_race, times_to_seconds, timestamps_to_seconds
+
+CREWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+CHECKPOINTS = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+
+def synthetic_race():
+    random.seed(1)
+    prague = ZoneInfo("Europe/Prague")
+    start = datetime(2025, 7, 5, 8, 0, tzinfo=prague)
+    ideal, scans = [], []
+    for crew in range(CREWS):
+        for ck in range(CHECKPOINTS):
+            planned = start + timedelta(seconds=crew * 60 + ck * 900)
+            ideal.append((crew, ck, planned.time()))
+            if random.random() < 0.95:
+                scans.append((crew, ck, planned + timedelta(seconds=random.randint(-600, 600))))
+    return ideal, scans
+
+
+def score_loop(ideal, scans, penalty_year):
+    # Původní výpočet z export_results
+    ideal_dict = {(c, k): t for c, k, t in ideal}
+    scan_dict = {}
+    for c, k, ts in scans:
+        scan_dict.setdefault((c, k), ts.astimezone(ZoneInfo("Europe/Prague")))
+    totals = []
+    for crew in range(CREWS):
+        total = 0
+        for ck in range(CHECKPOINTS):
+            ideal_time = ideal_dict.get((crew, ck))
+            real = scan_dict.get((crew, ck))
+            if ideal_time and real:
+                diff = abs(
+                    (datetime.combine(datetime.today(), real.time()) -
+                     datetime.combine(datetime.today(), ideal_time)).total_seconds()
+                ) / 60
+                total += min(int(diff) * 10, 100)
+            else:
+                total += 100
+        totals.append(total + penalty_year[crew])
+    return totals
+
+
+def to_columns(ideal, scans):
+    crews, cks, times = zip(*ideal)
+    scan_crews, scan_cks, stamps = zip(*scans)
+    return (
+        (crews, cks, times_to_seconds(times)),
+        (scan_crews, scan_cks, timestamps_to_seconds(list(stamps)))
+    )
+
+
+def score_vectorized(ideal, scans, penalty_year):
+    ideal_cells, scan_cells = to_columns(ideal, scans)
+    return score_race(range(CREWS), range(CHECKPOINTS), ideal_cells, scan_cells, penalty_year).totals
+
+
+def measure(label, func, *args):
+    # Zahřátí: první běh platí import numpy, načtení zóny a podobně
+    func(*args)
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<24} {(time.perf_counter() - start) * 1000:9.1f} ms")
+    return result
+
+
+def main():
+    ideal, scans = synthetic_race()
+    penalty_year = [crew % 7 for crew in range(CREWS)]
+    print(f"{CREWS} posádek × {CHECKPOINTS} checkpointů, {len(scans)} průchodů")
+    loop = measure("smyčka v Pythonu", score_loop, ideal, scans, penalty_year)
+    vectorized = measure("maticový výpočet", score_vectorized, ideal, scans, penalty_year)
+    ideal_cells, scan_cells = to_columns(ideal, scans)
+    measure("  z toho jen matice", score_race, range(CREWS), range(CHECKPOINTS), ideal_cells, scan_cells, penalty_year)
+    assert np.array_equal(np.asarray(loop), vectorized), "výsledky se liší"
+
+
+if __name__ == "__main__":
+    main()
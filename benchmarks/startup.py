@@ -0,0 +1,98 @@
+"""Studený start workeru: doba importu, paměť a načtené knihovny.
+
+Každý scénář běží v novém procesu jako čerstvý gunicorn worker: import
+app.py, create_app() a jeden požadavek. Vypíše čas importu, RSS po startu
+a po požadavku a které těžké knihovny se kvůli požadavku načetly. Worker,
+který jen skenuje, nemá načíst pandas, Pillow, qrcode, openpyxl, lxml ani
+requests.
+
+    python benchmarks/startup.py [scénář ...]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("numpy", "pandas", "PIL", "qrcode", "openpyxl", "lxml", "requests", "pyarrow", "bs4")
+SCENARIOS = {
+    "scan": ("post", "/scan/{crew_id}/{checkpoint_id}"),
+    "race_detail": ("get", "/race/{race_id}"),
+    "export_xlsx": ("get", "/race/{race_id}/export_results?format=xlsx"),
+    "crew_qr": ("get", "/crew/{crew_id}/qr.png"),
+}
+
+
+def rss_mb():
+    # Aktuální RSS z /proc (Linux), jinak maximum z getrusage
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(scenario, ids):
+    # Místo adresáře benchmarků (má vlastní scoring.py) kořen repozitáře
+    sys.path[0] = ROOT
+    started = time.perf_counter()
+    import app as app_module
+    imported = time.perf_counter() - started
+    app = app_module.create_app()
+    booted = time.perf_counter() - started
+    boot_rss = rss_mb()
+    boot_modules = {name for name in HEAVY_MODULES if name in sys.modules}
+
+    method, url = SCENARIOS[scenario]
+    client = app.test_client()
+    started = time.perf_counter()
+    status = getattr(client, method)(url.format(**ids)).status_code
+    # Export běží jako úloha na pozadí – počítá se i s ní
+    app.extensions["job_runner"].wait()
+    request_time = time.perf_counter() - started
+    print(json.dumps({
+        "import_ms": round(imported * 1000), "boot_ms": round(booted * 1000),
+        "boot_rss": round(boot_rss, 1), "rss": round(rss_mb(), 1),
+        "request_ms": round(request_time * 1000), "status": status,
+        "boot_modules": sorted(boot_modules),
+        "loaded": sorted(name for name in HEAVY_MODULES if name in sys.modules and name not in boot_modules),
+    }))
+
+
+def main(names):
+    from synthetic import load_app, build_race
+
+    database = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}"
+    app_module, app = load_app(database)
+    with app.app_context():
+        race_id = build_race(app_module, 50, 3)
+        crew = app_module.Crew.query.filter_by(race_id=race_id).first()
+        checkpoint = app_module.Checkpoint.query.filter_by(race_id=race_id).first()
+        ids = {"race_id": race_id, "crew_id": crew.id, "checkpoint_id": checkpoint.id}
+
+    env = dict(os.environ, SQLALCHEMY_DATABASE_URI=database, QR_STORAGE_DIR=tempfile.mkdtemp(),
+               JOB_DIR=tempfile.mkdtemp())
+    print(f"{'scénář':<14} {'import ms':>9} {'start ms':>9} {'RSS MB':>7} {'po req MB':>9} {'req ms':>7}  načteno požadavkem")
+    for name in names or SCENARIOS:
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", name, json.dumps(ids)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{name:<14} {result['import_ms']:>9} {result['boot_ms']:>9} {result['boot_rss']:>7} "
+              f"{result['rss']:>9} {result['request_ms']:>7}  {', '.join(result['loaded']) or '-'}"
+              f"{'' if result['status'] < 400 else ' (HTTP ' + str(result['status']) + ')'}")
+    print(f"\nPři startu načteno: {', '.join(result['boot_modules']) or '-'}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], json.loads(sys.argv[3]))
+    else:
+        main(sys.argv[1:])
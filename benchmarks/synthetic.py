@@ -0,0 +1,69 @@
+"""Syntetický závod pro benchmarky.
+
+load_app() vytvoří aplikaci nad zadanou (nebo dočasnou) databází
+a připraví její schéma.
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(database_uri=None, config=None):
+    # Bez zadané databáze se použije nový SQLite soubor v dočasném adresáři
+    if database_uri is None:
+        database_uri = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import app as app_module
+    app = app_module.create_app({**(config or {}), "SQLALCHEMY_DATABASE_URI": database_uri})
+    with app.app_context():
+        app_module.db.create_all()
+        app_module.upgrade_schema()
+    return app_module, app
+
+
+def build_race(app_module, crews, checkpoints, scan_ratio=1.0, duplicate_ratio=0.0, seed=1):
+    """Založí závod s ideálními časy a průchody, vrací jeho ID.
+
+    scan_ratio je podíl buněk posádka × checkpoint s průchodem,
+    duplicate_ratio podíl průchodů naskenovaných dvakrát.
+    """
+    import sqlalchemy as sa
+
+    db = app_module.db
+    rnd = random.Random(seed)
+    prague = ZoneInfo("Europe/Prague")
+    start = datetime(2025, 7, 5, 8, 0)
+
+    race = app_module.Race(name=f"Bench {crews}×{checkpoints}", start_time=start, crew_interval=1)
+    db.session.add(race)
+    db.session.flush()
+    cks = [app_module.Checkpoint(name=f"CK {i + 1}", order=i + 1, race_id=race.id) for i in range(checkpoints)]
+    crew_rows = [app_module.Crew(number=str(n), name=f"Posádka {n}", race_id=race.id) for n in range(1, crews + 1)]
+    db.session.add_all(cks + crew_rows)
+    db.session.flush()
+
+    ideal, scans = [], []
+    for idx, crew in enumerate(crew_rows):
+        for ck in cks:
+            planned = start + timedelta(minutes=idx + ck.order * 10)
+            ideal.append({"crew_id": crew.id, "checkpoint_id": ck.id, "ideal_time": planned.time()})
+            if rnd.random() < scan_ratio:
+                stamp = (planned + timedelta(seconds=rnd.randint(-300, 300))).replace(tzinfo=prague)
+                scans.append({"crew_id": crew.id, "checkpoint_id": ck.id, "timestamp": stamp})
+                if rnd.random() < duplicate_ratio:
+                    scans.append({"crew_id": crew.id, "checkpoint_id": ck.id, "timestamp": stamp + timedelta(seconds=2)})
+    if ideal:
+        db.session.execute(sa.insert(app_module.IdealTime), ideal)
+    if scans:
+        db.session.execute(sa.insert(app_module.ScanRecord), scans)
+    app_module.fill_missing_passages(race.id)
+    app_module.rebuild_race_penalties(race.id)
+    app_module.recount_race_counters(race.id)
+    db.session.commit()
+    return race.id
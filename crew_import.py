@@ -0,0 +1,155 @@
+import codecs
+import csv
+import io
+import os
+import re
+import tempfile
+from urllib.parse import urlparse
+
+# Sloupce tabulky přihlášek: číslo, jméno, vozidlo, …, body za rok výroby,
+# rok výroby, třída
+CREW_COLUMNS = {
+    "number": 0,
+    "name": 1,
+    "vehicle": 2,
+    "penalty_year": 5,
+    "vehicle_year": 6,
+    "category": 7,
+}
+MIN_CELLS = max(CREW_COLUMNS.values()) + 1
+
+IMPORT_FORMATS = ("html", "xlsx", "csv")
+IMPORT_TIMEOUT = float(os.getenv("IMPORT_TIMEOUT", "30"))
+# Po kolika řádcích se posádky zapisují do databáze
+IMPORT_BATCH_SIZE = 500
+# Kódování uvedené přímo ve stránce (<meta charset> nebo http-equiv)
+HTML_CHARSET = re.compile(rb"<meta[^>]+charset", re.IGNORECASE)
+
+
+def detect_format(name, content_type=None):
+    extension = os.path.splitext(urlparse(name or "").path)[1].lower().lstrip(".")
+    if extension in ("xlsx", "xlsm"):
+        return "xlsx"
+    if extension == "csv" or (content_type or "").startswith("text/csv"):
+        return "csv"
+    return "html"
+
+
+def guess_html_encoding(file):
+    """Kódování HTML, které neuvádí hlavička ani stránka.
+
+    lxml by takový soubor četl jako latin-1; nejdřív se proto zkusí UTF-8
+    a jen když soubor není platné UTF-8, vrátí se None (rozhodne lxml).
+    Soubor se projde celý a přetočí zpátky na začátek.
+    """
+    declared = HTML_CHARSET.search(file.read(4096))
+    file.seek(0)
+    if declared:
+        return None
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for chunk in iter(lambda: file.read(64 * 1024), b""):
+            decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return None
+    finally:
+        file.seek(0)
+    return "utf-8"
+
+
+def iter_html_rows(file, encoding=None):
+    # Řádky první tabulky na stránce; zpracované elementy se hned uvolňují
+    from lxml import etree
+
+    if encoding is None and file.seekable():
+        encoding = guess_html_encoding(file)
+    tables = 0
+    for event, element in etree.iterparse(file, events=("start", "end"), tag=("table", "tr"),
+                                          html=True, encoding=encoding):
+        if element.tag == "table":
+            if event == "start":
+                tables += 1
+            elif tables == 1:
+                return
+            continue
+        if event == "end" and tables == 1:
+            yield ["".join(cell.itertext()).strip() for cell in element if isinstance(cell.tag, str)]
+            element.clear()
+
+
+def iter_xlsx_rows(file):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield [format_cell(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def iter_csv_rows(file):
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+    except csv.Error:
+        dialect = csv.excel
+    for row in csv.reader(text, dialect):
+        yield [cell.strip() for cell in row]
+
+
+def format_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def iter_file_rows(file, fmt, encoding=None):
+    if fmt == "xlsx":
+        return iter_xlsx_rows(file)
+    if fmt == "csv":
+        return iter_csv_rows(file)
+    return iter_html_rows(file, encoding)
+
+
+def iter_url_rows(url):
+    """Řádky tabulky ze vzdálené stránky nebo souboru, čtené průběžně ze sítě."""
+    import requests
+
+    response = requests.get(url, stream=True, timeout=IMPORT_TIMEOUT)
+    response.raise_for_status()
+    fmt = detect_format(url, response.headers.get("Content-Type"))
+    encoding = response.encoding if "charset" in response.headers.get("Content-Type", "") else None
+    try:
+        if fmt == "xlsx" or (fmt == "html" and encoding is None):
+            # XLSX je ZIP a potřebuje seek, HTML bez charsetu se předem zkusí
+            # přečíst jako UTF-8 – obojí se stáhne do dočasného souboru
+            with tempfile.TemporaryFile() as file:
+                for chunk in response.iter_content(64 * 1024):
+                    file.write(chunk)
+                file.seek(0)
+                yield from iter_file_rows(file, fmt)
+        else:
+            response.raw.decode_content = True
+            yield from iter_file_rows(response.raw, fmt, encoding)
+    finally:
+        response.close()
+
+
+def iter_crews(rows, start_row=0):
+    """Převede řádky tabulky na slovníky posádek.
+
+    Prvních start_row řádků se přeskočí (hlavička), stejně jako řádky
+    s méně sloupci nebo bez čísla posádky.
+    """
+    for index, cells in enumerate(rows):
+        if index < start_row or len(cells) < MIN_CELLS:
+            continue
+        crew = {field: cells[column].strip() for field, column in CREW_COLUMNS.items()}
+        if crew["number"]:
+            yield crew
@@ -0,0 +1,96 @@
+import os
+import threading
+
+# Jak často se terénní uzel pokusí odeslat log, když ho nic nevzbudí dřív
+FIELD_SYNC_INTERVAL = float(os.getenv("FIELD_SYNC_INTERVAL", "10"))
+# Kolik záznamů logu jde na centrálu v jednom požadavku
+FIELD_SYNC_BATCH = int(os.getenv("FIELD_SYNC_BATCH", "500"))
+FIELD_SYNC_TIMEOUT = float(os.getenv("FIELD_SYNC_TIMEOUT", "30"))
+
+
+class CentralServer:
+    """Centrální instance aplikace z pohledu terénního uzlu (HTTP + JSON)."""
+
+    def __init__(self, url, node_id, token=None):
+        self.url = url.rstrip("/")
+        self.node_id = node_id
+        self.token = token
+
+    def _request(self, method, path, payload=None):
+        import requests
+
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        response = requests.request(method, self.url + path, json=payload, headers=headers,
+                                    timeout=FIELD_SYNC_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def cursor(self):
+        # Poslední pořadové číslo logu uzlu, které centrála už má
+        return self._request("GET", f"/sync/{self.node_id}/cursor")["position"]
+
+    def ship(self, entries):
+        return self._request("POST", f"/sync/{self.node_id}/scans", {"entries": entries})["position"]
+
+    def manifest(self, race_id):
+        return self._request("GET", f"/race/{race_id}/scan_manifest.json")
+
+
+class LogShipper:
+    """Odesílání logu průchodů z terénního uzlu na centrálu (log shipping).
+
+    Log je append-only a každý záznam má pořadové číslo (seq). Odesílá se
+    po dávkách od kurzoru, který drží centrála; po výpadku spojení nebo
+    restartu uzlu se proto pokračuje tam, kde centrála skončila. Centrála
+    slučuje podle client_id, takže opakované odeslání dávky nic nezdvojí.
+
+    read_log(po_seq, limit) vrací záznamy logu, save_cursor(pozice) si
+    potvrzenou pozici uloží i lokálně (přehled neodeslaných průchodů).
+    """
+
+    def __init__(self, central, read_log, save_cursor, interval=FIELD_SYNC_INTERVAL, batch_size=FIELD_SYNC_BATCH):
+        self.central = central
+        self.read_log = read_log
+        self.save_cursor = save_cursor
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name="field-sync", daemon=True)
+            self.thread.start()
+
+    def wake(self):
+        # Nové průchody v logu – odeslat hned, nečekat na interval
+        self.wakeup.set()
+
+    def ship(self):
+        """Odešle vše od kurzoru centrály, vrací počet odeslaných záznamů.
+
+        Chyby spojení propadnou volajícímu; potvrzená část zůstane potvrzená.
+        """
+        with self.lock:
+            position = self.central.cursor()
+            self.save_cursor(position)
+            sent = 0
+            while True:
+                entries = self.read_log(position, self.batch_size)
+                if not entries:
+                    return sent
+                position = self.central.ship(entries)
+                self.save_cursor(position)
+                sent += len(entries)
+
+    def _run(self):
+        while True:
+            try:
+                self.ship()
+            except Exception as e:
+                print(f"Průchody se nepodařilo odeslat na centrálu: {e}")
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Kolik úloh běží v jednom workeru najednou (vlákna navíc k požadavkům)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+
+def parse_limits(value):
+    # "import=1,export=2" -> {"import": 1, "export": 2}
+    limits = {}
+    for part in value.split(","):
+        kind, _, count = part.partition("=")
+        if kind.strip():
+            limits[kind.strip()] = max(1, int(count or 1))
+    return limits
+
+
+# Kolik úloh jednoho druhu smí běžet souběžně, ostatní čekají ve frontě
+JOB_LIMITS = parse_limits(os.getenv("JOB_LIMITS", "import=1,export=1,qr=1"))
+# Jak často runner potvrzuje, že jeho úlohy (běžící i čekající) pořád žijí
+JOB_HEARTBEAT = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+
+
+class JobRunner:
+    """Úlohy na pozadí bez externího brokeru.
+
+    Stav úloh drží volající v databázi; runner jen pouští execute(job_id)
+    ve vláknech. Najednou běží nejvýš `workers` úloh a z každého druhu nejvýš
+    limits[druh] (výchozí 1), další úlohy téhož druhu čekají ve frontě a
+    nezabírají vlákno. Těžké importy a exporty tak nevytlačí skenování.
+    Limity platí pro jeden proces (gunicorn worker).
+
+    heartbeat(job_ids) se volá každých `interval` sekund s úlohami, které
+    runner drží; úloha bez heartbeatu patřila workeru, který skončil.
+    """
+
+    def __init__(self, execute, workers=JOB_WORKERS, limits=None, heartbeat=None, interval=JOB_HEARTBEAT):
+        self.execute = execute
+        self.workers = workers
+        self.limits = JOB_LIMITS if limits is None else limits
+        self.heartbeat = heartbeat
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.running = Counter()
+        self.waiting = defaultdict(deque)
+        self.jobs = set()
+        self.executor = None
+
+    def submit(self, job_id, kind):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+                if self.heartbeat is not None:
+                    threading.Thread(target=self._beat, name="job-heartbeat", daemon=True).start()
+            self.jobs.add(job_id)
+            if self.running[kind] >= self.limits.get(kind, 1):
+                self.waiting[kind].append(job_id)
+                return
+            self.running[kind] += 1
+            self.executor.submit(self._run, job_id, kind)
+
+    def wait(self, timeout=None):
+        """Počká, až doběhnou všechny úlohy (testy, benchmarky)."""
+        with self.lock:
+            return self.idle.wait_for(lambda: not +self.running, timeout)
+
+    def _beat(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                job_ids = list(self.jobs)
+            if not job_ids:
+                continue
+            try:
+                self.heartbeat(job_ids)
+            except Exception as e:
+                print(f"Heartbeat úloh se nepodařilo zapsat: {e}")
+
+    def _run(self, job_id, kind):
+        try:
+            self.execute(job_id)
+        except Exception as e:
+            print(f"Chyba úlohy {job_id}: {e}")
+        finally:
+            with self.lock:
+                self.jobs.discard(job_id)
+                if self.waiting[kind]:
+                    # Místo uvolněné touto úlohou dostane další úloha stejného druhu
+                    self.executor.submit(self._run, self.waiting[kind].popleft(), kind)
+                else:
+                    self.running[kind] -= 1
+                    if not +self.running:
+                        self.idle.notify_all()
@@ -0,0 +1,91 @@
+import json
+import queue
+import select
+import threading
+import time
+
+# Jak často vlákno hubu kontroluje nové události, když nepřijde NOTIFY
+POLL_INTERVAL = 1.0
+# Jak často se mažou staré události z tabulky
+PRUNE_INTERVAL = 600
+# Fronta pomalého klienta se při zaplnění zahodí, klient se znovu připojí
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Souběžné transakce mohou commitnout ID mimo pořadí, proto se posledních
+# REORDER_WINDOW ID čte znovu a už odeslané události se přeskočí
+REORDER_WINDOW = 100
+
+
+def format_sse(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class EventHub:
+    """Rozesílá události závodů otevřeným SSE spojením jednoho workeru.
+
+    Události se zapisují do databáze ve stejné transakci jako změna, takže
+    je vidí všechny gunicorn workery. Každý worker má jedno vlákno, které
+    čte nové řádky (fetch_since) a předává je odběratelům daného závodu.
+    Na Postgresu vlákno čeká na NOTIFY (listen_connection), jinak se dotazuje
+    každých POLL_INTERVAL sekund.
+    """
+
+    def __init__(self, fetch_since, latest_id, prune=None, listen_connection=None):
+        self.fetch_since = fetch_since
+        self.latest_id = latest_id
+        self.prune = prune
+        self.listen_connection = listen_connection
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def subscribe(self, race_id):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.setdefault(race_id, set()).add(subscriber)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="race-events", daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, race_id, subscriber):
+        with self.lock:
+            self.subscribers.get(race_id, set()).discard(subscriber)
+
+    def dispatch(self, events):
+        for event_id, race_id, kind, data in events:
+            with self.lock:
+                subscribers = list(self.subscribers.get(race_id, ()))
+            for subscriber in subscribers:
+                try:
+                    subscriber.put_nowait((event_id, kind, data))
+                except queue.Full:
+                    self.unsubscribe(race_id, subscriber)
+
+    def _wait(self, connection):
+        if connection is None:
+            time.sleep(POLL_INTERVAL)
+            return
+        if select.select([connection], [], [], POLL_INTERVAL) != ([], [], []):
+            connection.poll()
+            connection.notifies.clear()
+
+    def _run(self):
+        last_id = self.latest_id()
+        seen = {e[0] for e in self.fetch_since(max(0, last_id - REORDER_WINDOW))}
+        last_prune = time.monotonic()
+        connection = self.listen_connection() if self.listen_connection else None
+        while True:
+            try:
+                self._wait(connection)
+                events = [e for e in self.fetch_since(max(0, last_id - REORDER_WINDOW)) if e[0] not in seen]
+                if events:
+                    last_id = max(last_id, events[-1][0])
+                    seen.update(e[0] for e in events)
+                    seen = {event_id for event_id in seen if event_id > last_id - REORDER_WINDOW}
+                    self.dispatch(events)
+                if self.prune and time.monotonic() - last_prune > PRUNE_INTERVAL:
+                    self.prune()
+                    last_prune = time.monotonic()
+            except Exception as e:
+                print(f"Chyba při čtení událostí závodu: {e}")
+                time.sleep(POLL_INTERVAL)
@@ -0,0 +1,189 @@
+import bisect
+import os
+import threading
+import time
+
+# Hranice histogramů v sekundách a v počtech dotazů
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Počet SQL dotazů na požadavek, nad kterým se zapíše varování (N+1)
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "50"))
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            counts, total = self.values.get(labels, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[labels] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.label_names + ("le",)
+        with self.lock:
+            for labels, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metriky jednoho procesu ve formátu pro Prometheus.
+
+    Každý gunicorn worker má vlastní hodnoty; Prometheus je sčítá podle
+    instance, stejně jako u ostatních metrik procesu.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, read):
+        # Hodnota se čte až při exportu (např. stav poolu spojení)
+        self.collectors.append((name, help, read))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for name, help, read in self.collectors:
+            value = read()
+            if value is not None:
+                lines.extend([f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    "revival_request_seconds", "Doba zpracování požadavku (u streamu do první odpovědi)", ("endpoint", "method"))
+REQUESTS = registry.counter("revival_requests_total", "Počet požadavků", ("endpoint", "method", "status"))
+REQUEST_QUERIES = registry.histogram(
+    "revival_request_queries", "Počet SQL dotazů na požadavek", ("endpoint",), QUERY_BUCKETS)
+QUERY_SECONDS = registry.counter("revival_query_seconds_total", "Čas strávený v SQL dotazech", ("endpoint",))
+QUERY_BUDGET_EXCEEDED = registry.counter(
+    "revival_query_budget_exceeded_total", "Požadavky nad limitem SQL dotazů", ("endpoint",))
+POOL_WAIT_SECONDS = registry.histogram("revival_db_pool_wait_seconds", "Čekání na spojení z poolu")
+QR_RENDER_SECONDS = registry.histogram("revival_qr_render_seconds", "Vykreslení jednoho QR kódu")
+QR_UPLOAD_SECONDS = registry.histogram("revival_qr_upload_seconds", "Nahrání jednoho QR kódu", ("result",))
+
+# Dotazy se připisují požadavku, který běží ve stejném vlákně; dotazy mimo
+# požadavek (vlákna zapisovače a událostí) mají endpoint "background"
+_current = threading.local()
+
+
+def _state():
+    if not hasattr(_current, "endpoint"):
+        _current.endpoint = "background"
+        _current.queries = 0
+        _current.query_time = 0.0
+    return _current
+
+
+def instrument(app, engine):
+    """Napojí měření na požadavky Flasku a na engine SQLAlchemy."""
+    from flask import request
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        state = _state()
+        state.queries += 1
+        state.query_time += elapsed
+        if state.endpoint == "background":
+            QUERY_SECONDS.inc("background", amount=elapsed)
+
+    # Pool nemá událost „začátek čekání“, proto se měří obalem Pool.connect
+    pool = engine.pool
+    pool_connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return pool_connect()
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+    if hasattr(pool, "checkedout"):
+        registry.gauge("revival_db_pool_checked_out", "Půjčená spojení z poolu", pool.checkedout)
+
+    @app.before_request
+    def start_request_timer():
+        state = _state()
+        state.endpoint = request.endpoint or "unknown"
+        state.queries = 0
+        state.query_time = 0.0
+        state.started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        state = _state()
+        if state.endpoint == "background":
+            return response
+        endpoint, method = state.endpoint, request.method
+        REQUEST_SECONDS.observe(time.perf_counter() - state.started, endpoint, method)
+        REQUESTS.inc(endpoint, method, response.status_code)
+        REQUEST_QUERIES.observe(state.queries, endpoint)
+        QUERY_SECONDS.inc(endpoint, amount=state.query_time)
+        if state.queries > QUERY_BUDGET:
+            QUERY_BUDGET_EXCEEDED.inc(endpoint)
+            app.logger.warning(
+                "%s %s: %d SQL dotazů (limit %d) – pravděpodobně N+1",
+                method, request.full_path.rstrip("?"), state.queries, QUERY_BUDGET
+            )
+        state.endpoint = "background"
+        return response
@@ -0,0 +1,128 @@
+import io
+import zipfile
+import zlib
+
+from qr_codes import QR_STYLE, load_font
+
+# Arch A4 při 200 dpi, 3 × 4 štítky
+SHEET_SIZE = (1654, 2339)
+SHEET_GRID = (3, 4)
+SHEET_MARGIN = 60
+LABEL_FONT_SIZE = 30
+PAGE_SIZE_PT = (595.28, 841.89)
+
+
+class _Chunks:
+    # Zápisový „soubor“ bez seek – zipfile pak zapisuje datové deskriptory
+    # a hotové bajty si generátor průběžně odebírá
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def iter_zip(entries):
+    """Streamuje ZIP z (název_souboru, bajty); každý soubor se pošle hned po přidání."""
+    out = _Chunks()
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_STORED) as archive:
+        for filename, data in entries:
+            # PNG je už komprimované, ukládá se bez další komprese
+            archive.writestr(filename, data)
+            yield out.take()
+    yield out.take()
+
+
+def iter_sheets(labels):
+    """Skládá štítky (text, png) do archů A4 a vrací je jako obrázky ve stupních šedi."""
+    from PIL import Image, ImageDraw
+
+    columns, rows = SHEET_GRID
+    cell_width = (SHEET_SIZE[0] - 2 * SHEET_MARGIN) // columns
+    cell_height = (SHEET_SIZE[1] - 2 * SHEET_MARGIN) // rows
+    qr_size = min(cell_width, cell_height - 2 * LABEL_FONT_SIZE) - 20
+    font = load_font(QR_STYLE["font"], LABEL_FONT_SIZE)
+
+    sheet, draw, position = None, None, 0
+    for text, png in labels:
+        if sheet is None:
+            sheet = Image.new("L", SHEET_SIZE, 255)
+            draw = ImageDraw.Draw(sheet)
+        column, row = position % columns, position // columns
+        left = SHEET_MARGIN + column * cell_width
+        top = SHEET_MARGIN + row * cell_height
+        # Tenký rámeček jako vodítko pro stříhání
+        draw.rectangle([left, top, left + cell_width, top + cell_height], outline=200)
+        with Image.open(io.BytesIO(png)) as qr_img:
+            qr_img = qr_img.convert("L").resize((qr_size, qr_size), Image.NEAREST)
+            sheet.paste(qr_img, (left + (cell_width - qr_size) // 2, top + 10))
+        label_width = draw.textlength(text, font=font)
+        draw.text((left + (cell_width - label_width) / 2, top + 20 + qr_size), text, font=font, fill=0)
+
+        position += 1
+        if position == columns * rows:
+            yield sheet
+            sheet, position = None, 0
+    if sheet is not None:
+        yield sheet
+
+
+def iter_pdf(pages):
+    """Streamuje PDF, kde každá stránka je jeden obrázek (PIL, režim L) přes celou plochu A4.
+
+    Objekty stránek se posílají hned; strom stránek, katalog a xref až na konci.
+    """
+    offset = 0
+    offsets = {}
+
+    def emit(obj, body, stream=None):
+        nonlocal offset
+        offsets[obj] = offset
+        data = f"{obj} 0 obj\n".encode() + body
+        if stream is not None:
+            data += b"\nstream\n" + stream + b"\nendstream"
+        data += b"\nendobj\n"
+        offset += len(data)
+        return data
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    offset = len(header)
+    yield header
+
+    # 1 = katalog, 2 = strom stránek, od 3 po třech objektech na stránku
+    kids = []
+    number = 3
+    width_pt, height_pt = PAGE_SIZE_PT
+    for page in pages:
+        image, content, page_obj = number, number + 1, number + 2
+        number += 3
+        pixels = zlib.compress(page.tobytes(), 6)
+        yield emit(image, (
+            f"<< /Type /XObject /Subtype /Image /Width {page.width} /Height {page.height} "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode /Length {len(pixels)} >>"
+        ).encode(), pixels)
+        drawing = f"q {width_pt} 0 0 {height_pt} 0 0 cm /Im0 Do Q".encode()
+        yield emit(content, f"<< /Length {len(drawing)} >>".encode(), drawing)
+        yield emit(page_obj, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt} {height_pt}] "
+            f"/Resources << /XObject << /Im0 {image} 0 R >> >> /Contents {content} 0 R >>"
+        ).encode())
+        kids.append(f"{page_obj} 0 R")
+
+    yield emit(2, f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode())
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    xref = [f"xref\n0 {number}\n".encode(), b"0000000000 65535 f \n"]
+    for n in range(1, number):
+        xref.append(f"{offsets[n]:010d} 00000 n \n".encode())
+    xref.append(f"trailer\n<< /Size {number} /Root 1 0 R >>\nstartxref\n{offset}\n%%EOF\n".encode())
+    yield b"".join(xref)
@@ -0,0 +1,180 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from metrics import QR_RENDER_SECONDS
+
+# Počet procesů pro hromadné vykreslování (stahování všech QR kódů závodu)
+QR_RENDER_PROCESSES = int(os.getenv("QR_RENDER_PROCESSES", "4"))
+# Kolik obrázků se při streamovaném stahování vykresluje dopředu
+QR_STREAM_WINDOW = 2 * max(1, QR_RENDER_PROCESSES)
+
+# Vzhled QR kódu – je součástí klíče cache, změna stylu vynutí nové vykreslení
+QR_STYLE = {"box_size": 10, "border": 4, "box_ratio": 0.25, "font": "DejaVuSans.ttf"}
+
+# LRU cache vykreslených PNG podle obsahového klíče
+QR_RENDER_CACHE_SIZE = int(os.getenv("QR_RENDER_CACHE_SIZE", "512"))
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+
+
+def qr_cache_key(data: str, center_text: str, style=QR_STYLE) -> str:
+    # Obsahový klíč – stejný obsah a styl dává vždy stejný obrázek
+    raw = json.dumps([data, center_text, style], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def load_font(name: str, size: int):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype(name, size=size)
+    except IOError:
+        return ImageFont.load_default()
+
+
+def fit_font(draw, text: str, box_width: int, box_height: int, font_name: str):
+    """Největší písmo, se kterým se text vejde do rámečku (binární vyhledávání)."""
+    def fits(size):
+        text_bbox = draw.textbbox((0, 0), text, font=load_font(font_name, size))
+        return (text_bbox[2] - text_bbox[0] <= box_width
+                and text_bbox[3] - text_bbox[1] <= box_height)
+
+    low, high, best = 1, box_height, None
+    while low <= high:
+        size = (low + high) // 2
+        if fits(size):
+            best = size
+            low = size + 1
+        else:
+            high = size - 1
+    return load_font(font_name, best) if best else None
+
+
+def _render_qr(data: str, center_text: str, style) -> bytes:
+    # Pillow a qrcode se načítají až při prvním vykreslení, worker jen se
+    # skenováním je nepotřebuje
+    import qrcode
+    from PIL import ImageDraw, ImageFont
+
+    # Vytvoření QR kódu
+    qr = qrcode.QRCode(
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=style["box_size"],
+        border=style["border"],
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
+
+    draw = ImageDraw.Draw(qr_img)
+    width, height = qr_img.size
+
+    # Bílý čtverec ve středu – cca 25 % velikosti QR obrázku
+    box_size = int(width * style["box_ratio"])
+    top_left = ((width - box_size) // 2, (height - box_size) // 2)
+    bottom_right = ((width + box_size) // 2, (height + box_size) // 2)
+    draw.rectangle([top_left, bottom_right], fill="white")
+
+    # Dynamické přizpůsobení velikosti písma
+    box_width = bottom_right[0] - top_left[0]
+    box_height = bottom_right[1] - top_left[1]
+    font = fit_font(draw, center_text, box_width, box_height, style["font"])
+
+    if font is None:
+        font = ImageFont.load_default()
+        print("⚠️ Nepodařilo se najít vhodnou velikost písma, použit fallback font.")
+    # Zarovnání textu doprostřed bílého rámečku
+    text_bbox = draw.textbbox((0, 0), center_text, font=font)
+    text_width = text_bbox[2] - text_bbox[0]
+    text_height = text_bbox[3] - text_bbox[1]
+    text_x = top_left[0] + (box_width - text_width) // 2
+    text_y = top_left[1] + (box_height - text_height) // 2
+    draw.text((text_x, text_y), center_text, font=font, fill="black")
+
+    # Výstup jako PNG do paměti
+    buffer = io.BytesIO()
+    qr_img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _cache_get(key):
+    with _render_cache_lock:
+        png = _render_cache.get(key)
+        if png is not None:
+            _render_cache.move_to_end(key)
+        return png
+
+
+def _cache_put(key, png):
+    with _render_cache_lock:
+        _render_cache[key] = png
+        while len(_render_cache) > QR_RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+
+
+def cached_qr_png(data: str, center_text: str, style=QR_STYLE):
+    # Obrázek z paměti procesu, nebo None
+    return _cache_get(qr_cache_key(data, center_text, style))
+
+
+def render_qr_png(data: str, center_text: str, style=QR_STYLE) -> bytes:
+    # Vrací čisté bajty, aby šel výsledek předat mezi procesy
+    key = qr_cache_key(data, center_text, style)
+    png = _cache_get(key)
+    if png is None:
+        png = _render_qr(data, center_text, style)
+        _cache_put(key, png)
+    return png
+
+
+def timed_render_qr_png(data: str, center_text: str):
+    # Pro procesový pool: doba se vrací rodiči, metriky potomka by se ztratily
+    started = time.perf_counter()
+    png = render_qr_png(data, center_text)
+    return png, time.perf_counter() - started
+
+
+def iter_qr_pngs(jobs):
+    """Vykreslí QR kódy paralelně a vrací (klíč, png) ve stejném pořadí jako jobs.
+
+    jobs je iterátor (klíč, data, text_uprostřed). Obrázky z cache se
+    nevykreslují znovu a rozpracovaných je nejvýš QR_STREAM_WINDOW, takže
+    paměť nezávisí na počtu posádek.
+    """
+    def render_here(data, center_text):
+        png, seconds = timed_render_qr_png(data, center_text)
+        QR_RENDER_SECONDS.observe(seconds)
+        return png
+
+    if QR_RENDER_PROCESSES <= 1:
+        for key, data, center_text in jobs:
+            yield key, render_here(data, center_text)
+        return
+
+    def result(key, cache_key, png_or_future):
+        if isinstance(png_or_future, bytes):
+            return key, png_or_future
+        png, seconds = png_or_future.result()
+        QR_RENDER_SECONDS.observe(seconds)
+        _cache_put(cache_key, png)
+        return key, png
+
+    with ProcessPoolExecutor(max_workers=QR_RENDER_PROCESSES) as render_pool:
+        pending = deque()
+        for key, data, center_text in jobs:
+            cache_key = qr_cache_key(data, center_text)
+            png = _cache_get(cache_key)
+            pending.append((key, cache_key, png if png is not None
+                            else render_pool.submit(timed_render_qr_png, data, center_text)))
+            if len(pending) >= QR_STREAM_WINDOW:
+                yield result(*pending.popleft())
+        while pending:
+            yield result(*pending.popleft())
@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+
+class LocalQRStorage:
+    """QR kódy jako soubory <klíč>.png v adresáři na disku (výchozí úložiště)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        # Zápis přes dočasný soubor, souběžný požadavek nikdy nepřečte půlku obrázku
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        return True
+
+
+class SupabaseQRStorage:
+    """QR kódy v bucketu Supabase Storage (veřejné čtení, zápis přes API klíč)."""
+
+    def __init__(self, base_url=None):
+        from supabase_upload import SUPABASE_URL
+
+        self.base_url = base_url or SUPABASE_URL
+
+    def get(self, key):
+        from supabase_upload import BUCKET_NAME, get_session
+
+        try:
+            response = get_session().get(
+                f"{self.base_url}/storage/v1/object/public/{BUCKET_NAME}/{key}.png", timeout=10
+            )
+        except Exception as e:
+            print(f"Chyba při čtení QR kódu ze Supabase: {e}")
+            return None
+        return response.content if response.status_code == 200 else None
+
+    def put(self, key, data):
+        from supabase_upload import upload_qr_bytes_to_supabase
+
+        return upload_qr_bytes_to_supabase(data, f"{key}.png", self.base_url) is not None
+
+
+QR_STORAGE_BACKENDS = {
+    "local": lambda directory: LocalQRStorage(os.getenv("QR_STORAGE_DIR", directory)),
+    "supabase": lambda directory: SupabaseQRStorage(),
+}
+
+
+def qr_storage_from_env(default_directory):
+    # QR_STORAGE=local (výchozí) nebo supabase
+    backend = os.getenv("QR_STORAGE", "local")
+    if backend not in QR_STORAGE_BACKENDS:
+        raise RuntimeError(f"Neznámé úložiště QR kódů QR_STORAGE={backend}")
+    return QR_STORAGE_BACKENDS[backend](default_directory)
@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+
+# Jak dlouho se po prvním podnětu čeká na další, než se přepočet spustí
+RECALC_DELAY = float(os.getenv("RECALC_DELAY_MS", "200")) / 1000
+
+
+class CoalescingRunner:
+    """Přepočet na pozadí, pro každý klíč (závod) nejvýš jeden naráz.
+
+    trigger(key) jen označí klíč k přepočtu. Pokud pro něj zrovna nic
+    neběží, spustí vlákno, které po RECALC_DELAY zavolá run(key). Podněty,
+    které přijdou během čekání nebo běhu, se sloučí do jednoho dalšího běhu,
+    takže deset rychlých změn posádek znamená nanejvýš dva přepočty.
+    """
+
+    def __init__(self, run, delay=RECALC_DELAY):
+        self.run = run
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = set()
+        self.running = set()
+
+    def trigger(self, key):
+        with self.lock:
+            self.pending.add(key)
+            if key in self.running:
+                return
+            self.running.add(key)
+        threading.Thread(target=self._run, args=(key,), name=f"recalc-{key}", daemon=True).start()
+
+    def wait(self, timeout=None):
+        """Počká, až doběhnou všechny naplánované přepočty (testy, příkazy)."""
+        with self.lock:
+            return self.idle.wait_for(lambda: not self.running, timeout)
+
+    def _run(self, key):
+        while True:
+            time.sleep(self.delay)
+            with self.lock:
+                if key not in self.pending:
+                    self.running.discard(key)
+                    self.idle.notify_all()
+                    return
+                self.pending.discard(key)
+            try:
+                self.run(key)
+            except Exception as e:
+                print(f"Chyba při přepočtu {key}: {e}")
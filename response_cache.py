@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+# Limity cache vykreslených odpovědí jednoho workeru
+RESPONSE_CACHE_ENTRIES = 256
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+# Větší odpovědi (např. export velkého závodu) se necachují
+RESPONSE_CACHE_MAX_ITEM = 16 * 1024 * 1024
+
+
+class ResponseCache:
+    """LRU cache těl odpovědí, klíč obsahuje verzi závodu.
+
+    Po změně závodu se mění verze, takže staré položky se jen přestanou
+    používat a časem vypadnou z LRU.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_ENTRIES, max_bytes=RESPONSE_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, mimetype, headers):
+        if len(body) > RESPONSE_CACHE_MAX_ITEM:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self.entries[key] = (body, mimetype, headers)
+            self.size += len(body)
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                _, (evicted, _, _) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
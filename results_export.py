@@ -0,0 +1,102 @@
+import csv
+import io
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+# Po kolika řádcích se zapisuje jedna skupina řádků do Parquetu
+PARQUET_BATCH_ROWS = 1000
+
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def stream_file(file):
+    # Odesílá dočasný soubor po kouscích a nakonec ho zavře (a tím smaže)
+    try:
+        file.seek(0)
+        while True:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
+
+
+def iter_csv(columns, rows):
+    # BOM, aby Excel správně načetl diakritiku
+    yield "\ufeff".encode("utf-8")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    writer.writerow([name for name, _ in columns])
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def write_xlsx(columns, rows, widths, sheet_name="Výsledky"):
+    """Zapíše řádky přes write-only sešit openpyxl, který drží v paměti
+    jen aktuální řádek. Šířky sloupců se musí nastavit před prvním řádkem."""
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    for i, width in enumerate(widths, 1):
+        worksheet.column_dimensions[get_column_letter(i)].width = width
+    worksheet.append([name for name, _ in columns])
+    for row in rows:
+        worksheet.append(row)
+
+    output = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 16)
+    workbook.save(output)
+    return output
+
+
+def unique_names(names):
+    # Stejně pojmenované checkpointy: druhý a další sloupec dostane pořadí v závorce
+    seen = {}
+    unique = []
+    for name in names:
+        seen[name] = seen.get(name, 0) + 1
+        unique.append(name if seen[name] == 1 else f"{name} ({seen[name]})")
+    return unique
+
+
+def write_parquet(columns, rows):
+    """Zapíše řádky po skupinách do Parquetu.
+
+    Dávky se skládají podle pozice sloupce, ne podle názvu – názvy
+    checkpointů se mohou opakovat. V Parquetu se proto opakované názvy
+    rozliší pořadím, aby šly sloupce vybírat podle jména.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"text": pa.string(), "int": pa.int64()}
+    schema = pa.schema([
+        (name, types[kind]) for name, (_, kind) in zip(unique_names([name for name, _ in columns]), columns)
+    ])
+    output = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 16)
+
+    def record_batch(batch):
+        return pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)], schema=schema)
+
+    with pq.ParquetWriter(output, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                writer.write_batch(record_batch(batch))
+                batch = []
+        if batch:
+            writer.write_batch(record_batch(batch))
+    return output
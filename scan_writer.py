@@ -0,0 +1,164 @@
+import fcntl
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+# Dávka se uloží nejpozději FLUSH_INTERVAL po prvním průchodu ve frontě,
+# nebo hned po nasbírání BATCH_SIZE průchodů
+FLUSH_INTERVAL = float(os.getenv("SCAN_FLUSH_INTERVAL_MS", "5")) / 1000
+BATCH_SIZE = int(os.getenv("SCAN_BATCH_SIZE", "200"))
+# Pauza před dalším pokusem, když databáze dávku nepřijme
+RETRY_DELAY = 1.0
+# Po tolika neúspěšných pokusech se dávka ukládá po řádcích a řádky, které
+# ani samy uložit nejdou, se odloží do DEAD_LETTER_FILE v adresáři žurnálu
+STORE_ATTEMPTS = int(os.getenv("SCAN_STORE_ATTEMPTS", "5"))
+DEAD_LETTER_FILE = "dead-letter.jsonl"
+
+
+class ScanWriter:
+    """Zápis průchodů se skupinovým commitem (write-behind).
+
+    submit() zapíše průchody do lokálního žurnálu (append-only JSON řádky,
+    fsync) a zařadí je do fronty; po návratu je průchod trvalý a může se
+    potvrdit skeneru. Vlákno zapisovače ukládá frontu do databáze po
+    dávkách jedním voláním store(rows). Souběžné fsync žurnálu se slučují,
+    jeden fsync pokryje všechny do té doby zapsané řádky.
+
+    Každý worker má vlastní žurnál zamčený přes flock. Žurnál, jehož zámek
+    nikdo nedrží, patří spadlému workeru a při startu se znovu uloží;
+    store() proto musí být idempotentní (řádky nesou client_id).
+
+    Dávka, kterou databáze opakovaně odmítá, nesmí zdržet průchody za ní:
+    po STORE_ATTEMPTS pokusech se uloží po řádcích a řádky, které selžou
+    i samostatně, se zapíší do DEAD_LETTER_FILE a zalogují.
+    """
+
+    def __init__(self, journal_dir, store, logger=None):
+        self.journal_dir = journal_dir
+        self.store = store
+        self.logger = logger or logging.getLogger(__name__)
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.journal = None
+        self.thread = None
+        # Pořadová čísla řádků: zapsané do žurnálu, po fsync, uložené v databázi
+        self.written = 0
+        self.synced = 0
+        self.stored = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            os.makedirs(self.journal_dir, exist_ok=True)
+            orphans = self._claim_orphans()
+            path = os.path.join(self.journal_dir, f"scans-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl")
+            self.journal = open(path, "a", encoding="utf-8")
+            fcntl.flock(self.journal, fcntl.LOCK_EX)
+            self.thread = threading.Thread(target=self._run, args=(orphans,), name="scan-writer", daemon=True)
+            self.thread.start()
+
+    def submit(self, rows):
+        """Trvale zapíše průchody do žurnálu a zařadí je k uložení do databáze."""
+        self.start()
+        with self.lock:
+            for row in rows:
+                self.journal.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self.journal.flush()
+            self.written += len(rows)
+            sequence = self.written
+        self._sync(sequence)
+        for row in rows:
+            self.queue.put(row)
+
+    def pending(self):
+        return self.written - self.stored
+
+    def _sync(self, sequence):
+        with self.sync_lock:
+            if self.synced >= sequence:
+                return
+            with self.lock:
+                target = self.written
+            os.fsync(self.journal.fileno())
+            self.synced = target
+
+    def _claim_orphans(self):
+        orphans = []
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, "scans-*.jsonl"))):
+            handle = open(path, "r", encoding="utf-8")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                continue
+            # Poslední řádek může být po pádu useknutý – takový průchod nebyl potvrzen
+            rows = []
+            for line in handle:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    pass
+            orphans.append((path, handle, rows))
+        return orphans
+
+    def _store(self, rows):
+        for attempt in range(1, STORE_ATTEMPTS + 1):
+            try:
+                self.store(rows)
+                return
+            except Exception as e:
+                self.logger.warning("Dávku %d průchodů se nepodařilo uložit (pokus %d/%d): %s",
+                                    len(rows), attempt, STORE_ATTEMPTS, e)
+                time.sleep(RETRY_DELAY)
+        failed = []
+        for row in rows:
+            try:
+                self.store([row])
+            except Exception as e:
+                self.logger.error("Průchod %s nejde uložit, odkládá se do %s: %s",
+                                  row.get("client_id"), DEAD_LETTER_FILE, e)
+                failed.append(row)
+        if failed:
+            self._dead_letter(failed)
+
+    def _dead_letter(self, rows):
+        # Průchody už byly potvrzené skeneru, proto se neztratí – zůstanou
+        # v souboru k ručnímu dohledání a opětovnému odeslání
+        with open(os.path.join(self.journal_dir, DEAD_LETTER_FILE), "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _run(self, orphans):
+        for path, handle, rows in orphans:
+            for start in range(0, len(rows), BATCH_SIZE):
+                self._store(rows[start:start + BATCH_SIZE])
+            os.remove(path)
+            handle.close()
+
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._store(batch)
+            with self.lock:
+                self.stored += len(batch)
+                # Vše zapsané je v databázi – žurnál může začít znovu od nuly
+                if self.stored == self.written:
+                    self.journal.truncate(0)
@@ -0,0 +1,126 @@
+import math
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+# numpy se načítá až ve funkcích, start aplikace ho nepotřebuje
+
+# Trestné body
+PENALTY_PER_MINUTE = 10
+MAX_CHECKPOINT_PENALTY = 100
+MISSING_SCAN_PENALTY = 100
+
+
+def times_to_seconds(values):
+    # Ideální časy (datetime.time) na sekundy od půlnoci, None -> NaN
+    import numpy as np
+
+    return np.fromiter(
+        (np.nan if t is None else t.hour * 3600 + t.minute * 60 + t.second for t in values),
+        dtype=float, count=len(values)
+    )
+
+
+def timestamps_to_seconds(values, tz="Europe/Prague"):
+    """Časy průchodů na sekundy od půlnoci pražského času.
+
+    Postgres vrací časy se zónou, SQLite bez zóny (uložené jako pražské).
+    Časy se zónou se převedou na epochu a posun zóny se zjistí jen pro
+    každou hodinu UTC (přechody letního času jsou na celé hodině), ne pro
+    každý průchod zvlášť.
+    """
+    import numpy as np
+
+    if not len(values):
+        return np.array([], dtype=float)
+    if getattr(values[0], "tzinfo", None) is None:
+        return np.fromiter(
+            (t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6 for t in values),
+            dtype=float, count=len(values)
+        )
+    epoch = np.fromiter((t.timestamp() for t in values), dtype=float, count=len(values))
+    hours, hour_of = np.unique(epoch // 3600, return_inverse=True)
+    zone = ZoneInfo(tz)
+    offsets = np.array([
+        datetime.fromtimestamp(hour * 3600, zone).utcoffset().total_seconds() for hour in hours.tolist()
+    ])
+    return np.mod(epoch + offsets[hour_of], 86400)
+
+
+def penalty_matrix(ideal, real):
+    """Trestné body z matic sekund (NaN = chybí ideální nebo skutečný čas).
+
+    Za každou celou minutu odchylky PENALTY_PER_MINUTE, nejvýše
+    MAX_CHECKPOINT_PENALTY; chybějící čas dává MISSING_SCAN_PENALTY.
+    """
+    import numpy as np
+
+    with np.errstate(invalid="ignore"):
+        minutes = np.floor(np.abs(np.asarray(real, dtype=float) - np.asarray(ideal, dtype=float)) / 60)
+    penalties = np.minimum(minutes * PENALTY_PER_MINUTE, MAX_CHECKPOINT_PENALTY)
+    return np.where(np.isnan(penalties), MISSING_SCAN_PENALTY, penalties).astype(np.int64)
+
+
+def _fill(matrix, row_of, col_of, crew_ids, checkpoint_ids, seconds):
+    # row_of a col_of mapují id na řádek a sloupec matice, neznámá id -> -1
+    import numpy as np
+
+    rows = np.fromiter((row_of.get(crew_id, -1) for crew_id in crew_ids), dtype=np.intp, count=len(crew_ids))
+    cols = np.fromiter((col_of.get(ck_id, -1) for ck_id in checkpoint_ids), dtype=np.intp, count=len(checkpoint_ids))
+    seconds = np.asarray(seconds, dtype=float)
+    valid = (rows >= 0) & (cols >= 0)
+    cells = rows[valid] * matrix.shape[1] + cols[valid]
+    seconds = seconds[valid]
+    # Při více záznamech na buňku zůstane nejdřívější: seřadíme podle buňky
+    # a času a z každé skupiny vezmeme první
+    order = np.lexsort((seconds, cells))
+    cells, seconds = cells[order], seconds[order]
+    first = np.ones(len(cells), dtype=bool)
+    first[1:] = cells[1:] != cells[:-1]
+    matrix.flat[cells[first]] = seconds[first]
+
+
+class RaceScores:
+    """Matice posádky × checkpointy s ideálními a skutečnými časy a body.
+
+    ideal a real jsou sekundy od půlnoci (NaN = chybí), penalties body za
+    buňku, totals součet bodů včetně bodů za rok výroby.
+    """
+
+    def __init__(self, crew_ids, checkpoint_ids, ideal, real, penalty_year):
+        import numpy as np
+
+        self.crew_ids = list(crew_ids)
+        self.checkpoint_ids = list(checkpoint_ids)
+        self.ideal = ideal
+        self.real = real
+        self.penalties = penalty_matrix(ideal, real)
+        self.checkpoint_totals = self.penalties.sum(axis=1)
+        self.totals = self.checkpoint_totals + np.asarray(penalty_year, dtype=np.int64)
+
+
+def score_race(crew_ids, checkpoint_ids, ideal_cells, scan_cells, penalty_year):
+    """Spočítá body celého závodu v maticových operacích.
+
+    ideal_cells a scan_cells jsou trojice polí (crew_ids, checkpoint_ids,
+    sekundy); více průchodů stejné buňky se sloučí na nejdřívější.
+    """
+    import numpy as np
+
+    row_of = {crew_id: i for i, crew_id in enumerate(crew_ids)}
+    col_of = {ck_id: j for j, ck_id in enumerate(checkpoint_ids)}
+    shape = (len(crew_ids), len(checkpoint_ids))
+
+    ideal = np.full(shape, np.nan)
+    real = np.full(shape, np.nan)
+    _fill(ideal, row_of, col_of, *ideal_cells)
+    _fill(real, row_of, col_of, *scan_cells)
+
+    return RaceScores(crew_ids, checkpoint_ids, ideal, real, penalty_year)
+
+
+def format_seconds(seconds):
+    # Sekundy od půlnoci jako HH:MM, chybějící čas jako "-"
+    if math.isnan(seconds):
+        return "-"
+    seconds = int(seconds)
+    return f"{seconds // 3600 % 24:02d}:{seconds % 3600 // 60:02d}"
@@ -1,33 +1,70 @@
 import requests
 import os
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from urllib.parse import quote  # Pro kódování názvů souborů v URL
 
+from metrics import QR_UPLOAD_SECONDS
+
 SUPABASE_URL = os.getenv("SUPABASE_URL", "https://jclouatxxqsagdhchryc.supabase.co")
 SUPABASE_API_KEY = os.getenv("SUPABASE_API_KEY")
 BUCKET_NAME = "qr"
 
-def upload_qr_to_supabase(file_path, filename):
+UPLOAD_TIMEOUT = float(os.getenv("SUPABASE_UPLOAD_TIMEOUT", "10"))
+UPLOAD_RETRIES = int(os.getenv("SUPABASE_UPLOAD_RETRIES", "3"))
+
+# Každé vlákno má vlastní session – spojení se drží otevřené (keep-alive)
+_local = threading.local()
+
+def get_session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        retry = Retry(
+            total=UPLOAD_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST"],
+        )
+        adapter = HTTPAdapter(max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+    return session
+
+def upload_qr_bytes_to_supabase(data, filename, base_url=None):
+    started = time.perf_counter()
+    public_url = _upload(data, filename, base_url)
+    QR_UPLOAD_SECONDS.observe(time.perf_counter() - started, "ok" if public_url else "error")
+    return public_url
+
+def _upload(data, filename, base_url):
+    base_url = base_url or SUPABASE_URL
     # Zakóduj název souboru pro URL (řeší mezery/diakritiku)
     encoded_filename = quote(filename)
     
-    upload_url = f"{SUPABASE_URL}/storage/v1/object/{BUCKET_NAME}/{encoded_filename}"
+    upload_url = f"{base_url}/storage/v1/object/{BUCKET_NAME}/{encoded_filename}"
     
     headers = {
         "apikey": SUPABASE_API_KEY,
         "Authorization": f"Bearer {SUPABASE_API_KEY}",
-        "Content-Type": "image/png"
+        "Content-Type": "image/png",
+        # Opakovaný pokus po timeoutu nesmí skončit chybou "Duplicate"
+        "x-upsert": "true"
     }
 
     try:
-        with open(file_path, "rb") as f:
-            response = requests.post(  # Použij POST místo PUT
-                upload_url,
-                headers=headers,
-                data=f.read()
-            )
+        response = get_session().post(  # Použij POST místo PUT
+            upload_url,
+            headers=headers,
+            data=data,
+            timeout=UPLOAD_TIMEOUT
+        )
 
         if response.status_code in [200, 201]:
-            return f"{SUPABASE_URL}/storage/v1/object/public/{BUCKET_NAME}/{encoded_filename}"
+            return f"{base_url}/storage/v1/object/public/{BUCKET_NAME}/{encoded_filename}"
         else:
             print(f"Chyba při nahrávání: {response.status_code} - {response.text}")
             return None
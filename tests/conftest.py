@@ -0,0 +1,85 @@
+"""Společné fixtures testů: aplikace nad dočasnou SQLite databází.
+
+    python -m pytest
+"""
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import app as app_module
+
+db = app_module.db
+START = datetime(2025, 7, 5, 8, 0)
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """Vytvoří aplikaci s vlastní databází; po testu počká na vlákna na pozadí."""
+    monkeypatch.setenv("FLASK_SECRET_KEY", "test")
+    monkeypatch.setattr(app_module, "JOB_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(app_module, "SCAN_WRITE_BEHIND", False)
+    apps = []
+
+    def make(name="app", **config):
+        monkeypatch.setenv("SCAN_JOURNAL_DIR", str(tmp_path / name / "journal"))
+        os.makedirs(tmp_path / name, exist_ok=True)
+        flask_app = app_module.create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / name / 'test.db'}",
+            "TESTING": True,
+            **config,
+        })
+        with flask_app.app_context():
+            db.create_all()
+            app_module.upgrade_schema()
+        apps.append(flask_app)
+        return flask_app
+
+    yield make
+    for flask_app in apps:
+        flask_app.extensions["recalculator"].wait(10)
+        flask_app.extensions["job_runner"].wait(10)
+        with flask_app.app_context():
+            db.engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def create_race(crews=3, checkpoints=2, name="Test"):
+    """Závod s posádkami 1..crews a checkpointy CK 1..checkpoints, vrací ID. Volá se v app_context."""
+    race = app_module.Race(name=name, start_time=START, crew_interval=1)
+    db.session.add(race)
+    db.session.flush()
+    db.session.add_all(
+        [app_module.Checkpoint(name=f"CK {i}", order=i, race_id=race.id) for i in range(1, checkpoints + 1)]
+        + [app_module.Crew(number=str(n), name=f"Posádka {n}", start_number=n, race_id=race.id)
+           for n in range(1, crews + 1)]
+    )
+    db.session.flush()
+    app_module.recount_race_counters(race.id)
+    db.session.commit()
+    return race.id
+
+
+@pytest.fixture
+def race(app):
+    """(race_id, [crew_id], [checkpoint_id]) malého závodu."""
+    with app.app_context():
+        race_id = create_race()
+        crew_ids = [c.id for c in app_module.Crew.query.filter_by(race_id=race_id).order_by(app_module.Crew.id)]
+        checkpoint_ids = [c.id for c in app_module.Checkpoint.query.filter_by(race_id=race_id)
+                          .order_by(app_module.Checkpoint.order)]
+    return race_id, crew_ids, checkpoint_ids
@@ -0,0 +1,74 @@
+from conftest import app_module, db
+
+
+def counters(client, checkpoint_id):
+    response = client.get(f"/api/checkpoint/{checkpoint_id}/counters")
+    assert response.status_code == 200
+    return {key: response.get_json()[key] for key in ("total_crews", "active_crews", "passed_count", "remaining")}
+
+
+def assert_matches_recount(app, race_id):
+    # Průběžně udržovaná počitadla musí odpovídat přepočtu z dat
+    with app.app_context():
+        columns = (app_module.Checkpoint.id, app_module.Checkpoint.passed_count,
+                   app_module.Checkpoint.passed_active_count)
+        kept = db.session.query(*columns).filter_by(race_id=race_id).all()
+        race = db.session.query(app_module.Race.crew_count, app_module.Race.active_crew_count)\
+            .filter_by(id=race_id).one()
+        app_module.recount_race_counters(race_id)
+        db.session.flush()
+        assert db.session.query(*columns).filter_by(race_id=race_id).all() == kept
+        assert db.session.query(app_module.Race.crew_count, app_module.Race.active_crew_count)\
+            .filter_by(id=race_id).one() == race
+        db.session.rollback()
+
+
+def test_deactivating_passed_crew(app, client, race):
+    race_id, crews, checkpoints = race
+    client.post(f"/scan/{crews[0]}/{checkpoints[0]}")
+    assert counters(client, checkpoints[0]) == {"total_crews": 3, "active_crews": 3, "passed_count": 1, "remaining": 2}
+
+    client.post(f"/crew/{crews[0]}/toggle_active")
+
+    # Neaktivní posádka už na stanoviště nečeká, její průchod zůstává
+    assert counters(client, checkpoints[0]) == {"total_crews": 3, "active_crews": 2, "passed_count": 1, "remaining": 2}
+    assert_matches_recount(app, race_id)
+
+
+def test_deactivating_waiting_crew(app, client, race):
+    race_id, crews, checkpoints = race
+    client.post(f"/scan/{crews[0]}/{checkpoints[0]}")
+
+    client.post(f"/crew/{crews[1]}/toggle_active")
+
+    assert counters(client, checkpoints[0]) == {"total_crews": 3, "active_crews": 2, "passed_count": 1, "remaining": 1}
+    assert counters(client, checkpoints[1])["remaining"] == 2
+    assert_matches_recount(app, race_id)
+
+
+def test_bulk_deactivate_and_activate(app, client, race):
+    race_id, crews, checkpoints = race
+    client.post(f"/scan/{crews[0]}/{checkpoints[0]}")
+    client.post(f"/scan/{crews[1]}/{checkpoints[0]}")
+
+    response = client.post(f"/race/{race_id}/crews/bulk", json={"action": "deactivate", "crew_ids": crews[:2]})
+    assert response.get_json()["crews"] == 2
+    assert counters(client, checkpoints[0]) == {"total_crews": 3, "active_crews": 1, "passed_count": 2, "remaining": 1}
+    assert_matches_recount(app, race_id)
+
+    # Opakovaná aktivace téže posádky počitadla nezdvojí
+    client.post(f"/race/{race_id}/crews/bulk", json={"action": "activate", "crew_ids": crews})
+    client.post(f"/race/{race_id}/crews/bulk", json={"action": "activate", "crew_ids": crews})
+    assert counters(client, checkpoints[0]) == {"total_crews": 3, "active_crews": 3, "passed_count": 2, "remaining": 1}
+    assert_matches_recount(app, race_id)
+
+
+def test_deleting_inactive_crew(app, client, race):
+    race_id, crews, checkpoints = race
+    client.post(f"/scan/{crews[0]}/{checkpoints[0]}")
+    client.post(f"/crew/{crews[0]}/toggle_active")
+
+    client.post(f"/crew/{crews[0]}/delete")
+
+    assert counters(client, checkpoints[0]) == {"total_crews": 2, "active_crews": 2, "passed_count": 0, "remaining": 2}
+    assert_matches_recount(app, race_id)
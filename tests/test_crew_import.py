@@ -0,0 +1,142 @@
+import io
+
+import sqlalchemy as sa
+
+from conftest import app_module, create_race, db
+from crew_import import iter_crews, iter_csv_rows, iter_html_rows
+
+HEADER = ["Číslo", "Jméno", "Vozidlo", "", "", "Body", "Rok", "Třída"]
+ROWS = [
+    ["1", "Žluťoučký kůň", "Škoda 110", "", "", "5", "1970", "A"],
+    ["2", "Jan Novák", "Tatra 603", "", "", "0", "1962", ""],
+]
+
+
+def html_table(rows):
+    cells = "".join("<tr>" + "".join(f"<td>{cell}</td>" for cell in row) + "</tr>" for row in rows)
+    return f"<html><body><table>{cells}</table><table><tr><td>jiná</td></tr></table></body></html>"
+
+
+def csv_file(rows):
+    return io.BytesIO("\n".join(";".join(row) for row in rows).encode("utf-8"))
+
+
+def import_rows(race_id, rows):
+    return app_module.upsert_crews(race_id, iter_crews(iter_csv_rows(csv_file([HEADER] + rows)), start_row=1))
+
+
+def test_html_without_charset_is_read_as_utf8():
+    rows = list(iter_html_rows(io.BytesIO(html_table(ROWS).encode("utf-8"))))
+
+    assert rows == ROWS
+
+
+def test_html_declared_charset_is_respected():
+    page = html_table(ROWS).replace("<html>", '<html><head><meta charset="windows-1250"></head>')
+
+    assert list(iter_html_rows(io.BytesIO(page.encode("cp1250"))))[0][1] == "Žluťoučký kůň"
+
+
+def test_reimport_only_updates_changed_crews(app):
+    with app.app_context():
+        race_id = create_race(crews=0, checkpoints=1)
+        first = import_rows(race_id, ROWS)
+        db.session.commit()
+        assert len(first["inserted"]) == 2
+
+        assert import_rows(race_id, ROWS) == {"inserted": [], "updated": [], "unchanged": 2}
+
+        renamed = [ROWS[0], ["2", "Jan Novák", "Tatra 613", "", "", "0", "1962", ""], ["3", "Nová", "", "", "", "", "", ""]]
+        report = import_rows(race_id, renamed)
+        db.session.commit()
+        assert len(report["inserted"]) == 1 and report["unchanged"] == 1
+        assert report["updated"] == [first["inserted"][1]]
+        assert db.session.get(app_module.Crew, first["inserted"][1]).vehicle == "Tatra 613"
+        assert app_module.Crew.query.filter_by(race_id=race_id).count() == 3
+
+
+def test_empty_cell_matches_null_column(app):
+    with app.app_context():
+        race_id = create_race(crews=0, checkpoints=1)
+        db.session.add(app_module.Crew(number="2", name="Jan Novák", vehicle="Tatra 603", penalty_year="0",
+                                       vehicle_year="1962", category=None, race_id=race_id))
+        db.session.commit()
+
+        assert import_rows(race_id, ROWS[1:]) == {"inserted": [], "updated": [], "unchanged": 1}
+
+
+def test_uploaded_file_is_imported_in_background(app, client):
+    with app.app_context():
+        race_id = create_race(crews=0, checkpoints=2)
+
+    def upload(name, data):
+        response = client.post(f"/race/{race_id}/import_crews", data={"source_file": (io.BytesIO(data), name)},
+                               headers={"Accept": "application/json"})
+        assert response.status_code == 202
+        app.extensions["job_runner"].wait(10)
+        return client.get(response.headers["Location"], headers={"Accept": "application/json"}).get_json()
+
+    job = upload("prihlasky.html", html_table([HEADER] + ROWS).encode("utf-8"))
+    assert job["status"] == "done", job["message"]
+    assert job["message"] == "Importováno: 2 nových, 0 změněných, 0 beze změny."
+
+    job = upload("prihlasky.csv", csv_file([HEADER] + ROWS).getvalue())
+    assert job["message"] == "Importováno: 0 nových, 0 změněných, 2 beze změny."
+
+    with app.app_context():
+        names = {crew.number: crew.name for crew in app_module.Crew.query.filter_by(race_id=race_id)}
+        assert names == {"1": "Žluťoučký kůň", "2": "Jan Novák"}
+        assert app_module.checkpoint_counters(
+            app_module.Checkpoint.query.filter_by(race_id=race_id).first().id
+        )["total_crews"] == 2
+
+
+def test_crew_added_during_import_is_not_duplicated(app):
+    with app.app_context():
+        race_id = create_race(crews=0, checkpoints=1)
+
+        def rows():
+            # Souběžný formulář založí posádku 2 až po načtení existujících čísel
+            db.session.add(app_module.Crew(number="2", name="Jan Novák", race_id=race_id))
+            db.session.flush()
+            yield from iter_crews(iter_csv_rows(csv_file([HEADER] + ROWS)), start_row=1)
+
+        report = app_module.upsert_crews(race_id, rows())
+        db.session.commit()
+
+        assert len(report["inserted"]) == 1 and len(report["updated"]) == 1
+        assert app_module.Crew.query.filter_by(race_id=race_id, number="2").one().vehicle == "Tatra 603"
+
+
+def test_upgrade_renumbers_duplicate_crews(app):
+    with app.app_context():
+        race_id = create_race(crews=2, checkpoints=1)
+        db.session.execute(sa.text("DROP INDEX ix_crew_race_number"))
+        db.session.add_all([app_module.Crew(number="1", name="Kopie", race_id=race_id),
+                            app_module.Crew(number="1", name="Kopie 2", race_id=race_id)])
+        db.session.commit()
+
+        app_module.upgrade_schema()
+
+        numbers = sorted(n for (n,) in db.session.query(app_module.Crew.number).filter_by(race_id=race_id))
+        assert numbers == ["1", "1-1", "1-2", "2"]
+        assert import_rows(race_id, ROWS[:1])["updated"] == [
+            app_module.Crew.query.filter_by(race_id=race_id, number="1").one().id
+        ]
+
+
+def test_crew_number_stays_unique_in_race(app, client, race):
+    race_id, crews, _ = race
+
+    response = client.post(f"/race/{race_id}/crews/create", data={"name": "Nová", "vehicle": "", "number": "2"})
+    assert response.status_code == 302
+    # Výměna čísel dvou posádek projde, duplicitní číslo ne
+    swap = client.post(f"/race/{race_id}/crews/bulk", json={
+        "action": "renumber", "crew_ids": crews[:2], "numbers": {crews[0]: "2", crews[1]: "1"}})
+    assert swap.status_code == 200
+    edit = client.post(f"/crew/{crews[2]}/edit", data={"name": "Posádka 3", "number": "1", "vehicle": ""})
+    assert "už v závodě je" in edit.get_data(as_text=True)
+
+    with app.app_context():
+        numbers = dict(db.session.query(app_module.Crew.id, app_module.Crew.number).filter_by(race_id=race_id))
+    assert numbers == {crews[0]: "2", crews[1]: "1", crews[2]: "3"}
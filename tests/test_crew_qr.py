@@ -0,0 +1,17 @@
+from conftest import app_module, db
+
+
+def test_only_current_version_is_cached_forever(app, client, race):
+    _, crews, _ = race
+    with app.app_context():
+        crew = db.session.get(app_module.Crew, crews[0])
+        version = app_module.crew_qr_key(crew)[:app_module.QR_VERSION_LENGTH]
+
+    def cache_control(query):
+        response = client.get(f"/crew/{crews[0]}/qr.png{query}")
+        assert response.status_code == 200
+        return response.headers["Cache-Control"]
+
+    assert "immutable" in cache_control(f"?v={version}")
+    for query in ("", f"?v={version[:1]}", f"?v={version[:8]}", "?v=0"):
+        assert cache_control(query) == "public, max-age=300"
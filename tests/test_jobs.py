@@ -0,0 +1,33 @@
+import threading
+import time
+from datetime import timedelta
+
+from conftest import app_module, create_race, db
+from jobs import JobRunner
+
+
+def test_runner_heartbeats_running_and_queued_jobs():
+    beats, release = [], threading.Event()
+    runner = JobRunner(lambda job_id: release.wait(5), limits={"export": 1}, heartbeat=beats.append, interval=0.05)
+    runner.submit("a", "export")
+    runner.submit("b", "export")
+    time.sleep(0.2)
+    release.set()
+    runner.wait(5)
+
+    assert sorted(beats[0]) == ["a", "b"]
+
+
+def test_job_of_dead_worker_does_not_block_dedupe(app):
+    with app.app_context():
+        race_id = create_race()
+        job = app_module.Job(id="orphan", kind="export", race_id=race_id, status="running",
+                             params='{"format": "csv"}', updated_at=app_module.get_czech_time()
+                             - app_module.JOB_STALE - timedelta(seconds=1))
+        db.session.add(job)
+        db.session.commit()
+
+        with app.test_request_context():
+            fresh = app_module.start_job("export", race_id, {"format": "csv"}, dedupe=True)
+
+        assert fresh.id != "orphan"
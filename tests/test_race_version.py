@@ -0,0 +1,38 @@
+from conftest import app_module, db
+
+
+def versions(app, race_id):
+    with app.app_context():
+        return db.session.query(app_module.Race.version, app_module.Race.roster_version)\
+            .filter_by(id=race_id).one()
+
+
+def test_scan_changes_race_version_but_not_roster(app, client, race):
+    race_id, crews, checkpoints = race
+    version, roster = versions(app, race_id)
+
+    client.post(f"/scan/{crews[0]}/{checkpoints[0]}")
+
+    new_version, new_roster = versions(app, race_id)
+    assert new_version != version and new_roster == roster
+
+
+def test_crew_change_changes_roster_version(app, client, race):
+    race_id, crews, _ = race
+    version, roster = versions(app, race_id)
+
+    client.post(f"/crew/{crews[0]}/toggle_active")
+
+    new_version, new_roster = versions(app, race_id)
+    assert new_version != version and new_roster != roster
+
+
+def test_rolled_back_events_keep_version(app, race):
+    race_id, _, _ = race
+    before = versions(app, race_id)
+    with app.app_context():
+        app_module.publish_event(race_id, "crew", {"action": "updated"})
+        db.session.rollback()
+        db.session.commit()
+
+    assert versions(app, race_id) == before
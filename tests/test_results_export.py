@@ -0,0 +1,18 @@
+import io
+
+import pytest
+
+from results_export import write_parquet
+
+
+def test_parquet_keeps_checkpoints_with_same_name():
+    pq = pytest.importorskip("pyarrow.parquet")
+    columns = [("Číslo", "text"), ("Cíl - Body", "int"), ("Cíl - Body", "int"), ("Celkem body", "int")]
+    rows = [["1", 10, 20, 30], ["2", 0, 100, 100]]
+
+    output = write_parquet(columns, rows)
+    output.seek(0)
+    table = pq.read_table(io.BytesIO(output.read()))
+
+    assert table.column_names == ["Číslo", "Cíl - Body", "Cíl - Body (2)", "Celkem body"]
+    assert [list(row.values()) for row in table.to_pylist()] == rows
@@ -0,0 +1,60 @@
+import uuid
+from datetime import timedelta
+
+from conftest import START, app_module, db
+
+
+def scan(crew_id, checkpoint_id, seconds=0, client_id=None):
+    return {
+        "id": client_id or str(uuid.uuid4()),
+        "crew_id": crew_id,
+        "checkpoint_id": checkpoint_id,
+        "timestamp": (START + timedelta(seconds=seconds)).isoformat(),
+    }
+
+
+def statuses(response):
+    return [result["status"] for result in response.get_json()["results"]]
+
+
+def test_resent_batch_is_stored_once(app, client, race):
+    _, crews, checkpoints = race
+    batch = [scan(crew_id, checkpoints[0], n * 60) for n, crew_id in enumerate(crews)]
+
+    assert statuses(client.post("/scan/batch", json={"scans": batch})) == ["ok"] * len(crews)
+    # Ztracená odpověď: skener pošle stejnou dávku znovu
+    assert statuses(client.post("/scan/batch", json={"scans": batch})) == ["duplicate"] * len(crews)
+
+    with app.app_context():
+        assert app_module.ScanRecord.query.count() == len(crews)
+        assert app_module.Passage.query.count() == len(crews)
+        assert app_module.checkpoint_counters(checkpoints[0])["passed_count"] == len(crews)
+
+
+def test_partly_resent_batch_stores_only_new_scans(app, client, race):
+    _, crews, checkpoints = race
+    first = scan(crews[0], checkpoints[0])
+    client.post("/scan/batch", json={"scans": [first]})
+
+    response = client.post("/scan/batch", json={"scans": [first, scan(crews[1], checkpoints[0])]})
+
+    assert statuses(response) == ["duplicate", "ok"]
+    with app.app_context():
+        assert app_module.ScanRecord.query.count() == 2
+
+
+def test_invalid_scans_are_rejected_without_failing_batch(app, client, race):
+    _, crews, checkpoints = race
+    response = client.post("/scan/batch", json={"scans": [
+        scan(crews[0], checkpoints[0]),
+        scan(9999, checkpoints[0]),
+        "nesmysl",
+    ]})
+
+    assert statuses(response) == ["ok", "error", "error"]
+    with app.app_context():
+        assert db.session.query(app_module.ScanRecord.client_id).count() == 1
+
+
+def test_batch_without_scans_is_bad_request(client):
+    assert client.post("/scan/batch", json={}).status_code == 400
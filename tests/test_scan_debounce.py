@@ -0,0 +1,102 @@
+import json
+import uuid
+from datetime import timedelta
+
+import pytest
+
+from conftest import START, app_module
+
+
+@pytest.fixture(autouse=True)
+def debounce(monkeypatch):
+    monkeypatch.setattr(app_module, "SCAN_DEBOUNCE", timedelta(seconds=10))
+
+
+def post_scan(client, crew_id, checkpoint_id, seconds):
+    response = client.post("/scan/batch", json={"scans": [{
+        "id": str(uuid.uuid4()), "crew_id": crew_id, "checkpoint_id": checkpoint_id,
+        "timestamp": (START + timedelta(seconds=seconds)).isoformat(),
+    }]})
+    return response.get_json()["results"][0]
+
+
+def scan_events(app):
+    with app.app_context():
+        return [json.loads(e.payload) for e in app_module.RaceEvent.query.filter_by(kind="scan")
+                .order_by(app_module.RaceEvent.id)]
+
+
+def passage(app, crew_id, checkpoint_id):
+    with app.app_context():
+        p = app_module.Passage.query.filter_by(crew_id=crew_id, checkpoint_id=checkpoint_id).one()
+        return p.timestamp, p.last_seen
+
+
+def test_repeated_scan_within_debounce_is_dropped(app, client, race):
+    _, crews, checkpoints = race
+    assert post_scan(client, crews[0], checkpoints[0], 0)["status"] == "ok"
+
+    result = post_scan(client, crews[0], checkpoints[0], 5)
+
+    assert result["status"] == "duplicate"
+    assert result["message"] == "Opakovaný sken – průchod už je zaznamenán"
+    with app.app_context():
+        assert app_module.ScanRecord.query.count() == 1
+    assert len(scan_events(app)) == 1
+
+
+def test_later_scan_keeps_first_passage(app, client, race):
+    _, crews, checkpoints = race
+    post_scan(client, crews[0], checkpoints[0], 0)
+
+    assert post_scan(client, crews[0], checkpoints[0], 60)["status"] == "ok"
+    # Sken těsně po posledním (ne prvním) průchodu je stále opakovaný
+    assert post_scan(client, crews[0], checkpoints[0], 65)["status"] == "duplicate"
+
+    assert passage(app, crews[0], checkpoints[0]) == (START, START + timedelta(seconds=60))
+    assert [(e["first"], e["moved"]) for e in scan_events(app)] == [(True, False), (False, False)]
+    with app.app_context():
+        assert app_module.checkpoint_counters(checkpoints[0])["passed_count"] == 1
+
+
+def test_earlier_scan_moves_passage_without_first_event(app, client, race):
+    _, crews, checkpoints = race
+    post_scan(client, crews[0], checkpoints[0], 0)
+
+    # Dřívější sken z offline fronty posune čas buňky, nejde o nový průchod
+    assert post_scan(client, crews[0], checkpoints[0], -60)["status"] == "ok"
+
+    assert passage(app, crews[0], checkpoints[0]) == (START - timedelta(seconds=60), START)
+    events = scan_events(app)
+    assert [(e["first"], e["moved"]) for e in events] == [(True, False), (False, True)]
+    assert events[1]["time"].startswith("2025-07-05T07:59:00")
+    with app.app_context():
+        assert app_module.checkpoint_counters(checkpoints[0])["passed_count"] == 1
+
+
+def test_corrected_passage_is_not_moved(app, client, race):
+    _, crews, checkpoints = race
+    post_scan(client, crews[0], checkpoints[0], 0)
+    client.post(f"/passage/{crews[0]}/{checkpoints[0]}", json={"timestamp": "2025-07-05T08:30:00"})
+
+    post_scan(client, crews[0], checkpoints[0], -600)
+
+    assert passage(app, crews[0], checkpoints[0])[0].strftime("%H:%M") == "08:30"
+    assert not scan_events(app)[-1]["moved"]
+
+
+def test_one_first_event_per_cell_in_batch(app, client, race):
+    _, crews, checkpoints = race
+    scans = [{
+        "id": str(uuid.uuid4()), "crew_id": crew_id, "checkpoint_id": checkpoints[0],
+        "timestamp": (START + timedelta(seconds=seconds)).isoformat(),
+    } for crew_id in crews[:2] for seconds in (0, 3, 120)]
+
+    results = client.post("/scan/batch", json={"scans": scans}).get_json()["results"]
+
+    assert [r["status"] for r in results] == ["ok", "duplicate", "ok"] * 2
+    events = scan_events(app)
+    assert sorted(e["crew_id"] for e in events if e["first"]) == crews[:2]
+    with app.app_context():
+        assert app_module.Passage.query.count() == 2
+        assert app_module.checkpoint_counters(checkpoints[0])["passed_count"] == 2
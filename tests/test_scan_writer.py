@@ -0,0 +1,49 @@
+import json
+import time
+
+import scan_writer
+from scan_writer import DEAD_LETTER_FILE, ScanWriter
+
+
+def wait_until_stored(writer):
+    deadline = time.monotonic() + 10
+    while writer.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not writer.pending()
+
+
+def test_failing_row_does_not_stall_ingest(tmp_path, monkeypatch):
+    monkeypatch.setattr(scan_writer, "RETRY_DELAY", 0)
+    stored = []
+
+    def store(rows):
+        if any(row["client_id"] == "vadny" for row in rows):
+            raise ValueError("vadný průchod")
+        stored.extend(row["client_id"] for row in rows)
+
+    writer = ScanWriter(str(tmp_path), store)
+    writer.submit([{"client_id": "a"}, {"client_id": "vadny"}, {"client_id": "b"}])
+    wait_until_stored(writer)
+    writer.submit([{"client_id": "c"}])
+    wait_until_stored(writer)
+
+    assert stored == ["a", "b", "c"]
+    with open(tmp_path / DEAD_LETTER_FILE, encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == [{"client_id": "vadny"}]
+
+
+def test_transient_failure_is_retried_as_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(scan_writer, "RETRY_DELAY", 0)
+    calls = []
+
+    def store(rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise ConnectionError("databáze je nedostupná")
+
+    writer = ScanWriter(str(tmp_path), store)
+    writer.submit([{"client_id": "a"}, {"client_id": "b"}])
+    wait_until_stored(writer)
+
+    assert calls == [2, 2]
+    assert not (tmp_path / DEAD_LETTER_FILE).exists()